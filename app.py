@@ -1,20 +1,10 @@
 import streamlit as st
 import extra_streamlit_components as stx
 import os
-from streamlit_extras.stylable_container import stylable_container
-from langchain.callbacks import get_openai_callback
-from streamlit_chat import message
 import dotenv
 import openai
-from frontend_generator import FrontendGenerator
-import pandas as pd
-
-try:
-    __import__('pysqlite3')
-    import sys
-    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-except:
-    pass
+from frontend_generator import FrontendGenerator, DiagnosticsFrontEndGenerator
+from genai.metrics import MetricsRegistry, ENDERECO_PADRAO
 
 def show():
     st.title('Transcribe And Chat')
@@ -23,6 +13,12 @@ def show():
 
     dotenv.load_dotenv()
 
+    # Prometheus endpoint (/metrics and /metrics.json), started once per process.
+    # Bound to localhost unless METRICS_HOST says otherwise (e.g. 0.0.0.0 in a container)
+    if os.getenv("METRICS_PORT"):
+        MetricsRegistry.padrao().servir(int(os.getenv("METRICS_PORT")),
+                                        os.getenv("METRICS_HOST") or ENDERECO_PADRAO)
+
     cookie_manager = stx.CookieManager()
 
     key = os.getenv("OPENAI_API_KEY")
@@ -63,4 +59,7 @@ def show():
         generator = FrontendGenerator.create(uploaded_file, linked_url)
         generator.generate()
 
+    if st.sidebar.checkbox("Diagnostics"):
+        DiagnosticsFrontEndGenerator().generate()
+
 show()
\ No newline at end of file
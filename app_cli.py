@@ -1,14 +1,38 @@
-from genai.transcription import Transcription
-from genai.chat_with_embeddings import ChatWithEmbeddings
+from genai.batch import BatchProcessor, caminho_transcricao
+from genai.metrics import MetricsRegistry
+import argparse
 import os
 import sys
-from langchain.callbacks import get_openai_callback
+
+def main_batch(args):
+    parser = argparse.ArgumentParser(prog="python app_cli.py batch",
+                                     description="Transcreve áudios e indexa documentos de diretórios ou globs")
+    parser.add_argument("entradas", nargs="+", help="arquivos, diretórios ou globs (ex.: 'gravacoes/**/*.mp3')")
+    parser.add_argument("--workers", type=int, default=4, help="arquivos processados em paralelo")
+    parser.add_argument("--modo", default="openai", help="modo de transcrição (openai, google ou vosk)")
+    parser.add_argument("--manifesto", default="batch_resultados.jsonl",
+                        help="arquivo JSONL com o resultado e o tempo de cada arquivo (usado para retomar)")
+    parser.add_argument("--metricas", default=None,
+                        help="arquivo JSON onde salvar as métricas (tempo por etapa, bytes, tokens, custo)")
+    opcoes = parser.parse_args(args)
+
+    resumo = BatchProcessor(opcoes.manifesto, opcoes.workers, opcoes.modo).executar(opcoes.entradas)
+    print("--- Resumo ---")
+    print(resumo)
+    if opcoes.metricas:
+        MetricsRegistry.padrao().salvar_json(opcoes.metricas)
+        print(f"Métricas salvas em: {opcoes.metricas}")
 
 def main(args):
+    if len(args) >= 2 and args[1] == "batch":
+        main_batch(args[2:])
+        return
+
     # o argumento deve ser um arquivo.mp3 ou arquivo.wav
     if len(args) != 2:
         # imprime a mensagem de uso permitindo mp3 ou wav
         print("Uso: python app.py <arquivo_entrada>")
+        print("     python app.py batch <diretorios_ou_globs...> [--workers N] [--modo openai] [--manifesto arquivo.jsonl] [--metricas metricas.json]")
         return
 
     nome_arquivo = args[1]
@@ -20,6 +44,9 @@ def main(args):
     extension_lowercase = nome_arquivo.split(".")[-1].lower()
 
     if extension_lowercase.endswith("mp3") or extension_lowercase.endswith("wav"):
+        # importados só no ramo que os usa: o uso e o modo batch não carregam langchain
+        from genai.transcription import Transcription
+
         t = Transcription(nome_arquivo)
         transcricao = t.obter_transcricao_audio()
         # escreve o resultado no caminho
@@ -27,34 +54,52 @@ def main(args):
         # e com extensão .txt
         # exemplo: arquivo.mp3 -> arquivo_transcricao.txt
         # exemplo: arquivo.wav -> arquivo_transcricao.txt
-        nome_arquivo_split = nome_arquivo.split(".")
-        nome_arquivo_split[-2] += "_transcricao"
-        nome_arquivo_split[-1] = "txt"
-        arquivo_transcricao = ".".join(nome_arquivo_split)
+        arquivo_transcricao = caminho_transcricao(nome_arquivo)
         with open(arquivo_transcricao, "w") as f:
             f.write(transcricao)
 
-        print(f"A transcrição foi salva em: {arquivo_transcricao}")
+        # legendas com os tempos de cada segmento: arquivo_transcricao.srt
+        arquivo_legendas = arquivo_transcricao[:-len("txt")] + "srt"
+        with open(arquivo_legendas, "w") as f:
+            f.write(t.exportar("srt"))
+
+        print(f"A transcrição foi salva em: {arquivo_transcricao} (legendas em {arquivo_legendas})")
     elif extension_lowercase.endswith("txt") or extension_lowercase.endswith("xlsx") or extension_lowercase.endswith("csv"):
+        from genai.chat_with_embeddings import ChatWithEmbeddings
+        from genai.keyword_index import interpretar_filtros
+        from langchain.callbacks import get_openai_callback
+
         with get_openai_callback() as cb:
-            if extension_lowercase.endswith("txt"):
-                loader = ChatWithEmbeddings.create_text_loader(nome_arquivo)
-            elif extension_lowercase.endswith("csv"):
-                loader = ChatWithEmbeddings.create_csv_loader(nome_arquivo)
-            else: # extension_lowercase.endswith("xlsx"):
-                loader = ChatWithEmbeddings.create_unstructured_excel_loader(nome_arquivo)
-            
-            c = ChatWithEmbeddings(loader)
+            loader = ChatWithEmbeddings.create_loader(nome_arquivo)
+
+            c = ChatWithEmbeddings(loader, document_id=os.path.abspath(nome_arquivo))
             
+            # "/filtro coluna=valor; ..." restringe as respostas às linhas com esses valores
+            filtros = {}
+
             #pergunta ao usuário a frase
-            frase = input(f"Digite o prompt para interagir com {nome_arquivo}: \n")
+            frase = input(f"Digite o prompt para interagir com {nome_arquivo} ('/filtro coluna=valor' para filtrar): \n")
             print("")
             while frase != "q":
-                resposta = c.chat(frase)
+                if frase.startswith("/filtro"):
+                    try:
+                        filtros = interpretar_filtros(frase[len("/filtro"):])
+                        print(f"Filtros: {filtros or 'nenhum'}")
+                    except Exception as e:
+                        print(e)
+                    frase = input(f"Digite o prompt ou 'q' para sair: \n")
+                    continue
+                for token in c.chat_stream(frase, filters=filtros):
+                    print(token, end="", flush=True)
+                print("")
+                resposta = c.last_result
                 if resposta and resposta["result"]:
-                    print(resposta["result"])
                     print("--- Total Token and Cost Tracking ---")
                     print(cb)
+                    print("--- Latency per stage ---")
+                    for etapa, segundos in resposta["latencies"].items():
+                        if segundos is not None:
+                            print(f"{etapa}: {segundos:0.2f}s")
                     print("---")
                 frase = input(f"Digite o prompt ou 'q' para sair: \n")
 
@@ -0,0 +1,50 @@
+'''
+Compares the previous splitter (RecursiveCharacterTextSplitter, 1000 characters,
+no overlap) with the token-budget splitter on a transcript and on CSV rows:
+chunks produced, tokens per chunk and split throughput. Runs offline.
+
+    python benchmarks/bench_chunking.py --sentences 20000 --rows 100000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain.document_loaders.text import TextLoader
+from benchmarks.fixtures import gerar_transcricao, gerar_csv
+from genai.chat_with_embeddings import ChatWithEmbeddings
+from genai.token_splitter import obter_tokenizer
+
+
+def medir(nome : str, splitter, documentos) -> None:
+    tamanho_mb = sum(len(d.page_content) for d in documentos) / 1e6
+    inicio = time.perf_counter()
+    chunks = splitter.transform_documents(documentos)
+    segundos = time.perf_counter() - inicio
+    tokens = [len(t) for t in obter_tokenizer().encode_ordinary_batch([c.page_content for c in chunks])]
+    print(f"{nome:>28} {len(chunks):>8} {sum(tokens) / len(tokens):>10.0f} {max(tokens):>10} "
+          f"{segundos:>8.2f} {tamanho_mb / segundos:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=20000)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    transcricao = TextLoader(gerar_transcricao("tmp/bench_chunking_transcricao.txt", args.sentences)).load()
+    linhas = ChatWithEmbeddings.create_tabular_loader(gerar_csv("tmp/bench_chunking.csv", args.rows)).load()
+
+    # the tokenizer is loaded once per process; keep it out of the measurements
+    obter_tokenizer()
+
+    print(f"{'splitter':>28} {'chunks':>8} {'avg_tok':>10} {'max_tok':>10} {'secs':>8} {'MB/s':>8}")
+    for rotulo, documentos in (("transcript", transcricao), ("csv rows", linhas)):
+        medir(f"{rotulo} / chars 1000", ChatWithEmbeddings.create_recursive_character_text_splitter(), documentos)
+        medir(f"{rotulo} / token budget", ChatWithEmbeddings.create_token_splitter(), documentos)
+
+
+if __name__ == "__main__":
+    main()
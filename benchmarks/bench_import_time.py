@@ -0,0 +1,77 @@
+'''
+Measures the import time of the entry points with `python -X importtime` and
+fails if a heavy backend (langchain, chromadb, vosk, ...) is loaded at startup
+or if the cumulative time exceeds the budget. Runs offline.
+
+    python benchmarks/bench_import_time.py --max-ms 500
+'''
+import argparse
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+
+RAIZ = os.path.join(os.path.dirname(__file__), "..")
+
+# must only be imported when a request actually needs them
+PROIBIDOS = ["langchain", "chromadb", "vosk", "speech_recognition", "pytube",
+             "youtube_transcript_api", "pydub", "openai", "pandas"]
+
+# "import time: self [us] | cumulative | imported package"
+_LINHA = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def medir(modulo : str) -> dict:
+    '''
+    {"total_ms", "modulos": {nome: ms cumulativos}} da importação de modulo num processo novo
+    '''
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                              cwd=RAIZ, capture_output=True, text=True)
+    if processo.returncode != 0:
+        raise Exception(f"Falha ao importar {modulo}:\n{processo.stderr[-2000:]}")
+    modulos = {}
+    for linha in processo.stderr.splitlines():
+        encontrado = _LINHA.match(linha)
+        if not encontrado:
+            continue
+        if encontrado.group(3) == " " and encontrado.group(4) == "site":
+            # interpreter startup, not part of the entry point
+            modulos.clear()
+            continue
+        modulos[encontrado.group(4)] = int(encontrado.group(2)) / 1000
+    return {"total_ms": modulos.get(modulo, 0.0), "modulos": modulos}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-ms", type=float, default=None, help="budget for the cumulative import time")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    entradas = ["app_cli"]
+    # the Streamlit front end can only be imported where streamlit is installed
+    if importlib.util.find_spec("streamlit") is not None:
+        entradas.append("frontend_generator")
+
+    falhou = False
+    for modulo in entradas:
+        resultado = medir(modulo)
+        print(f"--- {modulo}: {resultado['total_ms']:0.1f}ms ---")
+        mais_lentos = sorted(resultado["modulos"].items(), key=lambda m: m[1], reverse=True)
+        for nome, ms in mais_lentos[:args.top]:
+            print(f"{ms:>10.1f}ms  {nome}")
+
+        carregados = sorted({nome.split(".")[0] for nome in resultado["modulos"]} & set(PROIBIDOS))
+        if carregados:
+            print(f"FAIL: {modulo} loads {', '.join(carregados)} at startup")
+            falhou = True
+        if args.max_ms is not None and resultado["total_ms"] > args.max_ms:
+            print(f"FAIL: {modulo} takes {resultado['total_ms']:0.1f}ms to import (budget {args.max_ms:0.0f}ms)")
+            falhou = True
+
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()
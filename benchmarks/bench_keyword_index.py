@@ -0,0 +1,81 @@
+'''
+Build time, size on disk and query latency of the BM25 keyword index on table-like
+chunks (the rows DataFrameRowsLoader produces), plus the reciprocal rank fusion of
+its results with a second ranked list, as the retriever does. Runs offline.
+
+    python benchmarks/bench_keyword_index.py --chunks 10000 100000 1000000 --queries 200
+'''
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from genai.keyword_index import KeywordIndex
+from genai.retrieval import fundir_rrf
+
+
+def linha(i : int) -> str:
+    return (f"pedido: {i}\ncliente: Cliente {i % 5000}\nproduto: SKU-{i * 7919 % 100000:05d}\n"
+            f"status: {('pago', 'pendente', 'cancelado')[i % 3]}\nvalor: {i % 997 * 1.25:.2f}")
+
+
+def ms(latencias : list) -> str:
+    return f"{statistics.median(latencias):>8.2f} {statistics.quantiles(latencias, n=20)[-1]:>8.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} {'build_s':>8} {'disk_mb':>8} {'reopen_s':>9} {'p50_ms':>8} {'p95_ms':>8} "
+          f"{'filt_p50':>8} {'filt_p95':>8} {'rrf_p50':>8} {'rrf_p95':>8}")
+    for quantidade in args.chunks:
+        diretorio = tempfile.mkdtemp(prefix="bench_palavras_")
+        try:
+            inicio = time.perf_counter()
+            indice = KeywordIndex.construir([linha(i) for i in range(quantidade)],
+                                            [{"source": "bench", "row_start": i, "row_end": i} for i in range(quantidade)])
+            indice.salvar(diretorio)
+            build = time.perf_counter() - inicio
+            disco = sum(os.path.getsize(os.path.join(diretorio, f)) for f in os.listdir(diretorio)) / 1e6
+            del indice
+
+            # reabertura do índice persistido, como numa nova sessão
+            inicio = time.perf_counter()
+            indice = KeywordIndex.carregar(diretorio)
+            reabertura = time.perf_counter() - inicio
+
+            consultas = [f"Qual o valor do pedido {q * 7919 % quantidade} do produto SKU-{q * 31 % 100000:05d}?"
+                         for q in range(args.queries)]
+            simples, filtradas, fundidas = [], [], []
+            for q, consulta in enumerate(consultas):
+                inicio = time.perf_counter()
+                resultado = indice.buscar(consulta, k=args.k)
+                simples.append((time.perf_counter() - inicio) * 1000)
+
+                inicio = time.perf_counter()
+                indice.buscar(consulta, k=args.k, candidatos=indice.filtrar({"cliente": f"Cliente {q % 5000}",
+                                                                              "status": "pago"}))
+                filtradas.append((time.perf_counter() - inicio) * 1000)
+
+                # a segunda lista faz o papel dos resultados da busca vetorial
+                inicio = time.perf_counter()
+                fundir_rrf([[doc for doc, _ in resultado], [doc for doc, _ in reversed(resultado)]])
+                fundidas.append((time.perf_counter() - inicio) * 1000)
+
+            print(f"{quantidade:>8} {build:>8.2f} {disco:>8.1f} {reabertura:>9.3f} {ms(simples)} "
+                  f"{ms(filtradas)} {ms(fundidas)}")
+        finally:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
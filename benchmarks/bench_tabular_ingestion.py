@@ -0,0 +1,53 @@
+'''
+Compares the single-read vectorized CSV ingestion (TabularFileLoader) with the
+previous path (pd.read_csv for the preview + CSVLoader + character splitter).
+
+    python benchmarks/bench_tabular_ingestion.py --rows 1000000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+from benchmarks.fixtures import gerar_csv
+from genai.chat_with_embeddings import ChatWithEmbeddings
+
+
+def medir(nome : str, funcao) -> None:
+    inicio = time.perf_counter()
+    documentos = funcao()
+    wall = time.perf_counter() - inicio
+    print(f"{nome:<12} {wall:>8.2f}s {len(documentos):>10} chunks")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--skip-legacy", action="store_true", help="skip the (slow) CSVLoader path")
+    args = parser.parse_args()
+
+    caminho = f"tmp/bench_{args.rows}.csv"
+    if not os.path.isfile(caminho):
+        gerar_csv(caminho, args.rows)
+
+    splitter = ChatWithEmbeddings.create_recursive_character_text_splitter()
+
+    def legado():
+        pd.read_csv(caminho).head(10)
+        return splitter.transform_documents(ChatWithEmbeddings.create_csv_loader(caminho).load())
+
+    def vetorizado():
+        loader = ChatWithEmbeddings.create_tabular_loader(caminho)
+        loader.preview(10)
+        return splitter.transform_documents(loader.load())
+
+    if not args.skip_legacy:
+        medir("CSVLoader", legado)
+    medir("vectorized", vetorizado)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+'''
+Throughput benchmark of the OpenAI transcription mode against the local fake
+endpoint, for several worker counts and chunk upload formats.
+
+    python benchmarks/bench_transcription.py --minutes 60 --latency 0.5 --formats wav flac opus
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openai
+from benchmarks.fake_openai_server import start_in_background
+from benchmarks.fixtures import gerar_wav
+from genai.transcription import Transcription
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--formats", nargs="+", default=["flac"])
+    parser.add_argument("--fixture", default="tmp/bench_fixture.wav")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.fixture):
+        gerar_wav(args.fixture, args.minutes * 60)
+
+    server = start_in_background(latency=args.latency)
+    openai.api_base = f"http://127.0.0.1:{server.server_port}/v1"
+    openai.api_key = "sk-fake"
+
+    print(f"{'format':>6} {'workers':>8} {'wall_s':>8} {'audio_min/s':>12} {'upload_mb':>10} {'encode_s':>9}")
+    for formato in args.formats:
+        for workers in args.workers:
+            t = Transcription(args.fixture, max_workers=workers, usar_cache=False, formato_upload=formato)
+            inicio = time.perf_counter()
+            t.obter_transcricao_audio()
+            wall = time.perf_counter() - inicio
+            print(f"{formato:>6} {workers:>8} {wall:>8.2f} {args.minutes / wall:>12.2f} "
+                  f"{t.last_bytes_uploaded / 1e6:>10.1f} {t.last_encode_seconds:>9.2f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+'''
+Build time and query latency of the two index backends (in-process NumPy and
+Chroma) for several document sizes, with offline hashing embeddings.
+
+    python benchmarks/bench_vector_store.py --chunks 1000 5000 20000 --queries 200
+'''
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain.schema import Document
+from genai.embedding_cache import HashingFakeEmbeddings
+from genai.vector_index_store import VectorIndexStore, BACKENDS
+
+
+class JaDividido:
+    '''
+    Transformer identidade: os documentos do benchmark já são os chunks
+    '''
+    def transform_documents(self, documentos):
+        return list(documentos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    embedding = HashingFakeEmbeddings()
+    print(f"{'backend':>8} {'chunks':>8} {'build_s':>8} {'reopen_s':>9} {'p50_ms':>8} {'p95_ms':>8}")
+    for quantidade in args.chunks:
+        documentos = [Document(page_content=f"Trecho {i}: pedido {i * 7919 % 100000} do cliente {i % 5000}",
+                               metadata={"source": "bench"}) for i in range(quantidade)]
+        for backend in BACKENDS:
+            diretorio = tempfile.mkdtemp(prefix="bench_indices_")
+            try:
+                store = VectorIndexStore(diretorio)
+                inicio = time.perf_counter()
+                store.obter_ou_criar(documentos, JaDividido(), embedding, "bench", backend=backend, palavras=False)
+                build = time.perf_counter() - inicio
+
+                # reabertura do índice persistido, como numa nova sessão
+                inicio = time.perf_counter()
+                vectordb, _, _ = VectorIndexStore(diretorio).obter_ou_criar(documentos, JaDividido(), embedding,
+                                                                            "bench", backend=backend, palavras=False)
+                reabertura = time.perf_counter() - inicio
+
+                latencias = []
+                for q in range(args.queries):
+                    inicio = time.perf_counter()
+                    vectordb.similarity_search_with_relevance_scores(f"pedido {q * 31} do cliente {q}", k=args.k)
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+                p95 = statistics.quantiles(latencias, n=20)[-1]
+                print(f"{backend:>8} {quantidade:>8} {build:>8.2f} {reabertura:>9.2f} "
+                      f"{statistics.median(latencias):>8.2f} {p95:>8.2f}")
+            finally:
+                shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+'''
+CPU time to get a YouTube-like audio stream (m4a/AAC) ready for transcription:
+the previous path (pydub decode + mp3 re-encode, then decode again into the
+chunker) against decoding the native stream directly into the chunker.
+
+    python benchmarks/bench_youtube_audio.py --minutes 10
+'''
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmarks.fixtures import gerar_wav, gerar_audio_comprimido
+from genai.audio_stream import AudioStream
+from genai.media_io import MediaSource, transcodificar
+
+
+def tempo_cpu() -> float:
+    # o trabalho pesado roda nos processos ffmpeg filhos
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + filhos.ru_utime + filhos.ru_stime
+
+
+def decodificar(fonte) -> int:
+    return sum(len(chunk.pcm) for chunk in AudioStream(fonte, 30, sample_rate=16000, canais=1))
+
+
+def via_mp3(caminho : str) -> int:
+    from pydub import AudioSegment
+
+    mp3 = caminho + ".mp3"
+    AudioSegment.from_file(caminho).export(mp3, format="mp3")
+    try:
+        return decodificar(mp3)
+    finally:
+        os.remove(mp3)
+
+
+def via_mp3_em_memoria(caminho : str) -> int:
+    with transcodificar(MediaSource.from_path(caminho), "audio.mp3", format="mp3") as mp3:
+        return decodificar(mp3)
+
+
+def nativo(caminho : str) -> int:
+    with open(caminho, "rb") as f, MediaSource.from_stream(os.path.basename(caminho), f) as fonte:
+        return decodificar(fonte)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--fixture", default="tmp/bench_youtube.m4a")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.fixture):
+        wav = gerar_wav(args.fixture + ".wav", args.minutes * 60, sample_rate=44100)
+        gerar_audio_comprimido(wav, args.fixture)
+        os.remove(wav)
+
+    print(f"{'path':>22} {'cpu_s':>8} {'wall_s':>8} {'pcm_mb':>8}")
+    for nome, funcao in (("pydub mp3 (before)", via_mp3), ("ffmpeg-pipe mp3", via_mp3_em_memoria),
+                         ("native (after)", nativo)):
+        cpu, wall = tempo_cpu(), time.perf_counter()
+        pcm = funcao(args.fixture)
+        cpu, wall = tempo_cpu() - cpu, time.perf_counter() - wall
+        print(f"{nome:>22} {cpu:>8.2f} {wall:>8.2f} {pcm / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
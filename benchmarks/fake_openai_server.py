@@ -0,0 +1,303 @@
+'''
+Fake local OpenAI endpoint, used to exercise and benchmark the transcription and
+chat pipelines without an API key or network. It answers:
+
+    POST /v1/audio/transcriptions   Whisper ("json", "text" or "verbose_json" with segments)
+    POST /v1/chat/completions       chat, also streamed as server-sent events
+    POST /v1/embeddings             deterministic unit vectors (same text -> same vector)
+    GET  /media/<file>              files of --media-dir, as a stand-in for YouTube/URL downloads
+
+with a configurable latency per request (and per streamed token), a requests per
+minute limit answered with 429 + Retry-After, and random failures.
+
+Usage:
+    python benchmarks/fake_openai_server.py --port 8765 --latency 0.5 --rpm 3500
+
+and then point the client to it:
+    export OPENAI_API_BASE=http://127.0.0.1:8765/v1
+'''
+import argparse
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import random
+import re
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# PCM 16 kHz mono 16-bit: used to estimate the duration of compressed uploads
+BYTES_POR_SEGUNDO_ESTIMADO = 32000
+SEGUNDOS_POR_SEGMENTO = 5.0
+
+
+class RateLimiter:
+    '''
+    Token bucket shared by all requests of the server; None means unlimited
+    '''
+    def __init__(self, requests_per_minute : float = None) -> None:
+        self.capacidade = requests_per_minute
+        self.__disponiveis = requests_per_minute or 0
+        self.__atualizado = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def tentar(self) -> float:
+        '''
+        0 if the request may go on, otherwise the seconds until the next one is allowed
+        '''
+        if not self.capacidade:
+            return 0.0
+        with self.__lock:
+            agora = time.monotonic()
+            self.__disponiveis = min(self.capacidade,
+                                     self.__disponiveis + (agora - self.__atualizado) * self.capacidade / 60)
+            self.__atualizado = agora
+            if self.__disponiveis >= 1:
+                self.__disponiveis -= 1
+                return 0.0
+            return (1 - self.__disponiveis) * 60 / self.capacidade
+
+
+def _vetor(item, dimensao : int) -> list:
+    import numpy as np
+
+    semente = int.from_bytes(hashlib.sha256(json.dumps(item).encode("utf-8")).digest()[:8], "little")
+    vetor = np.random.default_rng(semente).standard_normal(dimensao).astype(np.float32)
+    return (vetor / np.linalg.norm(vetor)).tolist()
+
+
+def _partes_multipart(corpo : bytes, content_type : str) -> dict:
+    '''
+    {field name: bytes} of a multipart/form-data body
+    '''
+    encontrado = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    if not encontrado:
+        return {}
+    partes = {}
+    for parte in corpo.split(b"--" + encontrado.group(1).encode()):
+        cabecalho, _, conteudo = parte.partition(b"\r\n\r\n")
+        nome = re.search(rb'name="([^"]+)"', cabecalho)
+        if nome:
+            partes[nome.group(1).decode()] = conteudo[:-2] if conteudo.endswith(b"\r\n") else conteudo
+    return partes
+
+
+def _duracao_audio(dados : bytes) -> float:
+    # exact for WAV uploads; compressed chunks only get an estimate
+    if dados[:4] == b"RIFF":
+        try:
+            with wave.open(io.BytesIO(dados)) as wf:
+                return wf.getnframes() / wf.getframerate()
+        except wave.Error:
+            pass
+    return len(dados) / BYTES_POR_SEGUNDO_ESTIMADO
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # configured by create_server
+    latency = 0.0
+    token_latency = 0.0
+    failure_rate = 0.0
+    # POSTs still to be answered with 429 before any succeeds (shared by the server threads)
+    forced_failures = [0]
+    answer_words = 50
+    embedding_dimension = 1536
+    media_dir = None
+    bandwidth = None
+    limiter = RateLimiter()
+    stats = None
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, endpoint : str, bytes_in : int = 0, bytes_out : int = 0) -> None:
+        with self.stats_lock:
+            estatisticas = self.stats.setdefault(endpoint, {"requests": 0, "bytes_in": 0, "bytes_out": 0})
+            estatisticas["requests"] += 1
+            estatisticas["bytes_in"] += bytes_in
+            estatisticas["bytes_out"] += bytes_out
+
+    def _send_json(self, status : int, payload : dict, headers : dict = None) -> int:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def _throttled(self) -> bool:
+        espera = self.limiter.tentar()
+        with self.stats_lock:
+            forcada = self.forced_failures[0] > 0
+            if forcada:
+                self.forced_failures[0] -= 1
+        if espera == 0 and not forcada and random.random() >= self.failure_rate:
+            return False
+        self._count("rate_limited")
+        self._send_json(429, {"error": {"message": "Rate limit reached (fake)", "type": "requests"}},
+                        {"Retry-After": f"{max(espera, 0.1):0.2f}"})
+        return True
+
+    def _answer(self, messages : list) -> str:
+        pergunta = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        palavras = ("fake answer about " + " ".join(pergunta.split()[-8:])).split()
+        return " ".join(palavras[i % len(palavras)] for i in range(self.answer_words))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        time.sleep(self.latency)
+
+        if self._throttled():
+            return
+
+        if self.path.endswith("/audio/transcriptions"):
+            self._transcription(body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(json.loads(body or b"{}"), length)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(json.loads(body or b"{}"), length)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _transcription(self, body : bytes) -> None:
+        partes = _partes_multipart(body, self.headers.get("Content-Type"))
+        audio = partes.get("file", body)
+        formato = partes.get("response_format", b"json").decode()
+        duracao = _duracao_audio(audio)
+        texto = f"[{len(audio)} bytes]"
+
+        if formato == "verbose_json":
+            inicios = [i * SEGUNDOS_POR_SEGMENTO for i in range(max(1, int(duracao // SEGUNDOS_POR_SEGMENTO)))]
+            # the last segment goes to the end of the chunk
+            fins = inicios[1:] + [duracao]
+            segmentos = [{"id": i, "start": inicio, "end": fim, "text": f" segment {i} {texto}"}
+                         for i, (inicio, fim) in enumerate(zip(inicios, fins))]
+            payload = {"task": "transcribe", "language": "portuguese", "duration": duracao,
+                       "text": "".join(s["text"] for s in segmentos), "segments": segmentos}
+        else:
+            payload = {"text": texto + " "}
+        self._count("audio/transcriptions", len(body), self._send_json(200, payload))
+
+    def _chat(self, pedido : dict, length : int) -> None:
+        resposta = self._answer(pedido.get("messages", []))
+        modelo = pedido.get("model", "gpt-3.5-turbo")
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in pedido.get("messages", []))
+        if not pedido.get("stream"):
+            enviados = self._send_json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": modelo,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": resposta}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": self.answer_words,
+                          "total_tokens": prompt_tokens + self.answer_words}})
+            self._count("chat/completions", length, enviados)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        enviados = 0
+        tokens = [{"role": "assistant", "content": ""}] + [{"content": t} for t in re.findall(r"\s*\S+", resposta)]
+        for delta in tokens + [{}]:
+            evento = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                      "model": modelo, "choices": [{"index": 0, "delta": delta,
+                                                    "finish_reason": None if delta else "stop"}]}
+            linha = f"data: {json.dumps(evento)}\n\n".encode("utf-8")
+            self.wfile.write(linha)
+            self.wfile.flush()
+            enviados += len(linha)
+            time.sleep(self.token_latency)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self._count("chat/completions", length, enviados)
+
+    def _embeddings(self, pedido : dict, length : int) -> None:
+        entradas = pedido.get("input", [])
+        if not isinstance(entradas, list) or (entradas and isinstance(entradas[0], int)):
+            # a single text, or a single list of token ids
+            entradas = [entradas]
+        tokens = sum(len(e) if isinstance(e, list) else len(str(e).split()) for e in entradas)
+        enviados = self._send_json(200, {
+            "object": "list", "model": pedido.get("model", "text-embedding-ada-002"),
+            "data": [{"object": "embedding", "index": i, "embedding": _vetor(e, self.embedding_dimension)}
+                     for i, e in enumerate(entradas)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+        self._count("embeddings", length, enviados)
+
+    def do_GET(self):
+        if not self.path.startswith("/media/") or not self.media_dir:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        caminho = os.path.join(self.media_dir, os.path.basename(self.path[len("/media/"):]))
+        if not os.path.isfile(caminho):
+            self._send_json(404, {"error": {"message": f"Unknown file {self.path}"}})
+            return
+
+        time.sleep(self.latency)
+        tamanho = os.path.getsize(caminho)
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(caminho)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(tamanho))
+        self.end_headers()
+        bloco = 64 * 1024
+        with open(caminho, "rb") as f:
+            while dados := f.read(bloco):
+                self.wfile.write(dados)
+                if self.bandwidth:
+                    time.sleep(len(dados) / self.bandwidth)
+        self._count("media", 0, tamanho)
+
+
+def create_server(host : str = "127.0.0.1", port : int = 0, latency : float = 0.0,
+                  failure_rate : float = 0.0, token_latency : float = 0.0,
+                  requests_per_minute : float = None, answer_words : int = 50,
+                  embedding_dimension : int = 1536, media_dir : str = None,
+                  bandwidth : float = None, fail_first : int = 0) -> ThreadingHTTPServer:
+    '''
+    bandwidth: bytes per second of the /media downloads (None = unlimited).
+    fail_first: the first POST requests answered with 429, deterministically (for retry tests).
+    The counters of each endpoint are available in server.stats.
+    '''
+    stats = {}
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,),
+                   {"latency": latency, "failure_rate": failure_rate, "token_latency": token_latency,
+                    "limiter": RateLimiter(requests_per_minute), "answer_words": answer_words,
+                    "embedding_dimension": embedding_dimension, "media_dir": media_dir,
+                    "bandwidth": bandwidth, "forced_failures": [fail_first], "stats": stats, "stats_lock": threading.Lock()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = stats
+    return server
+
+
+def start_in_background(**kwargs) -> ThreadingHTTPServer:
+    server = create_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per streamed chat token")
+    parser.add_argument("--rpm", type=float, default=None, help="requests per minute before answering 429")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--answer-words", type=int, default=50)
+    parser.add_argument("--embedding-dimension", type=int, default=1536)
+    parser.add_argument("--media-dir", default=None, help="directory served under /media/")
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes per second of /media downloads")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.latency, args.failure_rate, args.token_latency,
+                           args.rpm, args.answer_words, args.embedding_dimension, args.media_dir, args.bandwidth)
+    print(f"Fake OpenAI listening on http://{args.host}:{server.server_port}/v1")
+    server.serve_forever()
@@ -0,0 +1,98 @@
+'''
+Generators of local fixture files for the benchmarks.
+'''
+import math
+import os
+import struct
+import wave
+
+
+def gerar_wav(caminho : str, duracao_segundos : float, sample_rate : int = 16000,
+              frequencia : float = 440.0) -> str:
+    '''
+    Writes a mono 16-bit sine wave of the given duration, streaming it in
+    one-second blocks so big fixtures don't need to fit in memory.
+    '''
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    um_segundo = b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * frequencia * n / sample_rate)))
+        for n in range(sample_rate)
+    )
+    with wave.open(caminho, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        inteiros = int(duracao_segundos)
+        for _ in range(inteiros):
+            wf.writeframes(um_segundo)
+        resto = int((duracao_segundos - inteiros) * sample_rate)
+        wf.writeframes(um_segundo[:resto * 2])
+    return caminho
+
+
+def gerar_csv(caminho : str, linhas : int, repetidas : float = 0.0, semente : int = 42) -> str:
+    '''
+    Writes a CSV with a mix of id, name, numeric and free-text columns.
+    repetidas is the fraction of rows that duplicate an earlier row.
+    '''
+    import numpy as np
+    import pandas as pd
+
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    rng = np.random.default_rng(semente)
+    ids = np.arange(linhas)
+    if repetidas > 0:
+        copias = rng.random(linhas) < repetidas
+        ids[copias] = rng.integers(0, max(1, linhas // 10), copias.sum())
+    df = pd.DataFrame({
+        "id": ids,
+        "cliente": np.char.add("Cliente ", (ids % 5000).astype(str)),
+        "valor": (ids * 7919 % 100000) / 100.0,
+        "cidade": np.array(["São Paulo", "Rio de Janeiro", "Curitiba", "Recife", "Manaus"])[ids % 5],
+        "observacao": np.char.add("Pedido número ", ids.astype(str)),
+    })
+    df.to_csv(caminho, index=False)
+    return caminho
+
+
+def gerar_xlsx(caminho : str, linhas : int, repetidas : float = 0.0, semente : int = 42) -> str:
+    '''
+    Same table as gerar_csv, written as an Excel sheet (needs openpyxl).
+    '''
+    import pandas as pd
+
+    caminho_csv = gerar_csv(caminho + ".csv", linhas, repetidas, semente)
+    pd.read_csv(caminho_csv).to_excel(caminho, index=False)
+    os.remove(caminho_csv)
+    return caminho
+
+
+def gerar_audio_comprimido(caminho_wav : str, caminho : str, codec : str = "aac", bitrate : str = "128k") -> str:
+    '''
+    Encodes a WAV fixture into a compressed container (e.g. .m4a with AAC, the
+    format YouTube serves for audio-only streams) using the ffmpeg binary.
+    '''
+    import subprocess
+
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", caminho_wav,
+                    "-ac", "2", "-ar", "44100", "-c:a", codec, "-b:a", bitrate, caminho], check=True)
+    return caminho
+
+
+def gerar_transcricao(caminho : str, frases : int, semente : int = 42) -> str:
+    '''
+    Writes a transcript-like text: one long paragraph of short spoken sentences,
+    as produced by the transcription modes.
+    '''
+    import random
+
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    rng = random.Random(semente)
+    palavras = ("então a gente vai ver hoje como funciona o processo de vendas e o que muda "
+                "no próximo trimestre para os clientes da região sul e do nordeste").split()
+    with open(caminho, "w") as f:
+        for _ in range(frases):
+            frase = " ".join(rng.choice(palavras) for _ in range(rng.randint(6, 25)))
+            f.write(frase.capitalize() + rng.choice([".", ".", "?", "!"]) + " ")
+    return caminho
@@ -0,0 +1,255 @@
+'''
+Offline benchmark suite: runs each scenario in its own process (so peak memory is
+per scenario) against the local fake OpenAI server, and writes machine-readable
+results that can be compared with a previous run to catch regressions.
+
+Scenarios:
+    transcription  Transcription (openai mode) of a generated WAV: audio seconds per wall second
+    download       URL download of a YouTube-like m4a into memory and its decoding,
+                   the path UrlFrontEndGenerator takes for links
+    index_build    ChatWithEmbeddings.build_index of a generated CSV/XLSX
+    query          chat_stream latency (first token and full answer) over that index
+
+    python benchmarks/run_suite.py --output tmp/bench/resultado.json
+    python benchmarks/run_suite.py --baseline tmp/bench/anterior.json --tolerance 0.15
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.fake_openai_server import start_in_background
+
+CENARIOS = ["transcription", "download", "index_build", "query"]
+
+# direção de cada métrica, usada na comparação com o baseline
+MENOR_MELHOR = {"wall_s", "download_s", "decode_s", "build_s", "first_token_p50_s", "first_token_p95_s",
+                "answer_p50_s", "answer_p95_s", "peak_rss_mb", "peak_rss_children_mb"}
+MAIOR_MELHOR = {"audio_s_per_wall_s", "download_mb_per_s"}
+
+
+def configurar_openai(api_base : str) -> None:
+    # o cliente openai e os modelos do langchain leem a base da API destas variáveis
+    os.environ["OPENAI_API_BASE"] = api_base
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    import openai
+    openai.api_base = api_base
+    openai.api_key = "sk-fake"
+
+
+def percentil(valores : list, p : float) -> float:
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))] if valores else 0.0
+
+
+def cenario_transcription(args, fixtures : str) -> dict:
+    from benchmarks.fixtures import gerar_wav
+    from genai.transcription import Transcription
+
+    caminho = os.path.join(fixtures, f"suite_{args.minutes:g}min.wav")
+    if not os.path.isfile(caminho):
+        gerar_wav(caminho, args.minutes * 60)
+
+    t = Transcription(caminho, max_workers=args.workers, usar_cache=False, formato_upload=args.upload_format)
+    inicio = time.perf_counter()
+    t.obter_transcricao_audio()
+    wall = time.perf_counter() - inicio
+    return {"wall_s": wall, "audio_s_per_wall_s": args.minutes * 60 / wall,
+            "upload_mb": t.last_bytes_uploaded / 1e6, "encode_s": t.last_encode_seconds,
+            "segments": len(t.last_segments)}
+
+
+def cenario_download(args, fixtures : str) -> dict:
+    import urllib.request
+    from benchmarks.fixtures import gerar_wav, gerar_audio_comprimido
+    from genai.audio_stream import AudioStream
+    from genai.media_io import MediaSource
+
+    # servido pelo fake em /media, no lugar do stream de áudio do YouTube
+    nome = f"suite_{args.minutes:g}min.m4a"
+    caminho = os.path.join(fixtures, nome)
+    if not os.path.isfile(caminho):
+        wav = os.path.join(fixtures, f"suite_{args.minutes:g}min.wav")
+        if not os.path.isfile(wav):
+            gerar_wav(wav, args.minutes * 60)
+        gerar_audio_comprimido(wav, caminho)
+
+    inicio = time.perf_counter()
+    with urllib.request.urlopen(f"{args.media_base}/{nome}") as response:
+        fonte = MediaSource.from_stream(nome, response)
+    download = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    pcm = sum(len(chunk.pcm) for chunk in AudioStream(fonte, 30, sample_rate=16000, canais=1))
+    decode = time.perf_counter() - inicio
+    return {"download_s": download, "download_mb_per_s": fonte.tamanho / 1e6 / download,
+            "decode_s": decode, "media_mb": fonte.tamanho / 1e6, "pcm_mb": pcm / 1e6}
+
+
+def _chatter(args, fixtures : str):
+    from benchmarks.fixtures import gerar_csv, gerar_xlsx
+    from genai.chat_with_embeddings import ChatWithEmbeddings
+
+    caminho = os.path.join(fixtures, f"suite_{args.rows}.{args.table_format}")
+    if not os.path.isfile(caminho):
+        (gerar_csv if args.table_format == "csv" else gerar_xlsx)(caminho, args.rows)
+    loader = ChatWithEmbeddings.create_loader(caminho)
+    return ChatWithEmbeddings(loader, document_id=caminho, use_answer_cache=False, index_backend=args.index_backend)
+
+
+def cenario_index_build(args, fixtures : str) -> dict:
+    chatter = _chatter(args, fixtures)
+    inicio = time.perf_counter()
+    resumo = chatter.build_index()
+    return {"build_s": time.perf_counter() - inicio, "chunks": resumo.adicionados + resumo.inalterados}
+
+
+def cenario_query(args, fixtures : str) -> dict:
+    chatter = _chatter(args, fixtures)
+    chatter.build_index()
+
+    perguntas = [f"Qual o valor do pedido número {i * 97 % args.rows}?" for i in range(args.questions)]
+    primeiros, totais = [], []
+    for pergunta in perguntas:
+        inicio = time.perf_counter()
+        for _ in chatter.chat_stream(pergunta, strategy=args.strategy):
+            pass
+        totais.append(time.perf_counter() - inicio)
+        primeiros.append(chatter.last_result["latencies"]["first_token"])
+    return {"first_token_p50_s": statistics.median(primeiros), "first_token_p95_s": percentil(primeiros, 0.95),
+            "answer_p50_s": statistics.median(totais), "answer_p95_s": percentil(totais, 0.95),
+            "questions": len(perguntas)}
+
+
+def executar_cenario(args) -> None:
+    '''
+    Processo filho: roda um cenário num diretório de trabalho novo (caches vazios)
+    e imprime o resultado em JSON na última linha da saída
+    '''
+    from genai.metrics import MetricsRegistry
+
+    fixtures = os.path.abspath(args.fixtures)
+    os.makedirs(fixtures, exist_ok=True)
+    if args.scenario != "download":
+        configurar_openai(args.api_base)
+    os.chdir(tempfile.mkdtemp(prefix=f"bench_{args.scenario}_"))
+
+    resultado = globals()[f"cenario_{args.scenario}"](args, fixtures)
+    resultado["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    resultado["peak_rss_children_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(json.dumps({"metricas": resultado, "registro": MetricsRegistry.padrao().instantaneo()}))
+
+
+def versao() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def comparar(atual : dict, baseline : dict, tolerancia : float) -> list:
+    '''
+    Métricas que pioraram mais que a tolerância em relação ao baseline
+    '''
+    regressoes = []
+    anteriores = {c["nome"]: c["metricas"] for c in baseline.get("cenarios", []) if "metricas" in c}
+    for cenario in atual["cenarios"]:
+        for nome, valor in cenario.get("metricas", {}).items():
+            anterior = anteriores.get(cenario["nome"], {}).get(nome)
+            if not anterior:
+                continue
+            variacao = (valor - anterior) / anterior
+            if (nome in MENOR_MELHOR and variacao > tolerancia) or (nome in MAIOR_MELHOR and variacao < -tolerancia):
+                regressoes.append(f"{cenario['nome']}.{nome}: {anterior:0.4g} -> {valor:0.4g} ({variacao:+.0%})")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=CENARIOS, choices=CENARIOS)
+    parser.add_argument("--minutes", type=float, default=10, help="audio duration of the transcription fixtures")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--upload-format", default="flac")
+    parser.add_argument("--rows", type=int, default=20000, help="rows of the table fixture")
+    parser.add_argument("--table-format", default="csv", choices=["csv", "xlsx"])
+    parser.add_argument("--index-backend", default=None, choices=["numpy", "chroma"])
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--strategy", default="multi_query")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake API seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="fake API seconds per streamed token")
+    parser.add_argument("--rpm", type=float, default=None, help="fake API requests per minute")
+    parser.add_argument("--bandwidth-mbps", type=float, default=None, help="fake media download speed (MB/s)")
+    # generated media and tables stay out of the repository
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "genai_bench_suite"))
+    parser.add_argument("--output", default=None, help="results JSON (default <fixtures>/results-<version>.json)")
+    parser.add_argument("--baseline", default=None, help="previous results JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative change reported as regression")
+    # usados internamente pelos processos filhos
+    parser.add_argument("--scenario", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--api-base", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--media-base", default=None, help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+
+    if args.scenario:
+        executar_cenario(args)
+        return
+
+    os.makedirs(args.fixtures, exist_ok=True)
+    server = start_in_background(latency=args.latency, token_latency=args.token_latency,
+                                 requests_per_minute=args.rpm, media_dir=args.fixtures,
+                                 bandwidth=args.bandwidth_mbps * 1e6 if args.bandwidth_mbps else None)
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    resultado = {"versao": versao(), "data": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "plataforma": platform.platform(), "cpus": os.cpu_count(),
+                 "parametros": {k: v for k, v in vars(args).items()
+                                if k not in ("scenario", "api_base", "media_base", "output", "baseline")},
+                 "cenarios": []}
+
+    print(f"{'scenario':>14}  metrics")
+    for cenario in args.scenarios:
+        processo = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--scenario", cenario,
+                                   "--api-base", f"{base}/v1", "--media-base", f"{base}/media"],
+                                  capture_output=True, text=True)
+        linhas = processo.stdout.strip().splitlines()
+        if processo.returncode != 0 or not linhas:
+            erro = (processo.stderr.strip().splitlines() or ["no output"])[-1]
+            resultado["cenarios"].append({"nome": cenario, "erro": erro})
+            print(f"{cenario:>14}  FAILED: {erro}")
+            continue
+        saida = json.loads(linhas[-1])
+        resultado["cenarios"].append({"nome": cenario, **saida})
+        print(f"{cenario:>14}  " + ", ".join(f"{k}={v:0.3f}" if isinstance(v, float) else f"{k}={v}"
+                                           for k, v in saida["metricas"].items()))
+
+    resultado["servidor"] = server.stats
+    server.shutdown()
+
+    saida = args.output or os.path.join(args.fixtures, f"results-{resultado['versao']}.json")
+    os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+    with open(saida, "w") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {saida}")
+
+    falhou = any("erro" in c for c in resultado["cenarios"])
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerance)
+        for regressao in regressoes:
+            print(f"REGRESSION {regressao}")
+        falhou = falhou or bool(regressoes)
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,24 @@
 import uuid
 import os
 import streamlit as st
-import pandas as pd
-import pathlib
 import urllib
-from typing import Self
+import urllib.request
+from typing import List, Self, TYPE_CHECKING
 from streamlit.runtime.uploaded_file_manager import UploadedFile
 from abc import ABC, abstractmethod
-from genai.chat_with_embeddings import ChatWithEmbeddings
-from genai.transcription import Transcription
+from genai.transcription import extensoes_audio
 from streamlit_extras.stylable_container import stylable_container
 from streamlit.delta_generator import DeltaGenerator
-from langchain.callbacks import get_openai_callback
-from streamlit_chat import message
-from youtube_transcript_api import YouTubeTranscriptApi
-from pytube import YouTube
-from io import BytesIO 
-from pydub import AudioSegment
 import mimetypes
+import time
+from genai.jobs import JobQueue, PENDENTE, EXECUTANDO, FALHOU
+from genai.media_io import MediaSource, transcodificar, metricas as media_io_metrics
+from genai.segments import desserializar, FORMATOS
+from genai.metrics import MetricsRegistry, ETAPAS, BYTES
+from genai.media_cache import MediaCache, TTL_METADADOS
 
-# create ./tmp/ directory if it doesn't exist
-pathlib.Path("./tmp/").mkdir(parents=True, exist_ok=True)
+if TYPE_CHECKING:
+    import pandas as pd
 
 class FrontendGenerator(ABC):
     '''
@@ -53,86 +51,178 @@ class FrontendGenerator(ABC):
         
         return output_code
 
-    def st_df(self, df : pd.DataFrame, lines : int = 10):
+    def st_df(self, df : "pd.DataFrame", lines : int = 10):
         # first n lines
         df2 = df.head(lines)
         st.dataframe(df2)
         st.write(f"(first {lines} lines)")
 
+    def st_wait_job(self, job_id : str, label : str) -> dict:
+        '''
+        Shows the progress of a background job and reruns the script until it finishes.
+        Returns the job when it is done, None otherwise.
+        '''
+        job = JobQueue.padrao().obter(job_id)
+        if job is None:
+            st.error("Job not found")
+            return None
+
+        if job["status"] in (PENDENTE, EXECUTANDO):
+            st.progress(job["progresso"], text=f"{label} {job['mensagem'] or ''}")
+            time.sleep(1)
+            st.rerun()
+        elif job["status"] == FALHOU:
+            st.error(job["erro"].splitlines()[0])
+            return None
+
+        return job
+
 class LocalFileFrontEndGenerator(FrontendGenerator):
     '''
     Frontend generator for local files
     '''
-    def __init__(self, path : str) -> None:
+    def __init__(self, path : str = None, document_id : str = None, source : MediaSource = None) -> None:
         super().__init__()
-        self.path = path
+        # in-memory sources are registered so the background jobs can reach them by id
+        self.source = source or MediaSource.from_path(path)
+        self.media_ref = path or self.source.registrar()
+        # identity used to update the document's index incrementally on re-uploads
+        self.document_id = document_id or path or self.source.nome
 
     def generate(self) -> None:
-        # save the file with a new temporary unique name
-        path = self.path
-        extension_lowercase = path.split(".")[-1].lower()
+        extension_lowercase = self.source.extensao
 
         transcription = ""
 
-        if extension_lowercase == 'wav' or extension_lowercase == "mp3":
+        # any container/codec ffmpeg decodes (e.g. YouTube's native m4a/webm) is transcribed as is
+        if extension_lowercase in extensoes_audio:
             btn_transcribe = st.button("Transcribe it", key="btn_transcribe")
 
+            # the transcription runs in the background job queue, so it survives reruns
+            job_key = f"job_transcription_{self.document_id}"
             if btn_transcribe:
-                t = Transcription(path)
-                with st.spinner('Transcribing...'):
-                    transcription = t.obter_transcricao_audio()
-                
+                st.session_state[job_key] = JobQueue.padrao().submeter("transcricao", {"fonte": self.media_ref})
+
+            job = self.st_wait_job(st.session_state[job_key], "Transcribing...") if job_key in st.session_state else None
+
+            if job:
+                transcription = job["resultado"]["texto"]
+
                 self.st_output_code(transcription)
 
                 # gets just filename portion from path
-                filename = os.path.basename(path) + ".txt"
+                filename = os.path.basename(self.source.nome) + ".txt"
 
                 st.download_button("Download", data=transcription, file_name=filename)
 
+                # timestamped subtitles / segments
+                segments = desserializar(job["resultado"]["segmentos"])
+                for col, (fmt, exporter) in zip(st.columns(len(FORMATOS)), FORMATOS.items()):
+                    with col:
+                        st.download_button(f"Download .{fmt}", data=exporter(segments),
+                                           file_name=os.path.basename(self.source.nome) + "." + fmt, key=f"download_{fmt}")
+
                 with st.expander("Custo:"):
-                    st.write(f"US${t.last_transcription_cost:0.3f}")
+                    st.write(f"US${job['resultado']['custo']:0.3f}")
+                    if job["resultado"]["cache"]:
+                        st.write("(transcription served from cache)")
+                    elif job["resultado"].get("bytes_enviados"):
+                        st.write(f"Uploaded {job['resultado']['bytes_enviados'] / 1e6:0.1f} MB "
+                                 f"(encoded in {job['resultado']['segundos_codificacao']:0.1f}s)")
+                    io_metrics = media_io_metrics()
+                    st.write(f"Media bytes copied: {io_metrics['bytes_copiados']} "
+                             f"({io_metrics['bytes_em_disco']} on disk)")
                 
         elif extension_lowercase == "txt" or extension_lowercase == "csv" or extension_lowercase == "xlsx":
-            model = st.selectbox("Model", ChatWithEmbeddings.obter_modelos(), 0)
+            # langchain (and the chat widgets) are only loaded when a document is opened
+            from genai.chat_with_embeddings import ChatWithEmbeddings
+            from langchain.callbacks import get_openai_callback
+            from streamlit_chat import message
 
-            if st.session_state.get("chatter") is None:
-                if extension_lowercase.endswith("txt"):
-                    loader = ChatWithEmbeddings.create_text_loader(self.path)
-                elif extension_lowercase.endswith("csv"):
-                    df = pd.read_csv(self.path)
-                    self.st_df(df, 10)
-                    loader = ChatWithEmbeddings.create_csv_loader(self.path)
-                else: # extension_lowercase.endswith("xlsx"):
-                    df = pd.read_excel(self.path)
-                    self.st_df(df, 10)
-                    loader = ChatWithEmbeddings.create_unstructured_excel_loader(self.path)
-                st.session_state["chatter"] = ChatWithEmbeddings(loader)
+            model = st.selectbox("Model", ChatWithEmbeddings.obter_modelos(), 0)
+            strategy = st.selectbox("Retrieval", ChatWithEmbeddings.obter_estrategias(), 1)
+            filters = None
+            if extension_lowercase != "txt":
+                from genai.keyword_index import interpretar_filtros
+                # exact matches on the table columns, e.g. "order_id=1042; status=paid"
+                try:
+                    filters = interpretar_filtros(st.text_input("Column filters (column=value; ...)"))
+                except Exception as e:
+                    st.error(str(e))
+                    return
+
+            # the document is loaded and indexed in the background job queue, which also
+            # returns the preview; the chatter then attaches to the persisted index
+            job_key = f"job_index_{self.document_id}"
+            if job_key not in st.session_state:
+                # the loaders only read from paths: in-memory sources are written to disk once
+                st.session_state[job_key] = JobQueue.padrao().submeter(
+                    "indice", {"path": self.source.materializar(), "document_id": self.document_id})
+            job = self.st_wait_job(st.session_state[job_key], "Indexing...")
+            if not job:
+                return
+
+            if job["resultado"].get("previa"):
+                import io
+                import pandas as pd
+                self.st_df(pd.read_json(io.StringIO(job["resultado"]["previa"]), orient="split"), 10)
+
+            # one chatter (index and conversation) per document, rebuilt if its index changes
+            chatter_key = f"chatter_{self.document_id}"
+            index = job["resultado"].get("indice")
+            if st.session_state.get(chatter_key) is None or st.session_state.get(f"{chatter_key}_index") != index:
+                # the loader is only used if the index was discarded in the meantime
+                loader = ChatWithEmbeddings.create_loader(self.source.materializar())
+                st.session_state[chatter_key] = ChatWithEmbeddings(loader, document_id=self.document_id, index=index)
+                st.session_state[f"{chatter_key}_index"] = index
 
             input = st.chat_input()
             if input:
                 with get_openai_callback() as cb:
-                    c = st.session_state["chatter"]
-                    c.chat(input, model=model)
-
-                    for msg in c.memory.buffer_as_messages:
-                        message(msg.content, is_user=(msg.type=='human'), allow_html=True)
+                    c = st.session_state[chatter_key]
+
+                    for i, msg in enumerate(c.memory.buffer_as_messages):
+                        message(msg.content, is_user=(msg.type=='human'), allow_html=True, key=f"msg_{i}")
+                    message(input, is_user=True, key="msg_input")
+
+                    # render the answer as the tokens arrive
+                    placeholder = st.empty()
+                    answer = ""
+                    for token in c.chat_stream(input, model=model, strategy=strategy, filters=filters):
+                        answer += token
+                        placeholder.markdown(answer + "▌")
+                    placeholder.markdown(answer)
+                    result = c.last_result
                     with st.expander("Custo:"):
                         st.write(cb)
+                        st.write({stage: f"{seconds:0.2f}s" for stage, seconds in result["latencies"].items()})
+                        if result.get("cached"):
+                            st.write("(answer served from cache)")
+                        if c.index_summary:
+                            st.write(f"Index chunks (added/removed/unchanged): {c.index_summary}")
 
 class FileUploadFrontEndGenerator(LocalFileFrontEndGenerator):
     '''
     Frontend generator for uploaded files
     '''
     def __init__(self, uploaded_file : UploadedFile) -> None:
-        self.__uploaded_file = uploaded_file
-
-        # create an unique temporary file name based on a UUID
-        destination_file_name = uuid.uuid4().hex + self.__uploaded_file.name
-        self.path = os.path.join("./tmp/", destination_file_name)
-
-        with open(self.path, "wb") as destination_file:
-            destination_file.write(self.__uploaded_file.getvalue())
-            destination_file.close()
+        # the upload stays in memory (spilling to an anonymous temp file only when large).
+        # It is copied and hashed once per upload: later reruns (e.g. while a job is
+        # polled every second) reuse the registered source by its id
+        key = f"media_source_{getattr(uploaded_file, 'file_id', None) or uploaded_file.id}"
+        source = None
+        if key in st.session_state:
+            try:
+                source = MediaSource.obter(st.session_state[key])
+            except Exception:
+                # discarded by the registry in the meantime: copied again below
+                pass
+        if source is None or source.fechada:
+            uploaded_file.seek(0)
+            source = MediaSource.from_stream(uploaded_file.name, uploaded_file)
+            st.session_state[key] = source.registrar()
+            source = MediaSource.obter(st.session_state[key])
+        super().__init__(document_id=uploaded_file.name, source=source)
 
 class UrlFrontEndGenerator(FrontendGenerator):
     '''
@@ -147,20 +237,34 @@ class UrlFrontEndGenerator(FrontendGenerator):
         
         self.__video_id = self.__get_video_id()
         self.__is_youtube = self.__video_id is not None
+        # the generator is recreated on every rerun: metadata and media live in the
+        # process-wide media cache, shared by reruns and sessions
         if self.__is_youtube:
-            self.__transcription_languages = YouTubeTranscriptApi.list_transcripts(self.__video_id)
-            """
-            # the Transcript object provides metadata properties
-            transcript.video_id,
-            transcript.language,
-            transcript.language_code,
-            # whether it has been manually created or generated by YouTube
-            transcript.is_generated,
-            # a list of languages the transcript can be translated to
-            transcript.translation_languages,
-            """
-        self.__audio_buffer = None
-        self.__download_mp3_name = None
+            self.__transcription_languages = MediaCache.padrao().obter_ou_calcular(
+                f"youtube:transcripts:{self.__video_id}", self.__list_transcripts, ttl=TTL_METADADOS)
+        self.__audio_key = f"youtube:audio:{self.__video_id}"
+        self.__mp3_key = f"youtube:mp3:{self.__video_id}"
+
+    def __list_transcripts(self) -> List[dict]:
+        '''
+        Languages of the video's transcripts (empty when it has none)
+        '''
+        from youtube_transcript_api import YouTubeTranscriptApi, CouldNotRetrieveTranscript
+
+        try:
+            with MetricsRegistry.padrao().cronometro(ETAPAS, componente="frontend", etapa="youtube_transcript_list"):
+                transcripts = YouTubeTranscriptApi.list_transcripts(self.__video_id)
+        except CouldNotRetrieveTranscript:
+            return []
+        # whether it has been manually created or generated by YouTube
+        return [{"language": t.language, "language_code": t.language_code, "is_generated": t.is_generated}
+                for t in transcripts]
+
+    def __fetch_transcript(self, language_code : str) -> List[dict]:
+        from youtube_transcript_api import YouTubeTranscriptApi
+
+        with MetricsRegistry.padrao().cronometro(ETAPAS, componente="frontend", etapa="youtube_transcript"):
+            return YouTubeTranscriptApi.get_transcript(self.__video_id, languages=[language_code])
 
     def __get_video_id(self):
         """    
@@ -191,38 +295,44 @@ class UrlFrontEndGenerator(FrontendGenerator):
         # fail?
         return None
 
-    def __get_audio(self) -> None:
-        if not self.__audio_buffer:
+    def __download_audio(self) -> MediaSource:
+        from pytube import YouTube
+
+        yt = YouTube(self.__input)
+        audio = yt.streams.filter(only_audio = True).first()
+        downloaded = MediaSource(f"{self.__video_id}.{audio.subtype}")
+        metrics = MetricsRegistry.padrao()
+        with metrics.cronometro(ETAPAS, componente="frontend", etapa="youtube_download"):
+            audio.stream_to_buffer(downloaded)
+        metrics.contar(BYTES, downloaded.tamanho, tipo="download", origem="youtube")
+        return downloaded
+
+    def __get_audio(self) -> MediaSource:
+        '''
+        Audio stream as YouTube serves it (e.g. m4a/webm), downloaded straight into memory.
+        It is not re-encoded: the transcription decodes it directly. Sessions asking for
+        the same video at the same time share a single download.
+        '''
+        source = MediaCache.padrao().obter(self.__audio_key)
+        if source is None:
             with st.spinner("In progress..."):
-                yt = YouTube(self.__input)
-
-                prefix = uuid.uuid4().hex + "_" + self.__video_id
-
-                audio = yt.streams.filter(only_audio = True).first()
-                mp4_file = audio.download("tmp/")
-
-                self.__download_mp3_name = prefix + ".mp3"
-                mp3_path = os.path.join("tmp/", self.__download_mp3_name)
-
-                audio_segment = AudioSegment.from_file(mp4_file)
-                audio_segment.export(mp3_path, format="mp3")
-
-                # delete mp4_file
-                os.remove(mp4_file)
-
-                # create BytesIO
-                self.__audio_buffer = BytesIO()
-
-                # read self__download_mp3_name into __audio_buffer
-                with open(mp3_path, "rb") as f:
-                    self.__audio_buffer.write(f.read())
-                    f.close()
-                
-                # delete mp3 file
-                os.remove(mp3_path)
-                
-
-        self.__audio_buffer.seek(0)        
+                source = MediaCache.padrao().obter_ou_calcular(self.__audio_key, self.__download_audio)
+        return source
+
+    def __get_mp3(self) -> MediaSource:
+        '''
+        MP3 encoded from the native stream, only when the user asks for it
+        '''
+        def convert() -> MediaSource:
+            native = self.__get_audio()
+            with MetricsRegistry.padrao().cronometro(ETAPAS, componente="frontend", etapa="mp3_conversion"):
+                return transcodificar(native, uuid.uuid4().hex + "_" + self.__video_id + ".mp3", format="mp3")
+
+        source = MediaCache.padrao().obter(self.__mp3_key)
+        if source is None:
+            with st.spinner("Converting to mp3..."):
+                source = MediaCache.padrao().obter_ou_calcular(self.__mp3_key, convert)
+        return source
 
     def generate(self) -> None:
         if self.__is_youtube:
@@ -230,46 +340,92 @@ class UrlFrontEndGenerator(FrontendGenerator):
             if self.__transcription_languages:
                 tab1, tab2 = st.tabs(["Get Audio", "Get Transcription"])
             else:
-                tab1 = st.tabs(["Get Audio"])
+                tab1, = st.tabs(["Get Audio"])
                 tab2 = None
 
             with tab1:
-                if st.button("Get content mp3 Audio (free)", disabled = self.__audio_buffer is not None):
-                    self.__get_audio()
-                        
-                if self.__download_mp3_name:
-                    #download button for file
-                    st.download_button(label = f"Click here to Download {self.__video_id}.mp3",
-                                    data = self.__audio_buffer,
-                                    file_name = self.__download_mp3_name,
-                                    mime = "audio/mpeg")
-                        
-            with tab2:
-                if self.__transcription_languages:    
+                audio = MediaCache.padrao().obter(self.__audio_key)
+                if st.button("Get content Audio (free)", disabled = audio is not None):
+                    audio = self.__get_audio()
+
+                if audio:
+                    #download button for file, in the original format
+                    st.download_button(label = f"Click here to Download {audio.nome}",
+                                    data = audio.getvalue(),
+                                    file_name = audio.nome,
+                                    mime = mimetypes.guess_type(audio.nome)[0] or "application/octet-stream")
+
+                    mp3 = MediaCache.padrao().obter(self.__mp3_key)
+                    if st.button("Convert to mp3", disabled = mp3 is not None):
+                        mp3 = self.__get_mp3()
+                    if mp3:
+                        st.download_button(label = f"Click here to Download {self.__video_id}.mp3",
+                                        data = mp3.getvalue(),
+                                        file_name = mp3.nome,
+                                        mime = "audio/mpeg")
+
+                    # transcribes the native stream, without the mp3 round trip
+                    LocalFileFrontEndGenerator(document_id=self.__input, source=audio).generate()
+
+            if tab2:
+                with tab2:
                     lang = st.selectbox(label = "",
                                         options =self.__transcription_languages,
                                         index = 0,
-                                        format_func = lambda x: f"{x.language} ({x.language_code})")
+                                        format_func = lambda x: f"{x['language']} ({x['language_code']})")
                     if st.button("Get Transcription (free)", disabled=not lang):
-                        transcription = YouTubeTranscriptApi.get_transcript(self.__video_id, languages=[lang.language_code])
+                        code = lang["language_code"]
+                        transcription = MediaCache.padrao().obter_ou_calcular(
+                            f"youtube:transcript:{self.__video_id}:{code}", lambda: self.__fetch_transcript(code))
                         self.st_output_code(transcription)
                         st.download_button("Download", data=str(transcription), file_name=self.__video_id+".txt")
         else:
-            # create an unique temporary file name based on a UUID
-            destination_file_name = uuid.uuid4().hex
-
-            path = os.path.join("./tmp/", destination_file_name)
-
-            # download file from url in local path
-            path, readers = urllib.request.urlretrieve(self.__input, path)
+            # streamed into memory once; later reruns and sessions reuse it until the TTL,
+            # then it is revalidated with the server (ETag/Last-Modified)
+            source = MediaCache.padrao().obter_url(self.__input)
 
-            content_type = readers.get_content_type()
+            inner_generator = LocalFileFrontEndGenerator(document_id=self.__input, source=source)
 
-            new_path = path + mimetypes.guess_extension(content_type)
+            inner_generator.generate()
 
-            #move path to new_path
-            os.rename(path, new_path)
+class DiagnosticsFrontEndGenerator(FrontendGenerator):
+    '''
+    Optional panel with the process metrics: latency per stage, transcription
+    throughput, tokens, cost and bytes processed
+    '''
+    def __init__(self, registry : MetricsRegistry = None) -> None:
+        self.registry = registry or MetricsRegistry.padrao()
 
-            inner_generator = LocalFileFrontEndGenerator(new_path)
+    @staticmethod
+    def __labels(labels : dict, *skip : str) -> str:
+        return ", ".join(f"{k}={v}" for k, v in labels.items() if k not in skip)
 
-            inner_generator.generate()
\ No newline at end of file
+    def generate(self) -> None:
+        snapshot = self.registry.instantaneo()
+
+        with st.expander("Diagnostics", expanded=True):
+            st.write("Latency per stage")
+            st.dataframe([{"component": h["rotulos"].get("componente", ""), "stage": h["rotulos"].get("etapa", ""),
+                           "labels": self.__labels(h["rotulos"], "componente", "etapa"), "count": h["contagem"],
+                           "mean (s)": round(h["media"], 3), "p50 (s)": round(h["p50"], 3),
+                           "p95 (s)": round(h["p95"], 3), "max (s)": round(h["maximo"], 3)}
+                          for h in snapshot["histogramas"] if h["nome"] == ETAPAS])
+
+            speed = snapshot["derivadas"]["audio_segundos_por_segundo"]
+            if speed:
+                st.write("Audio seconds transcribed per wall second: " +
+                         ", ".join(f"{mode} {value:0.1f}x" for mode, value in speed.items()))
+
+            st.write("Counters (bytes, audio seconds, tokens, cost, cache)")
+            st.dataframe([{"metric": c["nome"], "labels": self.__labels(c["rotulos"]), "value": round(c["valor"], 6)}
+                          for c in snapshot["contadores"]])
+            st.write(snapshot["coletados"])
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.download_button("Download JSON", data=self.registry.json(), file_name="metrics.json")
+            with col2:
+                st.download_button("Download Prometheus", data=self.registry.prometheus(), file_name="metrics.prom")
+            with col3:
+                if st.button("Reset metrics"):
+                    self.registry.limpar()
@@ -0,0 +1,177 @@
+# Cache persistente de respostas do chat, por documento (hash do conteúdo), modelo e
+# conversa anterior (hash do histórico). Uma pergunta é encontrada pela forma
+# normalizada (sem caixa, acentos e pontuação). Opcionalmente (busca_semantica), e se
+# informado o embedding, também pela pergunta mais parecida já respondida no mesmo
+# contexto, acima de um limiar de similaridade de cosseno e com os mesmos números:
+# perguntas que diferem só por um id ou data têm embeddings quase iguais.
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+CAMINHO_PADRAO = "./cache/respostas.sqlite"
+MAX_ENTRADAS_PADRAO = 5000
+LIMIAR_SIMILARIDADE_PADRAO = 0.95
+
+
+def normalizar_pergunta(pergunta : str) -> str:
+    texto = unicodedata.normalize("NFKD", pergunta.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+
+def hash_historico(turnos : List[Tuple[str, str]]) -> str:
+    '''
+    Identidade da conversa anterior a uma pergunta, como (tipo, conteúdo) de cada mensagem:
+    a mesma pergunta depois de outra conversa pode ter outra resposta
+    '''
+    if not turnos:
+        return ""
+    return hashlib.sha256(json.dumps(turnos, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def numeros(pergunta_normalizada : str) -> List[str]:
+    return re.findall(r"\d+", pergunta_normalizada)
+
+
+class AnswerCache:
+    '''
+    Respostas em SQLite com descarte das menos usadas recentemente acima de max_entradas.
+    busca_semantica habilita a busca pela pergunta mais parecida (desligada por padrão).
+    '''
+    __padrao = None
+    __padrao_lock = threading.Lock()
+
+    @staticmethod
+    def padrao() -> "AnswerCache":
+        '''
+        Instância compartilhada pelo processo, usada quando nenhuma é informada
+        '''
+        with AnswerCache.__padrao_lock:
+            if AnswerCache.__padrao is None:
+                AnswerCache.__padrao = AnswerCache(CAMINHO_PADRAO)
+            return AnswerCache.__padrao
+
+    def __init__(self, caminho : str = CAMINHO_PADRAO, max_entradas : int = MAX_ENTRADAS_PADRAO,
+                 busca_semantica : bool = False, limiar_similaridade : float = LIMIAR_SIMILARIDADE_PADRAO) -> None:
+        self.caminho = caminho
+        self.max_entradas = max_entradas
+        self.busca_semantica = busca_semantica
+        self.limiar_similaridade = limiar_similaridade
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with self.__conectar() as conn:
+            colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(respostas)")]
+            if colunas and "historico" not in colunas:
+                # respostas de versões anteriores ignoravam a conversa: são descartadas
+                logging.info(f"Cache de respostas '{caminho}' recriado")
+                conn.execute("DROP TABLE respostas")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS respostas (
+                    documento TEXT NOT NULL,
+                    modelo TEXT NOT NULL,
+                    historico TEXT NOT NULL,
+                    pergunta_normalizada TEXT NOT NULL,
+                    pergunta TEXT NOT NULL,
+                    resposta TEXT NOT NULL,
+                    fontes TEXT NOT NULL,
+                    embedding BLOB,
+                    ultimo_acesso REAL NOT NULL,
+                    PRIMARY KEY (documento, modelo, historico, pergunta_normalizada)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (ultimo_acesso)")
+
+    @contextmanager
+    def __conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __contar(self, encontrado : bool) -> None:
+        with self.__lock:
+            if encontrado:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, documento : str, modelo : str, pergunta : str, historico : str = "",
+            embedding : Optional[List[float]] = None) -> Optional[dict]:
+        '''
+        {"pergunta", "resposta", "fontes"} da pergunta equivalente já respondida depois da
+        mesma conversa (historico, ver hash_historico), ou None. O embedding só é usado
+        com busca_semantica.
+        '''
+        normalizada = normalizar_pergunta(pergunta)
+        with self.__conectar() as conn:
+            linha = conn.execute("""SELECT pergunta_normalizada, pergunta, resposta, fontes FROM respostas
+                                    WHERE documento = ? AND modelo = ? AND historico = ?
+                                    AND pergunta_normalizada = ?""",
+                                 (documento, modelo, historico, normalizada)).fetchone()
+
+            if linha is None and embedding is not None and self.busca_semantica:
+                candidatas = [c for c in conn.execute("""SELECT pergunta_normalizada, pergunta, resposta, fontes, embedding
+                                                        FROM respostas WHERE documento = ? AND modelo = ?
+                                                        AND historico = ? AND embedding IS NOT NULL""",
+                                                     (documento, modelo, historico))
+                              if numeros(c[0]) == numeros(normalizada)]
+                if candidatas:
+                    matriz = np.stack([np.frombuffer(c[4], dtype=np.float32) for c in candidatas])
+                    consulta = np.asarray(embedding, dtype=np.float32)
+                    similaridades = matriz @ consulta / (np.linalg.norm(matriz, axis=1) * np.linalg.norm(consulta) + 1e-12)
+                    melhor = int(np.argmax(similaridades))
+                    if similaridades[melhor] >= self.limiar_similaridade:
+                        logging.info(f"Resposta em cache para pergunta similar ({similaridades[melhor]:0.3f}): "
+                                     f"'{candidatas[melhor][1]}'")
+                        linha = candidatas[melhor][:4]
+
+            if linha:
+                conn.execute("""UPDATE respostas SET ultimo_acesso = ?
+                                WHERE documento = ? AND modelo = ? AND historico = ? AND pergunta_normalizada = ?""",
+                             (time.time(), documento, modelo, historico, linha[0]))
+
+        self.__contar(linha is not None)
+        if not linha:
+            return None
+        return {"pergunta": linha[1], "resposta": linha[2], "fontes": json.loads(linha[3])}
+
+    def put(self, documento : str, modelo : str, pergunta : str, resposta : str, fontes : List[dict],
+            historico : str = "", embedding : Optional[List[float]] = None) -> None:
+        '''
+        fontes: documentos de origem como {"page_content", "metadata"}
+        '''
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self.__conectar() as conn:
+            conn.execute("""INSERT OR REPLACE INTO respostas
+                            (documento, modelo, historico, pergunta_normalizada, pergunta, resposta, fontes,
+                             embedding, ultimo_acesso)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                         (documento, modelo, historico, normalizar_pergunta(pergunta), pergunta, resposta,
+                          json.dumps(fontes, ensure_ascii=False), blob, time.time()))
+            excedentes = conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0] - self.max_entradas
+            if excedentes > 0:
+                conn.execute("""DELETE FROM respostas WHERE rowid IN
+                                (SELECT rowid FROM respostas ORDER BY ultimo_acesso LIMIT ?)""", (excedentes,))
+
+    def limpar(self) -> None:
+        with self.__conectar() as conn:
+            conn.execute("DELETE FROM respostas")
+
+    def estatisticas(self) -> dict:
+        with self.__conectar() as conn:
+            entradas = conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entradas": entradas, "max_entradas": self.max_entradas}
@@ -0,0 +1,125 @@
+# Decodificação de áudio em streaming: o ffmpeg decodifica o arquivo e escreve PCM
+# no stdout, que é lido em pedaços de duração fixa. O arquivo nunca é carregado
+# inteiro em memória, então o pico de memória independe da duração do áudio.
+import io
+import logging
+import wave
+from dataclasses import dataclass
+from genai.media_io import MediaSource, abrir_fonte, ffmpeg_da_fonte
+from typing import Iterator, Optional, Union
+
+SAMPLE_WIDTH = 2  # s16le
+
+
+@dataclass
+class AudioChunk:
+    indice : int
+    inicio_segundos : float
+    pcm : bytes
+    sample_rate : int
+    canais : int
+
+    @property
+    def duracao_segundos(self) -> float:
+        return len(self.pcm) / (self.sample_rate * self.canais * SAMPLE_WIDTH)
+
+    def para_wav(self) -> io.BytesIO:
+        '''
+        Encapsula o PCM em um container WAV em memória, pronto para upload
+        '''
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wf:
+            wf.setnchannels(self.canais)
+            wf.setsampwidth(SAMPLE_WIDTH)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(self.pcm)
+        # you need to set the name with the extension
+        buffer.name = f"chunk{self.indice}.wav"
+        buffer.seek(0)
+        return buffer
+
+
+class AudioStream:
+    '''
+    Lê um áudio (qualquer formato suportado pelo ffmpeg) como uma sequência de
+    AudioChunk de duração fixa. A origem pode ser um caminho, o id de uma fonte
+    registrada ou uma MediaSource (lida pelo stdin do ffmpeg, sem passar por disco).
+
+    sample_rate/canais = None mantém os valores originais do arquivo.
+    inicio_segundos/fim_segundos limitam a leitura a um intervalo; o inicio_segundos
+    dos chunks continua relativo ao início do arquivo.
+    '''
+    def __init__(self, nome_arquivo : Union[str, MediaSource], duracao_chunk_segundos : float,
+                 sample_rate : Optional[int] = None, canais : Optional[int] = None,
+                 inicio_segundos : Optional[float] = None, fim_segundos : Optional[float] = None) -> None:
+        self.fonte = abrir_fonte(nome_arquivo)
+        self.nome_arquivo = self.fonte.nome
+        self.duracao_chunk_segundos = duracao_chunk_segundos
+        self.inicio_segundos = inicio_segundos or 0.0
+        self.fim_segundos = fim_segundos
+        self.__probe = None
+        self.sample_rate = sample_rate or int(self.__stream_audio()["sample_rate"])
+        self.canais = canais or int(self.__stream_audio()["channels"])
+
+    def __stream_audio(self) -> dict:
+        if self.__probe is None:
+            self.__probe = self.fonte.probe()
+        for stream in self.__probe["streams"]:
+            if stream.get("codec_type") == "audio":
+                return stream
+        raise Exception(f"O arquivo '{self.nome_arquivo}' não possui áudio")
+
+    def duracao_segundos(self) -> float:
+        '''
+        Duração do trecho lido (o arquivo inteiro, sem intervalo)
+        '''
+        if self.__probe is None:
+            self.__probe = self.fonte.probe()
+        # fontes lidas por pipe podem não informar a duração
+        fim = float(self.__probe["format"].get("duration", 0) or 0)
+        if self.fim_segundos is not None:
+            fim = min(fim, self.fim_segundos)
+        return max(0.0, fim - self.inicio_segundos)
+
+    def quantidade_chunks(self) -> int:
+        duracao = self.duracao_segundos()
+        return max(1, int(-(-duracao // self.duracao_chunk_segundos)))
+
+    def __iter__(self) -> Iterator[AudioChunk]:
+        bytes_por_chunk = int(self.duracao_chunk_segundos * self.sample_rate) * self.canais * SAMPLE_WIDTH
+
+        argumentos_entrada = {}
+        if self.inicio_segundos:
+            argumentos_entrada["ss"] = self.inicio_segundos
+        if self.fim_segundos is not None:
+            argumentos_entrada["t"] = max(0.0, self.fim_segundos - self.inicio_segundos)
+
+        saida = {"format": "s16le", "acodec": "pcm_s16le", "ac": self.canais, "ar": self.sample_rate}
+
+        logging.info(f"Decodificando '{self.nome_arquivo}' em chunks de {self.duracao_chunk_segundos}s...")
+
+        with ffmpeg_da_fonte(self.fonte, saida, argumentos_entrada) as processo:
+            indice = 0
+            while True:
+                pcm = self.__ler_exatamente(processo.stdout, bytes_por_chunk)
+                if not pcm:
+                    break
+                yield AudioChunk(indice=indice,
+                                 inicio_segundos=self.inicio_segundos + indice * self.duracao_chunk_segundos,
+                                 pcm=pcm,
+                                 sample_rate=self.sample_rate,
+                                 canais=self.canais)
+                indice += 1
+
+    @staticmethod
+    def __ler_exatamente(stdout, tamanho : int) -> bytes:
+        # read() em pipe pode devolver menos bytes que o pedido
+        partes = []
+        restante = tamanho
+        while restante > 0:
+            parte = stdout.read(restante)
+            if not parte:
+                break
+            partes.append(parte)
+            restante -= len(parte)
+        return b"".join(partes)
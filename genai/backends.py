@@ -0,0 +1,69 @@
+# Registro de backends carregados sob demanda. Cada nome aponta para um "modulo"
+# ou "modulo:atributo" que só é importado no primeiro uso, para que a interface e a
+# CLI não paguem na inicialização por dependências pesadas (vosk, speech_recognition,
+# langchain, ...) que a requisição atual nunca toca.
+import importlib
+import importlib.util
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class LazyRegistry:
+    '''
+    nome -> alvo importado no primeiro obter(); disponivel() verifica se as
+    dependências estão instaladas sem importá-las
+    '''
+    def __init__(self, descricao : str) -> None:
+        self.descricao = descricao
+        self.__alvos : Dict[str, str] = {}
+        self.__requer : Dict[str, Sequence[str]] = {}
+        self.__carregados : Dict[str, Any] = {}
+        self.__lock = threading.Lock()
+
+    def registrar(self, nome : str, alvo : str, requer : Optional[Sequence[str]] = None) -> None:
+        '''
+        requer: módulos de terceiros necessários (por padrão, o próprio módulo do alvo)
+        '''
+        self.__alvos[nome] = alvo
+        self.__requer[nome] = requer or [alvo.split(":")[0]]
+
+    def nomes(self) -> List[str]:
+        return list(self.__alvos)
+
+    def carregados(self) -> List[str]:
+        return list(self.__carregados)
+
+    def disponivel(self, nome : str) -> bool:
+        return nome in self.__alvos and all(importlib.util.find_spec(m.split(".")[0]) is not None
+                                            for m in self.__requer[nome])
+
+    def obter(self, nome : str) -> Any:
+        if nome not in self.__alvos:
+            raise Exception(f"{self.descricao.capitalize()} '{nome}' não é válido.")
+        with self.__lock:
+            if nome not in self.__carregados:
+                modulo, _, atributo = self.__alvos[nome].partition(":")
+                inicio = time.perf_counter()
+                alvo = importlib.import_module(modulo)
+                if atributo:
+                    alvo = getattr(alvo, atributo)
+                logging.info(f"{self.descricao.capitalize()} '{nome}' carregado em "
+                             f"{(time.perf_counter() - inicio) * 1000:0.0f}ms")
+                self.__carregados[nome] = alvo
+            return self.__carregados[nome]
+
+
+# dependências de cada modo de transcrição
+TRANSCRICAO = LazyRegistry("modo de transcrição")
+TRANSCRICAO.registrar("openai", "openai")
+TRANSCRICAO.registrar("google", "speech_recognition")
+TRANSCRICAO.registrar("vosk", "genai.vosk_models", requer=["vosk"])
+TRANSCRICAO.registrar("vosk_paralelo", "genai.vosk_parallel:transcrever_em_paralelo", requer=["vosk"])
+
+# loader de documentos por extensão
+LOADERS = LazyRegistry("loader")
+LOADERS.registrar("txt", "langchain.document_loaders.text:TextLoader", requer=["langchain"])
+LOADERS.registrar("csv", "genai.dataframe_ingestion:TabularFileLoader", requer=["pandas"])
+LOADERS.registrar("xlsx", "genai.dataframe_ingestion:TabularFileLoader", requer=["pandas", "openpyxl"])
@@ -0,0 +1,182 @@
+# Processamento em lote de diretórios/globs: transcreve áudios (.mp3/.wav) e indexa
+# documentos (.txt/.csv/.xlsx) com concorrência configurável. Cada arquivo processado
+# é registrado em um manifesto JSONL, o que permite retomar o lote após uma falha
+# pulando o que já está atualizado.
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional
+
+EXTENSOES_AUDIO = ("mp3", "wav")
+EXTENSOES_DOCUMENTO = ("txt", "csv", "xlsx")
+
+
+def caminho_transcricao(nome_arquivo : str) -> str:
+    # exemplo: arquivo.mp3 -> arquivo_transcricao.txt
+    nome_arquivo_split = nome_arquivo.split(".")
+    nome_arquivo_split[-2] += "_transcricao"
+    nome_arquivo_split[-1] = "txt"
+    return ".".join(nome_arquivo_split)
+
+
+def expandir_entradas(entradas : Iterable[str]) -> List[str]:
+    '''
+    Arquivos suportados a partir de caminhos de arquivos, diretórios (recursivo) ou globs
+    '''
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = glob.glob(os.path.join(entrada, "**", "*"), recursive=True)
+        else:
+            candidatos = glob.glob(entrada, recursive=True)
+        for candidato in sorted(candidatos):
+            extensao = candidato.split(".")[-1].lower()
+            # as próprias saídas de transcrição não são reprocessadas
+            if candidato.endswith("_transcricao.txt"):
+                continue
+            if os.path.isfile(candidato) and extensao in EXTENSOES_AUDIO + EXTENSOES_DOCUMENTO:
+                arquivos.append(os.path.abspath(candidato))
+    return list(dict.fromkeys(arquivos))
+
+
+@dataclass
+class RegistroLote:
+    arquivo : str
+    tipo : str
+    status : str
+    mtime : float
+    tamanho : int
+    saida : Optional[str] = None
+    segundos : float = 0.0
+    audio_segundos : float = 0.0
+    custo : float = 0.0
+    cache : bool = False
+    erro : Optional[str] = None
+
+
+@dataclass
+class ResumoLote:
+    processados : int = 0
+    pulados : int = 0
+    falhas : int = 0
+    wall_segundos : float = 0.0
+    audio_segundos : float = 0.0
+    custo : float = 0.0
+    registros : List[RegistroLote] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        velocidade = self.audio_segundos / self.wall_segundos if self.wall_segundos else 0.0
+        return "\n".join([
+            f"Processados: {self.processados}  Pulados: {self.pulados}  Falhas: {self.falhas}",
+            f"Tempo total: {self.wall_segundos:0.1f}s",
+            f"Áudio transcrito: {self.audio_segundos / 60:0.1f} min ({velocidade:0.1f}s de áudio por segundo)",
+            f"Custo total: US${self.custo:0.3f}",
+        ])
+
+
+class BatchProcessor:
+    def __init__(self, manifesto : str = "batch_resultados.jsonl", workers : int = 4, modo : str = "openai") -> None:
+        self.manifesto = manifesto
+        self.workers = max(1, workers)
+        self.modo = modo
+        self.__lock = threading.Lock()
+
+    def __concluidos(self) -> Dict[str, dict]:
+        # última entrada bem sucedida de cada arquivo no manifesto
+        concluidos = {}
+        if os.path.isfile(self.manifesto):
+            with open(self.manifesto, "r") as f:
+                for linha in f:
+                    try:
+                        registro = json.loads(linha)
+                    except json.JSONDecodeError:
+                        # linha parcial de uma execução interrompida
+                        continue
+                    if registro.get("status") == "ok":
+                        concluidos[registro["arquivo"]] = registro
+        return concluidos
+
+    def __registrar(self, registro : RegistroLote) -> None:
+        with self.__lock:
+            with open(self.manifesto, "a") as f:
+                f.write(json.dumps(asdict(registro), ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def __atualizado(arquivo : str, anterior : Optional[dict]) -> bool:
+        if not anterior:
+            return False
+        estado = os.stat(arquivo)
+        if anterior["mtime"] != estado.st_mtime or anterior["tamanho"] != estado.st_size:
+            return False
+        saida = anterior.get("saida")
+        return not saida or (os.path.isfile(saida) and os.path.getmtime(saida) >= estado.st_mtime)
+
+    def __processar(self, arquivo : str) -> RegistroLote:
+        estado = os.stat(arquivo)
+        extensao = arquivo.split(".")[-1].lower()
+        registro = RegistroLote(arquivo=arquivo, tipo="transcricao" if extensao in EXTENSOES_AUDIO else "indice",
+                                status="ok", mtime=estado.st_mtime, tamanho=estado.st_size)
+        inicio = time.perf_counter()
+        try:
+            if registro.tipo == "transcricao":
+                from genai.audio_stream import AudioStream
+                from genai.transcription import Transcription
+
+                t = Transcription(arquivo, modo=self.modo)
+                texto = t.obter_transcricao_audio()
+                registro.saida = caminho_transcricao(arquivo)
+                with open(registro.saida, "w") as f:
+                    f.write(texto)
+                registro.custo = t.last_transcription_cost
+                registro.cache = t.last_transcription_cached
+                registro.audio_segundos = AudioStream(arquivo, 1).duracao_segundos()
+            else:
+                from genai.chat_with_embeddings import ChatWithEmbeddings
+
+                c = ChatWithEmbeddings(ChatWithEmbeddings.create_loader(arquivo), document_id=arquivo)
+                c.build_index()
+        except Exception as e:
+            logging.error(f"Falha ao processar '{arquivo}': {e}")
+            registro.status = "erro"
+            registro.erro = str(e)
+        registro.segundos = time.perf_counter() - inicio
+        return registro
+
+    def executar(self, entradas : Iterable[str]) -> ResumoLote:
+        arquivos = expandir_entradas(entradas)
+        concluidos = self.__concluidos()
+        resumo = ResumoLote()
+
+        pendentes = []
+        for arquivo in arquivos:
+            if BatchProcessor.__atualizado(arquivo, concluidos.get(arquivo)):
+                resumo.pulados += 1
+            else:
+                pendentes.append(arquivo)
+
+        print(f"{len(arquivos)} arquivos encontrados, {resumo.pulados} já atualizados, {len(pendentes)} a processar")
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.__processar, arquivo) for arquivo in pendentes]
+            for concluido, future in enumerate(as_completed(futures), start=1):
+                registro = future.result()
+                self.__registrar(registro)
+                resumo.registros.append(registro)
+                if registro.status == "ok":
+                    resumo.processados += 1
+                    resumo.audio_segundos += registro.audio_segundos
+                    resumo.custo += registro.custo
+                else:
+                    resumo.falhas += 1
+                print(f"[{concluido}/{len(pendentes)}] {registro.status} {registro.arquivo} ({registro.segundos:0.1f}s)")
+        resumo.wall_segundos = time.perf_counter() - inicio
+
+        return resumo
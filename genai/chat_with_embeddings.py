@@ -1,104 +1,385 @@
+# os loaders e splitters menos usados (unstructured, CSVLoader, DataFrameLoader, o
+# splitter por caracteres) são importados nos métodos que os criam, e o loader de
+# cada tipo de arquivo vem do registro de backends carregados sob demanda
 from langchain.chat_models import ChatOpenAI
 from langchain.embeddings import OpenAIEmbeddings
 from langchain.document_loaders.base import BaseLoader
 from langchain.text_splitter import BaseDocumentTransformer
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.document_loaders.text import TextLoader
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores.chroma import Chroma
-from langchain.retrievers.multi_query import MultiQueryRetriever
 from langchain.chains import RetrievalQA
 from langchain.memory import ConversationBufferMemory
-from langchain.document_loaders import UnstructuredExcelLoader
-from langchain.document_loaders.csv_loader import CSVLoader
-from langchain.document_loaders import DataFrameLoader
-from langchain.prompts import (
-    ChatPromptTemplate,
-    MessagesPlaceholder,
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-)
-import pandas as pd
-from typing import List
+from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+from langchain.callbacks.base import BaseCallbackHandler
+from typing import TYPE_CHECKING, Dict, Iterator, List
+import contextvars
+import json
+import logging
 import openai
+import queue
+import threading
+import time
+from genai.vector_index_store import VectorIndexStore, ResumoIndexacao
+from genai.embedding_cache import CachedEmbeddings
+from genai.backends import LOADERS
+from genai.token_splitter import TokenBudgetSplitter
+from genai.retrieval import StrategyRetriever, ESTRATEGIAS
+from genai.context_budget import ConversationBudget, contar_tokens
+from genai.answer_cache import AnswerCache, hash_historico
+from genai.metrics import MetricsRegistry, ETAPAS, CACHE
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# o prompt "stuff" do RetrievalQA, mais a conversa até aqui (dentro do orçamento)
+ANSWER_TEMPLATE = """Use the following pieces of context and the conversation so far to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+Conversation so far:
+{history}
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+class _TokenQueueHandler(BaseCallbackHandler):
+    '''
+    Coloca cada token gerado pelo LLM numa fila, consumida por chat_stream
+    '''
+    def __init__(self, tokens : queue.Queue) -> None:
+        self.tokens = tokens
+
+    def on_llm_new_token(self, token : str, **kwargs) -> None:
+        self.tokens.put(token)
+
+
+class _TokenUsageHandler(BaseCallbackHandler):
+    '''
+    Registra os tokens e o custo de cada chamada de um LLM nas métricas. Respostas em
+    streaming não trazem o uso da API, então os tokens delas são contados com o tiktoken.
+    '''
+    def __init__(self, model : str, stage : str) -> None:
+        self.model = model
+        self.stage = stage
+        self.__prompts = {}
+
+    def on_llm_start(self, serialized : dict, prompts : List[str], **kwargs) -> None:
+        self.__prompts[kwargs.get("run_id")] = prompts
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        prompts = self.__prompts.pop(kwargs.get("run_id"), [])
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or sum(contar_tokens(p) for p in prompts)
+        completion_tokens = usage.get("completion_tokens") or sum(contar_tokens(g.text) for generations in response.generations
+                                                                  for g in generations)
+        MetricsRegistry.padrao().registrar_tokens(self.model, prompt_tokens, completion_tokens,
+                                                  componente="chat", etapa=self.stage)
+
 
 class ChatWithEmbeddings:
     @staticmethod
     def create_text_loader(path: str) -> BaseLoader:
-        return TextLoader(path)
+        return LOADERS.obter("txt")(path)
 
     @staticmethod
     def create_unstructured_file_loader(path: str) -> BaseLoader:
+        from langchain.document_loaders import UnstructuredFileLoader
         return UnstructuredFileLoader(path)
 
     @staticmethod
     def create_unstructured_excel_loader(path: str) -> BaseLoader:
+        from langchain.document_loaders import UnstructuredExcelLoader
         return UnstructuredExcelLoader(path)
 
     @staticmethod
     def create_csv_loader(path: str) -> BaseLoader:
+        from langchain.document_loaders.csv_loader import CSVLoader
         return CSVLoader(file_path=path)
 
     @staticmethod
     def create_excel_loader(path: str, page_content_column : str = None) -> BaseLoader:
-        #read file with pandas
+        import pandas as pd
+
+        #lê o arquivo com o pandas
         df = pd.read_excel(path)
 
-        #create loader
+        #cria o loader
         return ChatWithEmbeddings.create_dataframe_loader(df, page_content_column=page_content_column)
 
     @staticmethod
-    def create_dataframe_loader(df: pd.DataFrame, page_content_column : str = None) -> BaseLoader:
+    def create_dataframe_loader(df: "pd.DataFrame", page_content_column : str = None) -> BaseLoader:
+        # sem coluna de conteúdo, todas as colunas vão para o texto (vetorizado)
         if not page_content_column:
-            page_content_column = df.columns[0]
+            from genai.dataframe_ingestion import DataFrameRowsLoader
+            return DataFrameRowsLoader(df)
 
+        from langchain.document_loaders import DataFrameLoader
         return DataFrameLoader(df, page_content_column=page_content_column)
 
+    @staticmethod
+    def create_tabular_loader(path: str) -> BaseLoader:
+        # uma única leitura do .csv/.xlsx, que também fornece a pré-visualização
+        return LOADERS.obter(path.split(".")[-1].lower())(path)
+
+    @staticmethod
+    def create_loader(path: str) -> BaseLoader:
+        # loader usado pela interface, pela CLI e pelos jobs para cada tipo de arquivo suportado
+        extension_lowercase = path.split(".")[-1].lower()
+        if extension_lowercase == "txt":
+            return ChatWithEmbeddings.create_text_loader(path)
+        elif extension_lowercase in ("csv", "xlsx"):
+            return ChatWithEmbeddings.create_tabular_loader(path)
+        else:
+            raise Exception("O arquivo deve ser um arquivo .txt, .csv ou .xlsx")
+
     @staticmethod
     def create_recursive_character_text_splitter() -> BaseDocumentTransformer:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         return RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=0
         )
 
+    @staticmethod
+    def create_token_splitter(perfil : str = None) -> BaseDocumentTransformer:
+        # orçamento de tokens por tipo de fonte (transcrição, texto, linhas de tabela), salvo perfil forçado
+        return TokenBudgetSplitter(perfil=perfil)
 
     @staticmethod
     def obter_modelos() -> List[str]:
         return ["gpt-3.5-turbo", "gpt-4", "gpt-4-32k"]
 
-    def __init__(self, document_loader: BaseLoader, document_transformer: BaseDocumentTransformer = None) -> None:
+    @staticmethod
+    def obter_estrategias() -> List[str]:
+        return ESTRATEGIAS
+
+    def __init__(self, document_loader: BaseLoader, document_transformer: BaseDocumentTransformer = None,
+                 index_store: VectorIndexStore = None, document_id: str = None,
+                 answer_cache: AnswerCache = None, use_answer_cache: bool = True,
+                 index_backend: str = None, keyword_search: bool = True, index: dict = None) -> None:
+        '''
+        document_id: identidade estável do documento (ex.: o nome original do arquivo); com ela,
+                     um novo upload do documento alterado atualiza o índice de forma incremental
+        answer_cache: cache de respostas por (conteúdo do documento, modelo, conversa até aqui, pergunta);
+                      se omitido usa o cache padrão do processo. use_answer_cache=False o desliga.
+        index_backend: "numpy" ou "chroma"; por padrão o do índice existente do documento, ou
+                       escolhido pelo tamanho do documento
+        keyword_search: também constrói um índice BM25 de palavras dos mesmos chunks; os resultados
+                        dele são fundidos com os da busca vetorial e ele atende os filtros por coluna
+        index: index_info de um chat que já construiu o índice (ex.: o job "indice"); o chat se
+               conecta a ele sem carregar o documento, que só é carregado se o índice não existir mais
+        '''
         self.__document_loader = document_loader
+        self.__document_id = document_id
         if document_transformer:
             self.__document_transformer = document_transformer
         else:
-            self.__document_transformer = ChatWithEmbeddings.create_recursive_character_text_splitter()
-        self.memory = ConversationBufferMemory()
+            self.__document_transformer = ChatWithEmbeddings.create_token_splitter()
+        self.__index_store = index_store or VectorIndexStore.padrao()
+        self.__index_backend = index_backend
+        self.__keyword_search = keyword_search
+        self.__index = index
+        # chaves explícitas para a chain também retornar os documentos de origem.
+        # A memória guarda a conversa inteira (exibida pela interface); o prompt só recebe
+        # o que cabe no orçamento do modelo (turnos recentes, os mais antigos resumidos)
+        self.memory = ConversationBufferMemory(input_key="query", output_key="result")
+        self.__budget = ConversationBudget()
+        self.__history = ""
+        self.__answer_cache = (answer_cache or AnswerCache.padrao()) if use_answer_cache else None
+        self.__embedding = None
+        self.__content_hash = None
+        self.__model = None
+        self.__llm = None
         self.__vectordb = None
+        self.__keyword_index = None
+        self.__retriever = None
         self.__retrievalQA = None
+        self.index_summary = None
+        self.last_result = None
+
+    def build_index(self) -> ResumoIndexacao:
+        '''
+        Carrega o documento e constrói (ou reaproveita) os seus índices vetorial e de palavras
+        '''
+        if not self.__vectordb:
+            metrics = MetricsRegistry.padrao()
+            self.__embedding = CachedEmbeddings(OpenAIEmbeddings(openai_api_key=openai.api_key))
+            if self.__index:
+                with metrics.cronometro(ETAPAS, componente="chat", etapa="index"):
+                    opened = self.__index_store.abrir(self.__index["name"], self.__index["content_hash"],
+                                                      self.__embedding, self.__index["backend"],
+                                                      palavras=self.__keyword_search)
+                if opened:
+                    self.__vectordb, self.index_summary, self.__keyword_index = opened
+                    self.__content_hash = self.__index["content_hash"]
+                    return self.index_summary
+                logging.info(f"Índice '{self.__index['name']}' não encontrado, carregando o documento novamente")
+
+            #carrega os dados
+            with metrics.cronometro(ETAPAS, componente="chat", etapa="load"):
+                data = self.__document_loader.load()
+            # respostas são guardadas por conteúdo: um novo upload alterado não reusa respostas antigas
+            self.__content_hash = VectorIndexStore.hash_documentos(data)
+
+            # VectorDB (só os chunks ainda não indexados deste documento são embedados)
+            with metrics.cronometro(ETAPAS, componente="chat", etapa="index"):
+                self.__vectordb, self.index_summary, self.__keyword_index = self.__index_store.obter_ou_criar(
+                    data, self.__document_transformer, self.__embedding, self.__document_id, self.__index_backend,
+                    palavras=self.__keyword_search)
+
+        return self.index_summary
+
+    @property
+    def index_info(self) -> dict:
+        '''
+        Nome, backend e hash do conteúdo do índice construído (None antes de build_index),
+        para conectar outro chat a ele com o parâmetro index
+        '''
+        if not self.index_summary:
+            return None
+        return {"name": self.index_summary.nome, "backend": self.index_summary.backend,
+                "content_hash": self.__content_hash}
 
-    def chat(self, prompt : str, model : str = "gpt-3.5-turbo") -> str :
+    def chat(self, prompt : str, model : str = "gpt-3.5-turbo", strategy : str = "multi_query",
+             callbacks : List[BaseCallbackHandler] = None, filters : Dict[str, str] = None) -> dict :
+        '''
+        strategy: "single", "multi_query" (variantes buscadas em paralelo) ou "hybrid"
+                  (variantes só quando o melhor score de similaridade fica abaixo de um limiar).
+        filters: {coluna: valor} a que as linhas de tabela dos chunks recuperados devem atender
+                 exatamente (ver genai.keyword_index.interpretar_filtros para a forma "coluna=valor; ...").
+        O resultado traz "latencies" com os segundos gastos em query_expansion, search e
+        generation, e "source_documents". Quando a resposta vem do cache de respostas,
+        "cached" é True e nenhum LLM é chamado.
+        '''
         if not self.__retrievalQA:
-            #load data
-            data = self.__document_loader.load()
+            self.build_index()
+
+            self.__model = model
+            # usado nas variantes da pergunta e nos resumos do histórico
+            self.__llm = ChatOpenAI(model=model, openai_api_key=openai.api_key,
+                                    callbacks=[_TokenUsageHandler(model, "auxiliary")])
+            # a resposta é sempre pedida em streaming, para chat_stream repassar os tokens
+            llm_answer = ChatOpenAI(model=model, openai_api_key=openai.api_key, streaming=True,
+                                    callbacks=[_TokenUsageHandler(model, "generation")])
+
+            self.__retriever = StrategyRetriever(vectorstore=self.__vectordb, llm=self.__llm,
+                                                 keyword_index=self.__keyword_index)
+
+            # RetrievalQA; o histórico é lido quando o prompt é formatado
+            answer_prompt = PromptTemplate(template=ANSWER_TEMPLATE, input_variables=["context", "question"],
+                                           partial_variables={"history": lambda: self.__history})
+            self.__retrievalQA = RetrievalQA.from_llm(llm=llm_answer, prompt=answer_prompt, retriever=self.__retriever,
+                                                      memory=self.memory, return_source_documents=True)
+
+        metrics = MetricsRegistry.padrao()
+        inicio = time.perf_counter()
+        scope = self.__answer_scope(filters)
+        history_key = hash_historico([(m.type, m.content) for m in self.memory.chat_memory.messages])
+        # a pergunta só é embedada para a busca (opcional) por perguntas parecidas
+        question_embedding = None
+        if self.__answer_cache and self.__answer_cache.busca_semantica:
+            question_embedding = self.__embedding.embed_query(prompt)
+        cached = self.__cached_answer(scope, history_key, prompt, question_embedding)
+        if self.__answer_cache:
+            metrics.contar(CACHE, cache="respostas", resultado="hit" if cached else "miss")
+        if cached:
+            cached["latencies"] = {"answer_cache": time.perf_counter() - inicio}
+            metrics.observar(ETAPAS, cached["latencies"]["answer_cache"], componente="chat", etapa="answer_cache")
+            self.last_result = cached
+            return cached
+
+        self.__retriever.strategy = strategy
+        self.__retriever.filtros = dict(filters or {})
+
+        # encaixa o histórico e depois os documentos na janela de contexto do modelo
+        self.__history = self.__budget.historico(self.memory.chat_memory.messages, self.__model, self.__llm)
+        fixed_tokens = contar_tokens(ANSWER_TEMPLATE) + contar_tokens(self.__history) + contar_tokens(prompt)
+        self.__retriever.max_tokens_documentos = self.__budget.orcamento_documentos(self.__model, fixed_tokens)
+        budgeting = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        result = self.__retrievalQA(prompt, callbacks=callbacks)
+        total = time.perf_counter() - inicio
+
+        latencies = dict(self.__retriever.latencies)
+        latencies["generation"] = total - sum(latencies.values())
+        latencies["context_budget"] = budgeting
+        result["latencies"] = latencies
+        result["cached"] = False
+        for stage, seconds in latencies.items():
+            metrics.observar(ETAPAS, seconds, componente="chat", etapa=stage, estrategia=strategy)
+
+        if self.__answer_cache:
+            sources = [{"page_content": d.page_content, "metadata": d.metadata} for d in result["source_documents"]]
+            self.__answer_cache.put(scope, self.__model, prompt, result["result"], sources,
+                                    history_key, question_embedding)
+
+        self.last_result = result
+        return result
+
+    def __answer_scope(self, filters : Dict[str, str]) -> str:
+        # a mesma pergunta com outros filtros por coluna tem outra resposta
+        if not filters:
+            return self.__content_hash
+        return self.__content_hash + "|" + json.dumps(filters, sort_keys=True, ensure_ascii=False)
+
+    def __cached_answer(self, scope : str, history_key : str, prompt : str,
+                        question_embedding : List[float] = None) -> dict:
+        '''
+        Resultado de uma pergunta equivalente já respondida para este documento (e filtros)
+        e modelo depois da mesma conversa, ou None
+        '''
+        if not self.__answer_cache:
+            return None
+        found = self.__answer_cache.get(scope, self.__model, prompt, history_key, question_embedding)
+        if not found:
+            return None
+
+        self.memory.save_context({"query": prompt}, {"result": found["resposta"]})
+        return {"query": prompt, "result": found["resposta"], "cached": True,
+                "source_documents": [Document(**source) for source in found["fontes"]]}
+
+    def chat_stream(self, prompt : str, model : str = "gpt-3.5-turbo", strategy : str = "multi_query",
+                    filters : Dict[str, str] = None) -> Iterator[str]:
+        '''
+        Como chat, mas devolve a resposta token a token, à medida que o LLM a gera.
+        Quando o gerador termina, o resultado completo (fontes, latências, mais a
+        latência "first_token") fica em self.last_result.
+        '''
+        tokens = queue.Queue()
+        fim = object()
+        erro = []
+
+        def executar() -> None:
+            try:
+                self.chat(prompt, model=model, strategy=strategy, callbacks=[_TokenQueueHandler(tokens)],
+                          filters=filters)
+            except Exception as e:
+                erro.append(e)
+            finally:
+                tokens.put(fim)
 
-            # split
-            splits = self.__document_transformer.transform_documents(data)
+        inicio = time.perf_counter()
+        primeiro_token = None
+        # copia o contexto para o get_openai_callback() de quem chamou continuar contando os custos
+        contexto = contextvars.copy_context()
+        thread = threading.Thread(target=contexto.run, args=(executar,), daemon=True)
+        thread.start()
 
-            # VectorDB
-            embedding = OpenAIEmbeddings(openai_api_key=openai.api_key)
-            self.__vectordb = Chroma.from_documents(documents=splits, embedding=embedding)
+        while (token := tokens.get()) is not fim:
+            if primeiro_token is None:
+                primeiro_token = time.perf_counter() - inicio
+            yield token
 
-            llm = ChatOpenAI(model=model, openai_api_key=openai.api_key)
+        thread.join()
+        if erro:
+            raise erro[0]
 
-            query_retriever = MultiQueryRetriever.from_llm(
-                retriever=self.__vectordb.as_retriever(), llm=llm
-            )
+        if self.last_result.get("cached"):
+            # acerto no cache de respostas: sem chamada ao LLM, a resposta vem inteira
+            primeiro_token = time.perf_counter() - inicio
+            yield self.last_result["result"]
 
-            # RetrievalQA
-            self.__retrievalQA = RetrievalQA.from_llm(llm=llm, retriever=query_retriever, memory=self.memory)
-        
-        return self.__retrievalQA(prompt)
+        self.last_result["latencies"]["first_token"] = primeiro_token
+        MetricsRegistry.padrao().observar(ETAPAS, primeiro_token, componente="chat", etapa="first_token")
 
 
@@ -0,0 +1,75 @@
+# Codificação compacta dos chunks enviados ao Whisper: o PCM (já decodificado em
+# mono 16 kHz, a taxa que o modelo usa internamente) é comprimido pelo ffmpeg em
+# FLAC, Opus ou MP3 antes do upload, e a duração dos chunks é derivada de um
+# orçamento de bytes por requisição em vez de uma duração fixa.
+import io
+import logging
+import time
+from dataclasses import dataclass
+from genai.audio_stream import AudioChunk, SAMPLE_WIDTH
+
+SAMPLE_RATE_UPLOAD = 16000
+CANAIS_UPLOAD = 1
+# limite de tamanho de arquivo da API de transcrição
+LIMITE_BYTES_UPLOAD = 25 * 1024 * 1024
+
+# formato -> (extensão, argumentos de saída do ffmpeg, bytes por segundo estimados)
+FORMATOS_UPLOAD = {
+    "flac": ("flac", {"format": "flac", "acodec": "flac", "compression_level": 5}, 20000),
+    "opus": ("ogg", {"format": "ogg", "acodec": "libopus", "audio_bitrate": "32k", "application": "voip"}, 4000),
+    "mp3": ("mp3", {"format": "mp3", "acodec": "libmp3lame", "audio_bitrate": "48k"}, 6000),
+    "wav": ("wav", None, SAMPLE_RATE_UPLOAD * CANAIS_UPLOAD * SAMPLE_WIDTH),
+}
+
+
+@dataclass
+class ChunkCodificado:
+    buffer : io.BytesIO
+    tamanho_bytes : int
+    segundos_codificacao : float
+
+
+class ChunkEncoder:
+    '''
+    Codifica AudioChunk em um arquivo em memória no formato escolhido ("flac",
+    "opus", "mp3" ou "wav", sem compressão), pronto para upload
+    '''
+    def __init__(self, formato : str = "flac") -> None:
+        if formato not in FORMATOS_UPLOAD:
+            raise Exception(f"O formato '{formato}' não é válido.")
+        self.formato = formato
+        self.extensao, self.__saida, self.bytes_por_segundo = FORMATOS_UPLOAD[formato]
+
+    def duracao_para_orcamento(self, orcamento_bytes : int, duracao_maxima_segundos : float) -> float:
+        '''
+        Duração dos chunks para que cada upload fique dentro de orcamento_bytes
+        (com folga para a variação da taxa de compressão)
+        '''
+        orcamento_bytes = min(orcamento_bytes, LIMITE_BYTES_UPLOAD)
+        return max(1.0, min(duracao_maxima_segundos, 0.8 * orcamento_bytes / self.bytes_por_segundo))
+
+    def codificar(self, chunk : AudioChunk) -> ChunkCodificado:
+        inicio = time.perf_counter()
+        if self.__saida is None:
+            buffer = chunk.para_wav()
+        else:
+            import ffmpeg
+
+            dados, _ = (
+                ffmpeg
+                .input("pipe:", format="s16le", ar=chunk.sample_rate, ac=chunk.canais)
+                .output("pipe:", ac=CANAIS_UPLOAD, ar=SAMPLE_RATE_UPLOAD, **self.__saida)
+                .global_args("-loglevel", "error")
+                .run(input=chunk.pcm, capture_stdout=True, capture_stderr=True)
+            )
+            buffer = io.BytesIO(dados)
+            # you need to set the name with the extension
+            buffer.name = f"chunk{chunk.indice}.{self.extensao}"
+        segundos = time.perf_counter() - inicio
+
+        tamanho = buffer.getbuffer().nbytes
+        if tamanho > LIMITE_BYTES_UPLOAD:
+            logging.warning(f"Chunk {chunk.indice} tem {tamanho} bytes, acima do limite de upload")
+        logging.info(f"Chunk {chunk.indice}: {chunk.duracao_segundos:0.1f}s -> {tamanho} bytes ({self.formato}) "
+                     f"em {segundos * 1000:0.0f}ms")
+        return ChunkCodificado(buffer=buffer, tamanho_bytes=tamanho, segundos_codificacao=segundos)
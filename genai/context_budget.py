@@ -0,0 +1,136 @@
+# Orçamento de tokens do prompt de cada resposta: a janela de contexto do modelo,
+# menos a reserva para a resposta, é dividida entre o histórico da conversa (turnos
+# recentes na íntegra, os mais antigos resumidos) e os documentos recuperados
+# (sem duplicatas quase idênticas, em ordem de relevância, até caberem).
+import logging
+import re
+from genai.token_splitter import obter_tokenizer
+from langchain.schema import BaseMessage, Document
+from langchain.schema.language_model import BaseLanguageModel
+from typing import List, Optional
+
+JANELAS_CONTEXTO = {"gpt-3.5-turbo": 4096, "gpt-4": 8192, "gpt-4-32k": 32768}
+JANELA_PADRAO = 4096
+TOKENS_RESPOSTA = 1024
+# fração do orçamento (sem a resposta) que o histórico pode ocupar
+FRACAO_HISTORICO = 0.25
+# similaridade de Jaccard (trigramas de palavras) a partir da qual dois chunks são o mesmo
+LIMIAR_DUPLICADO = 0.9
+
+RESUMO_TEMPLATE = """Progressively summarize the lines of conversation provided, adding onto
+the previous summary and returning a new summary in at most {palavras} words, in the
+language of the conversation.
+
+Current summary:
+{resumo}
+
+New lines of conversation:
+{linhas}
+
+New summary:"""
+
+
+def contar_tokens(texto : str) -> int:
+    return len(obter_tokenizer().encode_ordinary(texto)) if texto else 0
+
+
+def janela_do_modelo(modelo : str) -> int:
+    return JANELAS_CONTEXTO.get(modelo, JANELA_PADRAO)
+
+
+def _trigramas(texto : str) -> set:
+    palavras = re.findall(r"\w+", texto.lower())
+    if len(palavras) < 3:
+        return {tuple(palavras)}
+    return set(zip(palavras, palavras[1:], palavras[2:]))
+
+
+def deduplicar(documentos : List[Document], limiar : float = LIMIAR_DUPLICADO) -> List[Document]:
+    '''
+    Remove documentos quase idênticos a um anterior (ex.: chunks vizinhos com sobreposição,
+    ou a mesma linha indexada por documentos diferentes), mantendo a ordem
+    '''
+    mantidos, conjuntos = [], []
+    for documento in documentos:
+        trigramas = _trigramas(documento.page_content)
+        duplicado = any(len(trigramas & outro) / max(1, len(trigramas | outro)) >= limiar for outro in conjuntos)
+        if not duplicado:
+            mantidos.append(documento)
+            conjuntos.append(trigramas)
+    if len(mantidos) < len(documentos):
+        logging.info(f"{len(documentos) - len(mantidos)} documentos quase duplicados removidos do contexto")
+    return mantidos
+
+
+def ajustar_ao_orcamento(documentos : List[Document], orcamento_tokens : int) -> List[Document]:
+    '''
+    Documentos, em ordem, enquanto couberem no orçamento (um documento que não cabe é
+    pulado, e os seguintes, menores, ainda podem entrar)
+    '''
+    if not documentos:
+        return documentos
+    tamanhos = [len(t) for t in obter_tokenizer().encode_ordinary_batch([d.page_content for d in documentos])]
+    selecionados, usados = [], 0
+    for documento, tamanho in zip(documentos, tamanhos):
+        # +4: separadores do prompt entre documentos
+        if usados + tamanho + 4 <= orcamento_tokens:
+            selecionados.append(documento)
+            usados += tamanho + 4
+    if len(selecionados) < len(documentos):
+        logging.info(f"Contexto: {len(selecionados)}/{len(documentos)} documentos cabem em {orcamento_tokens} tokens")
+    return selecionados
+
+
+class ConversationBudget:
+    '''
+    Histórico da conversa que cabe no orçamento do modelo. Os turnos que não cabem
+    são resumidos incrementalmente pelo llm (cada turno é resumido uma única vez).
+    Sem llm, os turnos antigos são apenas descartados do prompt.
+    '''
+    def __init__(self, tokens_resposta : int = TOKENS_RESPOSTA, fracao_historico : float = FRACAO_HISTORICO) -> None:
+        self.tokens_resposta = tokens_resposta
+        self.fracao_historico = fracao_historico
+        self.resumo = ""
+        self.__mensagens_resumidas = 0
+
+    def orcamento_prompt(self, modelo : str) -> int:
+        return janela_do_modelo(modelo) - self.tokens_resposta
+
+    def orcamento_historico(self, modelo : str) -> int:
+        return int(self.orcamento_prompt(modelo) * self.fracao_historico)
+
+    @staticmethod
+    def __formatar(mensagem : BaseMessage) -> str:
+        return f"{'Human' if mensagem.type == 'human' else 'AI'}: {mensagem.content}"
+
+    def historico(self, mensagens : List[BaseMessage], modelo : str,
+                  llm : Optional[BaseLanguageModel] = None) -> str:
+        orcamento = self.orcamento_historico(modelo)
+        linhas = [ConversationBudget.__formatar(m) for m in mensagens]
+        tamanhos = [len(t) for t in obter_tokenizer().encode_ordinary_batch(linhas)] if linhas else []
+
+        # o resumo ocupa no máximo um quarto do orçamento do histórico
+        orcamento_recentes = orcamento - (orcamento // 4 if llm else 0)
+        inicio, usados = len(linhas), 0
+        while inicio > 0 and usados + tamanhos[inicio - 1] <= orcamento_recentes:
+            inicio -= 1
+            usados += tamanhos[inicio]
+
+        if llm and inicio > self.__mensagens_resumidas:
+            antigas = "\n".join(linhas[self.__mensagens_resumidas:inicio])
+            self.resumo = llm.predict(RESUMO_TEMPLATE.format(palavras=orcamento // 8, resumo=self.resumo or "(empty)",
+                                                            linhas=antigas)).strip()
+            self.__mensagens_resumidas = inicio
+            logging.info(f"Histórico: {inicio} mensagens resumidas em {contar_tokens(self.resumo)} tokens")
+
+        partes = []
+        if self.resumo:
+            partes.append(f"Summary of the earlier conversation: {self.resumo}")
+        partes.extend(linhas[inicio:])
+        return "\n".join(partes) if partes else "(no previous messages)"
+
+    def orcamento_documentos(self, modelo : str, tokens_fixos : int) -> int:
+        '''
+        Tokens que sobram para os documentos depois do template, da pergunta e do histórico
+        '''
+        return max(0, self.orcamento_prompt(modelo) - tokens_fixos)
@@ -0,0 +1,114 @@
+# Ingestão de CSV/XLSX com pandas: o arquivo é lido uma única vez (em blocos, para
+# CSVs grandes), o texto de cada linha é montado com operações vetorizadas por coluna
+# e as linhas são agrupadas em chunks limitados por um orçamento de tokens.
+import numpy as np
+import pandas as pd
+from langchain.document_loaders.base import BaseLoader
+from langchain.schema import Document
+from typing import Iterator, List, Optional
+
+# estimado por caracteres: fica abaixo do orçamento do perfil "tabela" do TokenBudgetSplitter
+# (contado em tokens reais), para que os chunks não sejam re-divididos
+TOKENS_POR_CHUNK_PADRAO = 300
+LINHAS_POR_BLOCO_PADRAO = 100_000
+# estimativa usual para textos em línguas latinas
+CARACTERES_POR_TOKEN = 4
+
+
+def renderizar_linhas(df : pd.DataFrame) -> pd.Series:
+    '''
+    Texto de cada linha no formato "coluna: valor", uma coluna por linha de texto
+    (mesmo formato do CSVLoader), montado coluna a coluna
+    '''
+    texto = None
+    for coluna in df.columns:
+        parte = f"{str(coluna).strip()}: " + df[coluna].astype(str).where(df[coluna].notna(), "").str.strip()
+        texto = parte if texto is None else texto + "\n" + parte
+    if texto is None:
+        return pd.Series([""] * len(df), index=df.index, dtype=object)
+    return texto
+
+
+def agrupar_por_tokens(texto : pd.Series, tokens_por_chunk : int) -> np.ndarray:
+    '''
+    Número do chunk de cada linha: linhas consecutivas ficam no mesmo chunk enquanto
+    começarem dentro do mesmo orçamento de tokens (o chunk excede o orçamento em no
+    máximo uma linha, e uma linha nunca é cortada)
+    '''
+    tokens = texto.str.len().to_numpy() // CARACTERES_POR_TOKEN + 1
+    inicio = np.cumsum(tokens) - tokens
+    return inicio // max(1, tokens_por_chunk)
+
+
+class DataFrameRowsLoader(BaseLoader):
+    '''
+    Documentos a partir de um DataFrame já carregado, com todas as colunas no texto
+    '''
+    def __init__(self, df : pd.DataFrame, source : str = "dataframe",
+                 tokens_por_chunk : int = TOKENS_POR_CHUNK_PADRAO) -> None:
+        self.df = df
+        self.source = source
+        self.tokens_por_chunk = tokens_por_chunk
+
+    @staticmethod
+    def documentos_do_bloco(df : pd.DataFrame, source : str, primeira_linha : int,
+                            tokens_por_chunk : int) -> List[Document]:
+        if df.empty:
+            return []
+        texto = renderizar_linhas(df).reset_index(drop=True)
+        grupos = agrupar_por_tokens(texto, tokens_por_chunk)
+        posicoes = pd.Series(np.arange(len(texto)) + primeira_linha)
+
+        conteudos = texto.groupby(grupos, sort=False).agg("\n\n".join)
+        inicios = posicoes.groupby(grupos, sort=False).min()
+        fins = posicoes.groupby(grupos, sort=False).max()
+
+        return [Document(page_content=conteudo,
+                         metadata={"source": source, "row_start": int(inicio), "row_end": int(fim)})
+                for conteudo, inicio, fim in zip(conteudos, inicios, fins)]
+
+    def lazy_load(self) -> Iterator[Document]:
+        yield from DataFrameRowsLoader.documentos_do_bloco(self.df, self.source, 0, self.tokens_por_chunk)
+
+    def load(self) -> List[Document]:
+        return list(self.lazy_load())
+
+
+class TabularFileLoader(BaseLoader):
+    '''
+    Loader de .csv/.xlsx que lê o arquivo uma única vez.
+    CSVs são lidos em blocos de linhas_por_bloco, sem carregar o arquivo inteiro.
+    '''
+    def __init__(self, path : str, tokens_por_chunk : int = TOKENS_POR_CHUNK_PADRAO,
+                 linhas_por_bloco : int = LINHAS_POR_BLOCO_PADRAO) -> None:
+        self.path = path
+        self.tokens_por_chunk = tokens_por_chunk
+        self.linhas_por_bloco = linhas_por_bloco
+        self.__is_excel = path.lower().endswith(("xlsx", "xls"))
+        self.__df_excel : Optional[pd.DataFrame] = None
+
+    def __excel(self) -> pd.DataFrame:
+        # planilhas não podem ser lidas em blocos: são lidas uma vez e reaproveitadas
+        if self.__df_excel is None:
+            self.__df_excel = pd.read_excel(self.path)
+        return self.__df_excel
+
+    def preview(self, linhas : int = 10) -> pd.DataFrame:
+        if self.__is_excel:
+            return self.__excel().head(linhas)
+        return pd.read_csv(self.path, nrows=linhas)
+
+    def __blocos(self) -> Iterator[pd.DataFrame]:
+        if self.__is_excel:
+            yield self.__excel()
+        else:
+            yield from pd.read_csv(self.path, chunksize=self.linhas_por_bloco)
+
+    def lazy_load(self) -> Iterator[Document]:
+        primeira_linha = 0
+        for bloco in self.__blocos():
+            yield from DataFrameRowsLoader.documentos_do_bloco(bloco, self.path, primeira_linha, self.tokens_por_chunk)
+            primeira_linha += len(bloco)
+
+    def load(self) -> List[Document]:
+        return list(self.lazy_load())
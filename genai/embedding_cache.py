@@ -0,0 +1,294 @@
+# Cache de embeddings por chunk, chaveado pelo hash do texto e pelo modelo.
+# Os vetores ficam numa matriz float32 contígua em disco (lida via memmap) e um
+# arquivo de chaves guarda a linha de cada hash. Apenas os textos ausentes do
+# cache são enviados ao modelo, deduplicados e em lotes grandes.
+import hashlib
+import logging
+import numpy as np
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from genai.metrics import MetricsRegistry, ETAPAS, CACHE
+from genai.token_splitter import obter_tokenizer
+from langchain.embeddings.base import Embeddings
+from typing import Dict, Iterator, List
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sem trava entre processos, apenas entre threads
+    fcntl = None
+
+DIRETORIO_PADRAO = "./cache/embeddings"
+TAMANHO_LOTE_PADRAO = 1000
+MAX_BYTES_PADRAO = 1024 * 1024 * 1024  # 1 GB (~170 mil vetores de 1536 dimensões)
+# ao passar do limite, o cache é compactado mantendo os vetores mais recentes até esta fração
+FRACAO_APOS_COMPACTAR = 0.75
+LINHAS_POR_BLOCO_COMPACTACAO = 10_000
+# perguntas não são persistidas: só as mais recentes ficam em memória
+MAX_CONSULTAS_MEMORIA = 256
+
+
+class EmbeddingCache:
+    '''
+    Armazenamento append-only de vetores de um único modelo, compartilhável entre
+    processos (ex.: a CLI em modo batch e o Streamlit):
+        vetores.f32 -> matriz (linhas x dimensao) float32
+        chaves.txt  -> hash do texto da linha i, um por linha
+        dimensao.txt -> dimensão dos vetores
+        trava       -> trava (flock) de quem lê ou escreve os arquivos
+    A linha de cada chave vem da posição no arquivo, relida sob a trava: o que outros
+    processos acrescentaram é incorporado antes de cada leitura ou escrita. Acima de
+    max_bytes, os vetores mais antigos são descartados.
+    '''
+    def __init__(self, diretorio : str, max_bytes : int = MAX_BYTES_PADRAO) -> None:
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.__caminho_vetores = os.path.join(diretorio, "vetores.f32")
+        self.__caminho_chaves = os.path.join(diretorio, "chaves.txt")
+        self.__caminho_dimensao = os.path.join(diretorio, "dimensao.txt")
+        self.__lock = threading.Lock()
+        self.__linhas : Dict[str, int] = {}
+        self.__offset_chaves = 0
+        self.__inode = None
+        self.__dimensao = None
+        self.__matriz = None
+
+        os.makedirs(diretorio, exist_ok=True)
+        self.__arquivo_trava = open(os.path.join(diretorio, "trava"), "a")
+        with self.__travado(exclusivo=True):
+            self.__sincronizar()
+            self.__reparar()
+
+    @staticmethod
+    def hash_texto(texto : str) -> str:
+        return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def __travado(self, exclusivo : bool) -> Iterator[None]:
+        with self.__lock:
+            if fcntl is not None:
+                fcntl.flock(self.__arquivo_trava, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.__arquivo_trava, fcntl.LOCK_UN)
+
+    @property
+    def __bytes_por_linha(self) -> int:
+        return 4 * self.__dimensao
+
+    def __sincronizar(self) -> None:
+        '''
+        Incorpora as chaves acrescentadas por outros processos desde a última leitura
+        (ou recarrega tudo, se o cache foi compactado). Chamado com a trava.
+        '''
+        if self.__dimensao is None:
+            if not os.path.isfile(self.__caminho_dimensao):
+                return
+            with open(self.__caminho_dimensao, "r") as f:
+                self.__dimensao = int(f.read())
+        try:
+            estado = os.stat(self.__caminho_vetores)
+        except FileNotFoundError:
+            return
+        if estado.st_ino != self.__inode or estado.st_size < len(self.__linhas) * self.__bytes_por_linha:
+            # arquivo novo (primeira leitura ou compactação)
+            self.__linhas, self.__offset_chaves, self.__inode, self.__matriz = {}, 0, estado.st_ino, None
+
+        linhas_arquivo = estado.st_size // self.__bytes_por_linha
+        if linhas_arquivo <= len(self.__linhas) or not os.path.isfile(self.__caminho_chaves):
+            return
+        with open(self.__caminho_chaves, "rb") as f:
+            f.seek(self.__offset_chaves)
+            novas = f.read()
+        # uma linha sem o "\n" final é uma escrita interrompida
+        for chave in novas[:novas.rfind(b"\n") + 1].decode("ascii").splitlines():
+            if len(self.__linhas) >= linhas_arquivo:
+                break
+            self.__linhas[chave] = len(self.__linhas)
+            self.__offset_chaves += len(chave) + 1
+
+    def __reparar(self) -> None:
+        '''
+        Uma escrita interrompida pode deixar vetores sem chave ou uma chave incompleta:
+        os dois arquivos voltam ao tamanho das linhas completas. Chamado com a trava exclusiva.
+        '''
+        if self.__dimensao is None or not os.path.isfile(self.__caminho_vetores):
+            return
+        tamanho = len(self.__linhas) * self.__bytes_por_linha
+        if os.path.getsize(self.__caminho_vetores) != tamanho:
+            logging.warning(f"Cache de embeddings '{self.diretorio}' truncado em {len(self.__linhas)} vetores")
+            with open(self.__caminho_vetores, "ab") as f:
+                f.truncate(tamanho)
+        if os.path.isfile(self.__caminho_chaves) and os.path.getsize(self.__caminho_chaves) != self.__offset_chaves:
+            with open(self.__caminho_chaves, "ab") as f:
+                f.truncate(self.__offset_chaves)
+
+    def __len__(self) -> int:
+        with self.__travado(exclusivo=False):
+            self.__sincronizar()
+            return len(self.__linhas)
+
+    def __matriz_atual(self) -> np.ndarray:
+        linhas = len(self.__linhas)
+        if self.__matriz is None or self.__matriz.shape[0] != linhas:
+            self.__matriz = np.memmap(self.__caminho_vetores, dtype=np.float32, mode="r",
+                                      shape=(linhas, self.__dimensao))
+        return self.__matriz
+
+    def obter(self, chaves : List[str]) -> Dict[str, np.ndarray]:
+        with self.__travado(exclusivo=False):
+            self.__sincronizar()
+            presentes = [(c, self.__linhas[c]) for c in chaves if c in self.__linhas]
+            if not presentes:
+                return {}
+            matriz = self.__matriz_atual()
+            return {chave: np.array(matriz[linha]) for chave, linha in presentes}
+
+    def adicionar(self, chaves : List[str], vetores : np.ndarray) -> None:
+        vetores = np.ascontiguousarray(vetores, dtype=np.float32)
+        with self.__travado(exclusivo=True):
+            self.__sincronizar()
+            novos, vistos = [], set()
+            for i, chave in enumerate(chaves):
+                if chave not in self.__linhas and chave not in vistos:
+                    vistos.add(chave)
+                    novos.append(i)
+            if not novos:
+                return
+            if self.__dimensao is None:
+                self.__dimensao = vetores.shape[1]
+                with open(self.__caminho_dimensao, "w") as f:
+                    f.write(str(self.__dimensao))
+            elif vetores.shape[1] != self.__dimensao:
+                raise Exception(f"Dimensão {vetores.shape[1]} diferente da do cache ({self.__dimensao})")
+            self.__reparar()
+
+            # os vetores antes das chaves: uma chave nunca aponta para um vetor não escrito
+            with open(self.__caminho_vetores, "ab") as f:
+                f.write(vetores[novos].tobytes())
+            with open(self.__caminho_chaves, "a") as f:
+                f.write("".join(chaves[i] + "\n" for i in novos))
+            self.__sincronizar()
+
+            if len(self.__linhas) * self.__bytes_por_linha > self.max_bytes:
+                self.__compactar()
+
+    def __compactar(self) -> None:
+        '''
+        Mantém só os vetores mais recentes, reescrevendo os arquivos. Quem já mapeou os
+        vetores antigos continua lendo-os; os outros processos recarregam ao notar o
+        arquivo novo. Chamado com a trava exclusiva.
+        '''
+        chaves = list(self.__linhas)
+        manter = int(self.max_bytes * FRACAO_APOS_COMPACTAR) // self.__bytes_por_linha
+        inicio = len(chaves) - manter
+        matriz = self.__matriz_atual()
+        with open(self.__caminho_vetores + ".tmp", "wb") as f:
+            for bloco in range(inicio, len(chaves), LINHAS_POR_BLOCO_COMPACTACAO):
+                f.write(np.ascontiguousarray(matriz[bloco:bloco + LINHAS_POR_BLOCO_COMPACTACAO]).tobytes())
+        with open(self.__caminho_chaves + ".tmp", "w") as f:
+            f.write("".join(chave + "\n" for chave in chaves[inicio:]))
+        # as chaves primeiro: entre as duas trocas, há mais vetores que chaves (nunca o contrário)
+        os.replace(self.__caminho_chaves + ".tmp", self.__caminho_chaves)
+        os.replace(self.__caminho_vetores + ".tmp", self.__caminho_vetores)
+        self.__sincronizar()
+        logging.info(f"Cache de embeddings '{self.diretorio}' compactado: {inicio} vetores antigos descartados")
+
+
+class CachedEmbeddings(Embeddings):
+    '''
+    Envolve um Embeddings (ex.: OpenAIEmbeddings) com o EmbeddingCache do seu modelo
+    '''
+    __caches : Dict[str, EmbeddingCache] = {}
+    __caches_lock = threading.Lock()
+
+    def __init__(self, upstream : Embeddings, diretorio : str = DIRETORIO_PADRAO,
+                 tamanho_lote : int = TAMANHO_LOTE_PADRAO, max_bytes : int = MAX_BYTES_PADRAO) -> None:
+        self.upstream = upstream
+        self.model = getattr(upstream, "model", type(upstream).__name__)
+        self.tamanho_lote = tamanho_lote
+        self.hits = 0
+        self.misses = 0
+        self.__consultas : "OrderedDict[str, List[float]]" = OrderedDict()
+        self.__consultas_lock = threading.Lock()
+
+        # um cache por modelo, compartilhado por todas as instâncias do processo
+        diretorio_modelo = os.path.join(diretorio, hashlib.sha1(str(self.model).encode("utf-8")).hexdigest()[:16])
+        with CachedEmbeddings.__caches_lock:
+            if diretorio_modelo not in CachedEmbeddings.__caches:
+                CachedEmbeddings.__caches[diretorio_modelo] = EmbeddingCache(diretorio_modelo, max_bytes)
+            self.cache = CachedEmbeddings.__caches[diretorio_modelo]
+
+    def embed_documents(self, texts : List[str]) -> List[List[float]]:
+        chaves = [EmbeddingCache.hash_texto(t) for t in texts]
+        encontrados = self.cache.obter(chaves)
+
+        # textos ausentes, sem repetição, na ordem em que aparecem
+        faltantes = {}
+        for chave, texto in zip(chaves, texts):
+            if chave not in encontrados and chave not in faltantes:
+                faltantes[chave] = texto
+
+        self.hits += len(texts) - len(faltantes)
+        self.misses += len(faltantes)
+        logging.info(f"Embeddings: {len(texts)} textos, {len(faltantes)} enviados ao modelo")
+        metricas = MetricsRegistry.padrao()
+        metricas.contar(CACHE, len(texts) - len(faltantes), cache="embeddings", resultado="hit")
+        metricas.contar(CACHE, len(faltantes), cache="embeddings", resultado="miss")
+
+        chaves_faltantes = list(faltantes)
+        for inicio in range(0, len(chaves_faltantes), self.tamanho_lote):
+            lote = chaves_faltantes[inicio:inicio + self.tamanho_lote]
+            textos_lote = [faltantes[c] for c in lote]
+            with metricas.cronometro(ETAPAS, componente="embeddings", etapa="embedding", modelo=self.model):
+                vetores = np.array(self.upstream.embed_documents(textos_lote), dtype=np.float32)
+            metricas.registrar_tokens(self.model, sum(len(t) for t in obter_tokenizer().encode_ordinary_batch(textos_lote)),
+                                      componente="embeddings")
+            self.cache.adicionar(lote, vetores)
+            encontrados.update(zip(lote, vetores))
+
+        return [encontrados[chave].tolist() for chave in chaves]
+
+    def embed_query(self, text : str) -> List[float]:
+        # perguntas não vão para o disco (seriam guardadas para sempre): só as recentes
+        # ficam em memória, para a mesma pergunta ser embedada uma vez por turno
+        with self.__consultas_lock:
+            if text in self.__consultas:
+                self.__consultas.move_to_end(text)
+                return self.__consultas[text]
+        with MetricsRegistry.padrao().cronometro(ETAPAS, componente="embeddings", etapa="query", modelo=self.model):
+            vetor = self.upstream.embed_query(text)
+        with self.__consultas_lock:
+            self.__consultas[text] = vetor
+            while len(self.__consultas) > MAX_CONSULTAS_MEMORIA:
+                self.__consultas.popitem(last=False)
+        return vetor
+
+
+class HashingFakeEmbeddings(Embeddings):
+    '''
+    Embedder local e determinístico (sem rede), para testes e benchmarks.
+    Conta quantas chamadas e textos recebeu.
+    '''
+    def __init__(self, dimensao : int = 1536, model : str = "fake-hashing") -> None:
+        self.dimensao = dimensao
+        self.model = model
+        self.chamadas = 0
+        self.textos_embedados = 0
+
+    def __vetor(self, texto : str) -> np.ndarray:
+        semente = int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "little")
+        vetor = np.random.default_rng(semente).standard_normal(self.dimensao).astype(np.float32)
+        return vetor / np.linalg.norm(vetor)
+
+    def embed_documents(self, texts : List[str]) -> List[List[float]]:
+        self.chamadas += 1
+        self.textos_embedados += len(texts)
+        return [self.__vetor(t).tolist() for t in texts]
+
+    def embed_query(self, text : str) -> List[float]:
+        return self.embed_documents([text])[0]
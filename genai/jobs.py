@@ -0,0 +1,299 @@
+# Fila local de jobs (transcrições, construção de índices) persistida em SQLite e
+# executada por um pool de threads do processo, fora das execuções do script do
+# Streamlit: o trabalho sobrevive a reruns e reconexões, e a interface apenas
+# consulta o status e o progresso pelo id do job.
+# Vários processos podem usar o mesmo arquivo (ex.: dois Streamlit, a CLI em modo
+# batch): cada fila renova periodicamente um prazo (lease) em seu nome, e só os jobs
+# de donos cujo prazo venceu (processo morto) são devolvidos à fila.
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+CAMINHO_PADRAO = "./cache/jobs.sqlite"
+WORKERS_PADRAO = 4
+# um dono que não renova o prazo por PRAZO_DONO_SEGUNDOS é considerado morto
+PRAZO_DONO_SEGUNDOS = 30
+INTERVALO_BATIMENTO_SEGUNDOS = 10
+
+PENDENTE = "pending"
+EXECUTANDO = "running"
+CONCLUIDO = "done"
+FALHOU = "failed"
+
+# handler(parametros, progresso) -> resultado serializável em JSON
+# progresso(fracao entre 0 e 1, mensagem)
+Handler = Callable[[dict, Callable[[float, str], None]], Any]
+# retomavel(parametros) -> se o job pode executar em outro processo que não o que o
+# submeteu (ex.: ids de mídias em memória só existem no processo que as registrou)
+Retomavel = Callable[[dict], bool]
+
+
+class JobQueue:
+    __padrao = None
+    __padrao_lock = threading.Lock()
+
+    @staticmethod
+    def padrao() -> "JobQueue":
+        '''
+        Fila compartilhada pelo processo, já com os handlers padrão e os workers iniciados
+        '''
+        with JobQueue.__padrao_lock:
+            if JobQueue.__padrao is None:
+                fila = JobQueue(CAMINHO_PADRAO)
+                registrar_handlers_padrao(fila)
+                fila.iniciar()
+                JobQueue.__padrao = fila
+            return JobQueue.__padrao
+
+    def __init__(self, caminho : str = CAMINHO_PADRAO, workers : int = WORKERS_PADRAO) -> None:
+        self.caminho = caminho
+        self.workers = workers
+        # identidade desta fila nos jobs que ela executa (e nos que só ela pode executar)
+        self.dono = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.__handlers : Dict[str, Handler] = {}
+        self.__retomaveis : Dict[str, Retomavel] = {}
+        self.__novo_job = threading.Event()
+        self.__parar = threading.Event()
+        self.__threads = []
+
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with self.__conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    parametros TEXT NOT NULL,
+                    assinatura TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progresso REAL NOT NULL DEFAULT 0,
+                    mensagem TEXT,
+                    resultado TEXT,
+                    erro TEXT,
+                    criado_em REAL NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, criado_em)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_assinatura ON jobs (assinatura, status)")
+            # dono: fila que executa o job; origem: fila que submeteu um job não retomável
+            colunas = [linha["name"] for linha in conn.execute("PRAGMA table_info(jobs)")]
+            for coluna in ("dono", "origem"):
+                if coluna not in colunas:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {coluna} TEXT")
+            conn.execute("CREATE TABLE IF NOT EXISTS donos (dono TEXT PRIMARY KEY, expira_em REAL NOT NULL)")
+
+    @contextmanager
+    def __conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def registrar(self, tipo : str, handler : Handler, retomavel : Optional[Retomavel] = None) -> None:
+        self.__handlers[tipo] = handler
+        if retomavel:
+            self.__retomaveis[tipo] = retomavel
+
+    def iniciar(self) -> None:
+        self.__renovar_prazo()
+        self.recuperar()
+
+        threads = [threading.Thread(target=self.__batimento, name="job-heartbeat", daemon=True)]
+        for i in range(self.workers):
+            threads.append(threading.Thread(target=self.__loop, name=f"job-worker-{i}", daemon=True))
+        for thread in threads:
+            thread.start()
+            self.__threads.append(thread)
+
+    def parar(self) -> None:
+        self.__parar.set()
+        self.__novo_job.set()
+        for thread in self.__threads:
+            thread.join()
+        with self.__conectar() as conn:
+            conn.execute("DELETE FROM donos WHERE dono = ?", (self.dono,))
+
+    def __renovar_prazo(self) -> None:
+        with self.__conectar() as conn:
+            conn.execute("INSERT OR REPLACE INTO donos (dono, expira_em) VALUES (?, ?)",
+                         (self.dono, time.time() + PRAZO_DONO_SEGUNDOS))
+
+    def __batimento(self) -> None:
+        while not self.__parar.wait(INTERVALO_BATIMENTO_SEGUNDOS):
+            try:
+                self.__renovar_prazo()
+                self.recuperar()
+            except sqlite3.Error as e:
+                logging.warning(f"Falha ao renovar o prazo da fila de jobs: {e}")
+
+    def recuperar(self) -> int:
+        '''
+        Devolve à fila os jobs que estavam executando em processos mortos (prazo vencido) e
+        marca como falhos os que só o processo morto podia executar. Devolve quantos mudaram.
+        '''
+        agora = time.time()
+        alterados = 0
+        with self.__conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            vivos = {linha["dono"] for linha in conn.execute("SELECT dono FROM donos WHERE expira_em >= ?", (agora,))}
+            for linha in conn.execute("SELECT id, tipo, parametros, status, dono, origem FROM jobs WHERE status IN (?, ?)",
+                                      (PENDENTE, EXECUTANDO)).fetchall():
+                executor_morto = linha["status"] == EXECUTANDO and linha["dono"] not in vivos
+                origem_morta = linha["origem"] is not None and linha["origem"] not in vivos
+                if not executor_morto and not origem_morta:
+                    continue
+                # jobs de versões anteriores não têm origem: a decisão é pelos parâmetros
+                retomavel = self.__retomaveis.get(linha["tipo"])
+                if origem_morta or (retomavel and not retomavel(json.loads(linha["parametros"]))):
+                    logging.warning(f"Job {linha['id']} ({linha['tipo']}) não pode ser retomado: o processo que o "
+                                    f"submeteu terminou")
+                    conn.execute("UPDATE jobs SET status = ?, erro = ?, atualizado_em = ? WHERE id = ?",
+                                 (FALHOU, "O processo foi reiniciado e a mídia do job não está mais disponível; "
+                                          "envie o arquivo novamente", agora, linha["id"]))
+                else:
+                    logging.warning(f"Job {linha['id']} ({linha['tipo']}) de {linha['dono']} volta para a fila")
+                    conn.execute("UPDATE jobs SET status = ?, progresso = 0, dono = NULL, atualizado_em = ? WHERE id = ?",
+                                 (PENDENTE, agora, linha["id"]))
+                alterados += 1
+            conn.execute("DELETE FROM donos WHERE expira_em < ?", (agora - PRAZO_DONO_SEGUNDOS,))
+            conn.execute("COMMIT")
+        if alterados:
+            self.__novo_job.set()
+        return alterados
+
+    def submeter(self, tipo : str, parametros : dict) -> str:
+        '''
+        Enfileira um job e devolve o seu id. Se um job idêntico ainda estiver pendente
+        ou executando, devolve o id dele em vez de duplicar o trabalho. Jobs não retomáveis
+        só são executados por esta fila.
+        '''
+        if tipo not in self.__handlers:
+            raise Exception(f"Tipo de job '{tipo}' não registrado")
+
+        parametros_json = json.dumps(parametros, sort_keys=True)
+        assinatura = hashlib.sha256(f"{tipo}:{parametros_json}".encode("utf-8")).hexdigest()
+        retomavel = self.__retomaveis.get(tipo)
+        origem = None if retomavel is None or retomavel(parametros) else self.dono
+
+        with self.__conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            existente = conn.execute("SELECT id FROM jobs WHERE assinatura = ? AND status IN (?, ?)",
+                                     (assinatura, PENDENTE, EXECUTANDO)).fetchone()
+            if existente:
+                conn.execute("COMMIT")
+                return existente["id"]
+
+            job_id = uuid.uuid4().hex
+            agora = time.time()
+            conn.execute("""INSERT INTO jobs (id, tipo, parametros, assinatura, status, origem, criado_em, atualizado_em)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                         (job_id, tipo, parametros_json, assinatura, PENDENTE, origem, agora, agora))
+            conn.execute("COMMIT")
+
+        self.__novo_job.set()
+        return job_id
+
+    def obter(self, job_id : str) -> Optional[dict]:
+        with self.__conectar() as conn:
+            linha = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not linha:
+            return None
+        job = dict(linha)
+        job["parametros"] = json.loads(job["parametros"])
+        job["resultado"] = json.loads(job["resultado"]) if job["resultado"] else None
+        return job
+
+    def __atualizar(self, job_id : str, **campos) -> None:
+        campos["atualizado_em"] = time.time()
+        atribuicoes = ", ".join(f"{campo} = ?" for campo in campos)
+        with self.__conectar() as conn:
+            conn.execute(f"UPDATE jobs SET {atribuicoes} WHERE id = ?", (*campos.values(), job_id))
+
+    def __reservar(self) -> Optional[sqlite3.Row]:
+        with self.__conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            linha = conn.execute("""SELECT * FROM jobs WHERE status = ? AND (origem IS NULL OR origem = ?)
+                                    ORDER BY criado_em LIMIT 1""", (PENDENTE, self.dono)).fetchone()
+            if linha:
+                conn.execute("UPDATE jobs SET status = ?, dono = ?, atualizado_em = ? WHERE id = ?",
+                             (EXECUTANDO, self.dono, time.time(), linha["id"]))
+            conn.execute("COMMIT")
+        return linha
+
+    def __loop(self) -> None:
+        while not self.__parar.is_set():
+            linha = self.__reservar()
+            if not linha:
+                self.__novo_job.wait(timeout=1.0)
+                self.__novo_job.clear()
+                continue
+            self.__executar(linha)
+
+    def __executar(self, linha : sqlite3.Row) -> None:
+        job_id = linha["id"]
+
+        def progresso(fracao : float, mensagem : str = None) -> None:
+            self.__atualizar(job_id, progresso=fracao, mensagem=mensagem)
+
+        logging.info(f"Executando job {job_id} ({linha['tipo']})")
+        try:
+            handler = self.__handlers[linha["tipo"]]
+            resultado = handler(json.loads(linha["parametros"]), progresso)
+            self.__atualizar(job_id, status=CONCLUIDO, progresso=1.0, resultado=json.dumps(resultado))
+        except Exception as e:
+            logging.error(f"Job {job_id} falhou: {e}")
+            self.__atualizar(job_id, status=FALHOU, erro=f"{e}\n{traceback.format_exc()}")
+
+
+def _job_transcricao(parametros : dict, progresso : Callable[[float, str], None]) -> dict:
+    from genai.media_io import MediaSource
+    from genai.transcription import Transcription
+
+    def on_progress(concluidos : int, total : int, indice : int, texto : str) -> None:
+        progresso(concluidos / total, f"{concluidos}/{total} chunks")
+
+    # "fonte" é um caminho ou o id de uma MediaSource registrada (uploads e downloads em memória);
+    # esta fica retida durante o job, para o registro não fechá-la no meio da leitura
+    fonte = parametros["fonte"]
+    retida = None if os.path.isfile(fonte) else MediaSource.obter(fonte, reter=True)
+    try:
+        t = Transcription(retida or fonte, modo=parametros.get("modo", "openai"), on_progress=on_progress)
+        texto = t.obter_transcricao_audio()
+    finally:
+        if retida:
+            retida.liberar()
+    return {"texto": texto, "segmentos": t.exportar("json"),
+            "custo": t.last_transcription_cost, "cache": t.last_transcription_cached,
+            "bytes_enviados": t.last_bytes_uploaded, "segundos_codificacao": t.last_encode_seconds}
+
+
+def _job_indice(parametros : dict, progresso : Callable[[float, str], None]) -> dict:
+    from genai.chat_with_embeddings import ChatWithEmbeddings
+
+    progresso(0.0, "Loading and indexing...")
+    loader = ChatWithEmbeddings.create_loader(parametros["path"])
+    c = ChatWithEmbeddings(loader, document_id=parametros.get("document_id"))
+    resumo = c.build_index()
+    # a UI se conecta ao índice e mostra a prévia sem ler o arquivo de novo
+    previa = None
+    if hasattr(loader, "preview"):
+        previa = loader.preview(10).to_json(orient="split", date_format="iso", default_handler=str)
+    return {"resumo": str(resumo), "adicionados": resumo.adicionados,
+            "removidos": resumo.removidos, "inalterados": resumo.inalterados,
+            "indice": c.index_info, "previa": previa}
+
+
+def registrar_handlers_padrao(fila : JobQueue) -> None:
+    # ids de fontes registradas só existem no processo que as registrou
+    fila.registrar("transcricao", _job_transcricao, retomavel=lambda parametros: os.path.isfile(parametros["fonte"]))
+    fila.registrar("indice", _job_indice, retomavel=lambda parametros: os.path.isfile(parametros["path"]))
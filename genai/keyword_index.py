@@ -0,0 +1,338 @@
+# Índice invertido (BM25) em processo, construído a partir dos mesmos chunks do índice
+# vetorial: acha as correspondências exatas (ids, nomes, números) que a busca densa perde.
+# As listas de ocorrências ficam em arrays NumPy contíguos (formato CSR: chunks e
+# frequências de cada termo, em ordem), mapeados do disco com memmap quando persistidas.
+# Documentos tabulares também têm um termo por "coluna = valor", para filtros exatos.
+import bisect
+import json
+import logging
+import os
+import re
+from array import array
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+
+ARQUIVO_VOCABULARIO = "vocabulario.txt"
+ARQUIVO_INDPTR = "indptr.npy"
+ARQUIVO_CHUNKS = "chunks.npy"
+ARQUIVO_FREQUENCIAS = "frequencias.npy"
+ARQUIVO_COMPRIMENTOS = "comprimentos.npy"
+ARQUIVO_DOCUMENTOS = "documentos.bin"
+ARQUIVO_OFFSETS = "offsets.npy"
+ARQUIVO_METADATA = "metadata.json"
+
+K1 = 1.2
+B = 0.75
+# termos em uma fração maior dos chunks são ignorados na busca sem filtros (ver buscar)
+FRACAO_TERMO_COMUM = 0.5
+
+_TOKEN = re.compile(r"\w+")
+_SEM_ACENTOS = str.maketrans("áàâãäéèêëíìîïóòôõöúùûüçñ", "aaaaaeeeeiiiiooooouuuucn")
+# linhas "coluna: valor" do texto das linhas de tabela (DataFrameRowsLoader e CSVLoader)
+_CAMPO = re.compile(r"^([^:\n]+): ?(.*)$", re.MULTILINE)
+# metadados que indicam um chunk de linhas de tabela
+METADADOS_TABELA = ("row_start", "row")
+# posições das linhas: não servem de filtro e teriam um termo novo por chunk
+METADADOS_IGNORADOS = {"row_start", "row_end", "row"}
+_INTEIRO_COM_DECIMAIS = re.compile(r"^(-?\d+)\.0+$")
+# separa a coluna do valor nos termos de campo (nunca aparece num token de texto)
+_SEPARADOR_CAMPO = "\x1f"
+
+
+def tokenizar(texto : str) -> List[str]:
+    return _TOKEN.findall(texto.casefold().translate(_SEM_ACENTOS))
+
+
+def normalizar_valor(valor : Any) -> str:
+    '''
+    Forma comparada nos filtros: sem caixa e espaços extras, e "97.0" == "97"
+    (o pandas lê colunas inteiras com valores ausentes como float)
+    '''
+    texto = " ".join(str(valor).split()).casefold()
+    if texto.endswith("0") and "." in texto:
+        return _INTEIRO_COM_DECIMAIS.sub(r"\1", texto)
+    return texto
+
+
+@lru_cache(maxsize=4096)
+def _normalizar_coluna(coluna : str) -> str:
+    # as mesmas colunas se repetem em todas as linhas
+    return normalizar_valor(coluna) + _SEPARADOR_CAMPO
+
+
+def termo_campo(coluna : str, valor : Any) -> str:
+    return _normalizar_coluna(str(coluna)) + normalizar_valor(valor)
+
+
+def termos_campos(texto : str, metadados : dict) -> Iterator[str]:
+    '''
+    Termos "coluna = valor" de um chunk: as linhas "coluna: valor" dos chunks de tabela e
+    os metadados simples (o DataFrameLoader guarda as demais colunas nos metadados)
+    '''
+    if any(chave in metadados for chave in METADADOS_TABELA):
+        for coluna, valor in _CAMPO.findall(texto):
+            yield termo_campo(coluna, valor)
+    for chave, valor in metadados.items():
+        if chave not in METADADOS_IGNORADOS and isinstance(valor, (str, int, float, bool)):
+            yield termo_campo(chave, valor)
+
+
+def interpretar_filtros(texto : str) -> Dict[str, str]:
+    '''
+    "coluna=valor; outra coluna=valor" -> {coluna: valor}
+    '''
+    filtros = {}
+    for parte in texto.split(";"):
+        if not parte.strip():
+            continue
+        coluna, separador, valor = parte.partition("=")
+        if not separador or not coluna.strip():
+            raise Exception(f"Filtro inválido: '{parte.strip()}' (use coluna=valor)")
+        filtros[coluna.strip()] = valor.strip()
+    return filtros
+
+
+def atende_filtros(documento : Document, filtros : Dict[str, Any]) -> bool:
+    '''
+    Se o chunk tem uma linha de tabela ou metadado com cada coluna igual ao valor pedido
+    (o mesmo critério de KeywordIndex.filtrar, para resultados de outros índices)
+    '''
+    termos = set(termos_campos(documento.page_content, documento.metadata))
+    return all(termo_campo(coluna, valor) in termos for coluna, valor in filtros.items())
+
+
+def _ordenar_estavel(chaves : np.ndarray) -> np.ndarray:
+    '''
+    Permutação que ordena chaves uint32 de forma estável, em tempo linear: radix sort em
+    duas passadas de 16 bits (o argsort estável do NumPy é um radix sort para inteiros de 16 bits)
+    '''
+    ordem = np.argsort((chaves & 0xFFFF).astype(np.uint16), kind="stable")
+    if chaves.size and int(chaves.max()) > 0xFFFF:
+        ordem = ordem[np.argsort((chaves[ordem] >> 16).astype(np.uint16), kind="stable")]
+    return ordem
+
+
+def _em_comum(a : np.ndarray, b : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Índices em a e em b dos valores comuns a dois arrays ordenados e sem repetições;
+    o menor é procurado no maior por busca binária
+    '''
+    if len(a) > len(b):
+        em_b, em_a = _em_comum(b, a)
+        return em_a, em_b
+    if len(b) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    posicoes = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    encontrados = b[posicoes] == a
+    return np.nonzero(encontrados)[0], posicoes[encontrados]
+
+
+def _top_k(scores : np.ndarray, k : int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # argpartition seleciona os k maiores em O(n); só eles são ordenados
+    melhores = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return melhores[np.argsort(-scores[melhores], kind="stable")]
+
+
+class KeywordIndex:
+    '''
+    Índice BM25 somente leitura: construir() monta tudo de uma vez a partir dos chunks
+    (em tempo linear no número de tokens), salvar() persiste e carregar() o reabre
+    com os arrays mapeados do disco.
+    '''
+    def __init__(self, vocabulario : List[str], indptr : np.ndarray, chunks : np.ndarray, frequencias : np.ndarray,
+                 comprimentos : np.ndarray, documentos : np.ndarray, offsets : np.ndarray,
+                 metadata : Optional[dict] = None) -> None:
+        # vocabulario em ordem: o id de um termo é a sua posição (busca binária)
+        self.__vocabulario = vocabulario
+        self.__indptr = indptr
+        self.__chunks = chunks
+        self.__frequencias = frequencias
+        self.__documentos = documentos
+        self.__offsets = offsets
+        self.__comprimentos = comprimentos
+        self.metadata = metadata or {}
+        tokens = np.asarray(comprimentos, dtype=np.float32)
+        media = float(tokens.mean()) if len(tokens) else 1.0
+        # parte do denominador do BM25 que só depende do chunk
+        self.__normas = K1 * (1 - B + B * tokens / max(media, 1e-6))
+
+    def __len__(self) -> int:
+        return len(self.__normas)
+
+    @classmethod
+    def construir(cls, textos : List[str], metadados : List[dict], metadata : Optional[dict] = None) -> "KeywordIndex":
+        vocabulario : Dict[str, int] = {}
+        termos, frequencias, distintos, comprimentos = array("I"), array("I"), array("I"), array("I")
+        documentos, offsets = bytearray(), array("Q", [0])
+
+        for texto, meta in zip(textos, metadados):
+            tokens = tokenizar(texto)
+            contagem = Counter(tokens)
+            contagem.update(termos_campos(texto, meta))
+            # len(vocabulario) é avaliado antes da inserção: ids sequenciais para os termos novos
+            termos.extend([vocabulario.setdefault(termo, len(vocabulario)) for termo in contagem])
+            frequencias.extend(contagem.values())
+            distintos.append(len(contagem))
+            comprimentos.append(len(tokens))
+            documentos += json.dumps([texto, meta], ensure_ascii=False).encode("utf-8")
+            offsets.append(len(documentos))
+
+        # ids em ordem alfabética dos termos
+        ordenados = sorted(vocabulario)
+        novos_ids = np.empty(len(vocabulario), dtype=np.uint32)
+        novos_ids[np.fromiter((vocabulario[t] for t in ordenados), dtype=np.int64, count=len(ordenados))] = \
+            np.arange(len(ordenados), dtype=np.uint32)
+        termos = novos_ids[np.frombuffer(termos, dtype=np.uint32)] if len(termos) else np.zeros(0, dtype=np.uint32)
+        chunks = np.repeat(np.arange(len(distintos), dtype=np.uint32), np.frombuffer(distintos, dtype=np.uint32))
+
+        # agrupa as ocorrências por termo; a ordenação estável mantém os chunks em ordem
+        ordem = _ordenar_estavel(termos)
+        indptr = np.zeros(len(ordenados) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(termos, minlength=len(ordenados)), out=indptr[1:])
+        frequencias = np.minimum(np.frombuffer(frequencias, dtype=np.uint32), np.iinfo(np.uint16).max)
+
+        return cls(ordenados, indptr, chunks[ordem], frequencias[ordem].astype(np.uint16),
+                   np.frombuffer(comprimentos, dtype=np.uint32), np.frombuffer(bytes(documentos), dtype=np.uint8),
+                   np.frombuffer(offsets, dtype=np.uint64), metadata)
+
+    @classmethod
+    def from_documents(cls, documentos : List[Document], metadata : Optional[dict] = None) -> "KeywordIndex":
+        return cls.construir([d.page_content for d in documentos], [d.metadata for d in documentos], metadata)
+
+    def __id_termo(self, termo : str) -> Optional[int]:
+        posicao = bisect.bisect_left(self.__vocabulario, termo)
+        if posicao < len(self.__vocabulario) and self.__vocabulario[posicao] == termo:
+            return posicao
+        return None
+
+    def __ocorrencias(self, termo : str) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        (chunks, frequências) do termo, em ordem de chunk
+        '''
+        id_ = self.__id_termo(termo)
+        if id_ is None:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint16)
+        inicio, fim = int(self.__indptr[id_]), int(self.__indptr[id_ + 1])
+        return self.__chunks[inicio:fim], self.__frequencias[inicio:fim]
+
+    def documento(self, posicao : int) -> Document:
+        inicio, fim = int(self.__offsets[posicao]), int(self.__offsets[posicao + 1])
+        texto, metadados = json.loads(bytes(self.__documentos[inicio:fim]).decode("utf-8"))
+        return Document(page_content=texto, metadata=metadados)
+
+    def filtrar(self, filtros : Dict[str, Any]) -> np.ndarray:
+        '''
+        Posições (em ordem) dos chunks com uma linha de tabela ou metadado em que cada
+        coluna tem exatamente o valor pedido
+        '''
+        resultado = None
+        for coluna, valor in filtros.items():
+            chunks, _ = self.__ocorrencias(termo_campo(coluna, valor))
+            resultado = chunks if resultado is None else resultado[_em_comum(resultado, chunks)[0]]
+            if len(resultado) == 0:
+                break
+        return np.asarray(resultado if resultado is not None else np.arange(len(self)), dtype=np.int64)
+
+    def __termos_consulta(self, consulta : str) -> List[Tuple[np.ndarray, np.ndarray, float]]:
+        '''
+        (chunks, frequências, idf) de cada termo distinto da consulta que está no índice
+        '''
+        termos = []
+        for termo in set(tokenizar(consulta)):
+            chunks, frequencias = self.__ocorrencias(termo)
+            if len(chunks):
+                termos.append((chunks, frequencias, float(np.log1p((len(self) - len(chunks) + 0.5) / (len(chunks) + 0.5)))))
+        return termos
+
+    def __bm25(self, chunks : np.ndarray, frequencias : np.ndarray, idf : float) -> np.ndarray:
+        tf = frequencias.astype(np.float32)
+        return idf * tf * (K1 + 1) / (tf + self.__normas[chunks])
+
+    def buscar(self, consulta : str, k : int = 4, candidatos : Optional[np.ndarray] = None) -> List[Tuple[Document, float]]:
+        '''
+        (documento, score BM25) dos k chunks mais relevantes. Com candidatos (ex.: o
+        resultado de filtrar), só eles são considerados, inclusive os sem nenhum termo
+        da consulta (em ordem de linha)
+        '''
+        if len(self) == 0:
+            return []
+        termos = self.__termos_consulta(consulta)
+
+        if candidatos is not None:
+            scores = np.zeros(len(candidatos), dtype=np.float32)
+            for chunks, frequencias, idf in termos:
+                em_candidatos, em_chunks = _em_comum(candidatos, chunks)
+                scores[em_candidatos] += self.__bm25(chunks[em_chunks], frequencias[em_chunks], idf)
+            posicoes = candidatos
+        else:
+            # termos presentes em mais da metade dos chunks (ex.: o nome de uma coluna) quase não
+            # mudam a ordem (idf perto de 0) e são os mais caros: ficam de fora se houver outros
+            termos = [t for t in termos if len(t[0]) <= len(self) * FRACAO_TERMO_COMUM] or termos
+            ocorrencias = sum(len(chunks) for chunks, _, _ in termos)
+            if ocorrencias == 0:
+                return []
+            if ocorrencias < len(self) // 8:
+                # poucos chunks com algum termo: soma só entre eles
+                posicoes, inverso = np.unique(np.concatenate([chunks for chunks, _, _ in termos]), return_inverse=True)
+                scores = np.bincount(inverso, weights=np.concatenate([self.__bm25(*termo) for termo in termos]))
+            else:
+                scores = np.zeros(len(self), dtype=np.float32)
+                for termo in termos:
+                    # os chunks de um termo são distintos: a soma indexada é segura
+                    scores[termo[0]] += self.__bm25(*termo)
+                posicoes = np.arange(len(self))
+
+        melhores = _top_k(scores, k)
+        if candidatos is None:
+            melhores = melhores[scores[melhores] > 0]
+        return [(self.documento(int(posicoes[i])), float(scores[i])) for i in melhores]
+
+    def salvar(self, diretorio : str) -> None:
+        os.makedirs(diretorio, exist_ok=True)
+        # escreve em arquivos temporários e troca; os metadados por último marcam o índice completo
+        arrays = {ARQUIVO_INDPTR: self.__indptr, ARQUIVO_CHUNKS: self.__chunks,
+                  ARQUIVO_FREQUENCIAS: self.__frequencias, ARQUIVO_OFFSETS: self.__offsets,
+                  ARQUIVO_COMPRIMENTOS: self.__comprimentos}
+        for arquivo, valores in arrays.items():
+            with open(os.path.join(diretorio, arquivo + ".tmp"), "wb") as f:
+                np.save(f, np.ascontiguousarray(valores))
+        with open(os.path.join(diretorio, ARQUIVO_DOCUMENTOS + ".tmp"), "wb") as f:
+            f.write(memoryview(np.ascontiguousarray(self.__documentos)))
+        with open(os.path.join(diretorio, ARQUIVO_VOCABULARIO + ".tmp"), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.__vocabulario))
+        metadata = dict(self.metadata, chunks=len(self), termos=len(self.__vocabulario),
+                        ocorrencias=int(len(self.__chunks)))
+        with open(os.path.join(diretorio, ARQUIVO_METADATA + ".tmp"), "w") as f:
+            json.dump(metadata, f)
+        for arquivo in (*arrays, ARQUIVO_DOCUMENTOS, ARQUIVO_VOCABULARIO, ARQUIVO_METADATA):
+            os.replace(os.path.join(diretorio, arquivo + ".tmp"), os.path.join(diretorio, arquivo))
+
+    @staticmethod
+    def ler_metadata(diretorio : str) -> Optional[dict]:
+        caminho = os.path.join(diretorio, ARQUIVO_METADATA)
+        if not os.path.isfile(caminho):
+            return None
+        with open(caminho) as f:
+            return json.load(f)
+
+    @classmethod
+    def carregar(cls, diretorio : str) -> Optional["KeywordIndex"]:
+        metadata = KeywordIndex.ler_metadata(diretorio)
+        if metadata is None:
+            return None
+        abrir = lambda arquivo: np.load(os.path.join(diretorio, arquivo), mmap_mode="r")
+        with open(os.path.join(diretorio, ARQUIVO_VOCABULARIO), encoding="utf-8") as f:
+            vocabulario = f.read().split("\n") if metadata.get("termos") else []
+        caminho_documentos = os.path.join(diretorio, ARQUIVO_DOCUMENTOS)
+        documentos = (np.memmap(caminho_documentos, dtype=np.uint8, mode="r")
+                      if os.path.getsize(caminho_documentos) else np.zeros(0, dtype=np.uint8))
+        indice = cls(vocabulario, abrir(ARQUIVO_INDPTR), abrir(ARQUIVO_CHUNKS), abrir(ARQUIVO_FREQUENCIAS),
+                     abrir(ARQUIVO_COMPRIMENTOS), documentos, abrir(ARQUIVO_OFFSETS), metadata)
+        logging.info(f"Índice de palavras carregado de '{diretorio}' ({len(indice)} chunks, {len(vocabulario)} termos)")
+        return indice
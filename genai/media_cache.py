@@ -0,0 +1,208 @@
+# Cache de mídias e metadados baixados da rede (listas de legendas e legendas do
+# YouTube, áudios, arquivos de URLs), compartilhado por todas as sessões do processo.
+# As entradas expiram por TTL; as de URLs são revalidadas com ETag/Last-Modified.
+# O total é limitado em bytes (descarte LRU) e pedidos simultâneos da mesma chave
+# compartilham um único download em andamento.
+import logging
+import mimetypes
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from genai.media_io import MediaSource
+from genai.metrics import MetricsRegistry, CACHE, ETAPAS, BYTES
+from typing import Any, Callable, Dict, Optional
+
+MAX_BYTES_PADRAO = 512 * 1024 * 1024  # 512 MB
+TTL_METADADOS = 60 * 60  # listas de legendas
+TTL_MIDIA = 24 * 60 * 60  # áudios e legendas de um vídeo não mudam
+TTL_URL = 60 * 60  # depois disso a URL é revalidada (ETag/Last-Modified)
+TIMEOUT_URL_SEGUNDOS = 60
+
+
+def tamanho_estimado(valor : Any) -> int:
+    if isinstance(valor, MediaSource):
+        return valor.tamanho
+    if isinstance(valor, (bytes, str)):
+        return len(valor)
+    return len(repr(valor))
+
+
+@dataclass
+class Entrada:
+    valor : Any
+    tamanho : int
+    expira_em : float
+    etag : Optional[str] = None
+    last_modified : Optional[str] = None
+
+    @property
+    def expirada(self) -> bool:
+        return time.time() >= self.expira_em
+
+    @property
+    def descartavel(self) -> bool:
+        # uma fonte fechada (ex.: descartada do registro de fontes) não serve nem para revalidação
+        return isinstance(self.valor, MediaSource) and self.valor.fechada
+
+
+class _EmAndamento:
+    def __init__(self) -> None:
+        self.concluido = threading.Event()
+        self.entrada : Optional[Entrada] = None
+        self.erro : Optional[BaseException] = None
+
+
+class MediaCache:
+    '''
+    chave (ex.: "youtube:audio:<id>", "url:<url>") -> valor, com TTL e limite de bytes.
+    As entradas expiradas continuam guardadas até serem descartadas, para a revalidação.
+    Uma MediaSource descartada não é fechada: quem ainda a usa (ex.: um job) a mantém viva.
+    '''
+    __padrao = None
+    __padrao_lock = threading.Lock()
+
+    @staticmethod
+    def padrao() -> "MediaCache":
+        '''
+        Instância compartilhada pelo processo (todas as sessões do Streamlit)
+        '''
+        with MediaCache.__padrao_lock:
+            if MediaCache.__padrao is None:
+                MediaCache.__padrao = MediaCache()
+                MetricsRegistry.padrao().registrar_coletor("genai_media_cache", MediaCache.__padrao.estatisticas)
+            return MediaCache.__padrao
+
+    def __init__(self, max_bytes : int = MAX_BYTES_PADRAO) -> None:
+        self.max_bytes = max_bytes
+        self.__entradas : "OrderedDict[str, Entrada]" = OrderedDict()
+        self.__em_andamento : Dict[str, _EmAndamento] = {}
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.__contadores = {"hits": 0, "misses": 0, "compartilhados": 0, "revalidados": 0, "descartados": 0}
+
+    def __contar(self, resultado : str) -> None:
+        # chamado com self.__lock adquirido
+        self.__contadores[resultado] += 1
+        MetricsRegistry.padrao().contar(CACHE, cache="media", resultado=resultado)
+
+    def obter(self, chave : str) -> Any:
+        '''
+        Valor ainda válido da chave, ou None (sem buscar nada)
+        '''
+        with self.__lock:
+            entrada = self.__entradas.get(chave)
+            if entrada is None or entrada.expirada or entrada.descartavel:
+                return None
+            self.__entradas.move_to_end(chave)
+            return entrada.valor
+
+    def __guardar(self, chave : str, entrada : Entrada) -> None:
+        with self.__lock:
+            anterior = self.__entradas.pop(chave, None)
+            if anterior is not None:
+                self.__bytes -= anterior.tamanho
+            if entrada.tamanho > self.max_bytes:
+                logging.info(f"'{chave}' ({entrada.tamanho} bytes) não cabe no cache de mídia")
+                return
+            self.__entradas[chave] = entrada
+            self.__bytes += entrada.tamanho
+            while self.__bytes > self.max_bytes:
+                _, descartada = self.__entradas.popitem(last=False)
+                self.__bytes -= descartada.tamanho
+                self.__contadores["descartados"] += 1
+
+    def __unico(self, chave : str, produzir : Callable[[Optional[Entrada]], Entrada]) -> Any:
+        '''
+        Valor válido da chave ou produzir(entrada_expirada_ou_None), executado por um
+        único chamador por vez: os demais esperam e recebem o mesmo resultado
+        '''
+        with self.__lock:
+            entrada = self.__entradas.get(chave)
+            if entrada is not None and entrada.descartavel:
+                entrada = None
+            if entrada is not None and not entrada.expirada:
+                self.__entradas.move_to_end(chave)
+                self.__contar("hits")
+                return entrada.valor
+            andamento = self.__em_andamento.get(chave)
+            dono = andamento is None
+            if dono:
+                andamento = self.__em_andamento[chave] = _EmAndamento()
+                self.__contar("misses")
+            else:
+                self.__contar("compartilhados")
+
+        if not dono:
+            andamento.concluido.wait()
+            if andamento.erro is not None:
+                raise andamento.erro
+            return andamento.entrada.valor
+
+        try:
+            andamento.entrada = produzir(entrada)
+            self.__guardar(chave, andamento.entrada)
+            return andamento.entrada.valor
+        except BaseException as e:
+            # falhas não são guardadas: o próximo pedido tenta de novo
+            andamento.erro = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__em_andamento[chave]
+            andamento.concluido.set()
+
+    def obter_ou_calcular(self, chave : str, calcular : Callable[[], Any], ttl : float = TTL_MIDIA,
+                          tamanho : Callable[[Any], int] = tamanho_estimado) -> Any:
+        def produzir(_ : Optional[Entrada]) -> Entrada:
+            valor = calcular()
+            return Entrada(valor, tamanho(valor), time.time() + ttl)
+        return self.__unico(chave, produzir)
+
+    def obter_url(self, url : str, ttl : float = TTL_URL) -> MediaSource:
+        '''
+        Conteúdo da URL como MediaSource (o nome tem a extensão do content type).
+        Depois do TTL, a URL é revalidada e o conteúdo só é baixado de novo se mudou.
+        '''
+        def produzir(anterior : Optional[Entrada]) -> Entrada:
+            pedido = urllib.request.Request(url)
+            if anterior is not None and anterior.etag:
+                pedido.add_header("If-None-Match", anterior.etag)
+            if anterior is not None and anterior.last_modified:
+                pedido.add_header("If-Modified-Since", anterior.last_modified)
+            metricas = MetricsRegistry.padrao()
+            try:
+                with metricas.cronometro(ETAPAS, componente="media_cache", etapa="url_download"), \
+                     urllib.request.urlopen(pedido, timeout=TIMEOUT_URL_SEGUNDOS) as resposta:
+                    extensao = mimetypes.guess_extension(resposta.headers.get_content_type()) or ""
+                    fonte = MediaSource.from_stream(uuid.uuid4().hex + extensao, resposta)
+                metricas.contar(BYTES, fonte.tamanho, tipo="download", origem="url")
+                return Entrada(fonte, fonte.tamanho, time.time() + ttl,
+                               resposta.headers.get("ETag"), resposta.headers.get("Last-Modified"))
+            except urllib.error.HTTPError as e:
+                if e.code == 304 and anterior is not None:
+                    with self.__lock:
+                        self.__contar("revalidados")
+                    return replace(anterior, expira_em=time.time() + ttl)
+                raise
+
+        return self.__unico(f"url:{url}", produzir)
+
+    def remover(self, chave : str) -> None:
+        with self.__lock:
+            entrada = self.__entradas.pop(chave, None)
+            if entrada is not None:
+                self.__bytes -= entrada.tamanho
+
+    def limpar(self) -> None:
+        with self.__lock:
+            self.__entradas.clear()
+            self.__bytes = 0
+
+    def estatisticas(self) -> dict:
+        with self.__lock:
+            return dict(self.__contadores, entradas=len(self.__entradas), bytes=self.__bytes,
+                        max_bytes=self.max_bytes)
@@ -0,0 +1,378 @@
+# Camada de I/O para mídias recebidas por upload ou rede: os bytes ficam em memória
+# e só vão para um arquivo temporário acima de um limite de tamanho (o arquivo é
+# anônimo e some quando a fonte é fechada). O ffmpeg lê diretamente da fonte pelo
+# stdin, sem cópias intermediárias em disco. Os bytes copiados são contabilizados.
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from genai.metrics import MetricsRegistry
+from typing import BinaryIO, Dict, Iterator, Optional
+
+LIMITE_MEMORIA_PADRAO = 32 * 1024 * 1024  # 32 MB
+TAMANHO_BLOCO = 1024 * 1024
+MAX_FONTES_REGISTRADAS = 16
+# final do stderr do ffmpeg guardado para a mensagem de erro
+MAX_BYTES_STDERR = 64 * 1024
+DIRETORIO_TEMPORARIO = "./tmp/"
+
+_metricas = {"bytes_copiados": 0, "bytes_em_disco": 0, "fontes": 0, "transbordos": 0}
+_metricas_lock = threading.Lock()
+
+
+def _contar(**incrementos) -> None:
+    with _metricas_lock:
+        for nome, valor in incrementos.items():
+            _metricas[nome] += valor
+
+
+def metricas() -> Dict[str, int]:
+    '''
+    Contadores do processo: bytes copiados para/entre fontes, bytes que transbordaram
+    para disco, fontes criadas e quantas delas transbordaram
+    '''
+    with _metricas_lock:
+        return dict(_metricas)
+
+
+MetricsRegistry.padrao().registrar_coletor("genai_media_io", metricas)
+
+
+class MediaSource:
+    '''
+    Mídia identificada por um nome (usado para a extensão), vinda de um arquivo
+    existente (caminho) ou de bytes mantidos num SpooledTemporaryFile.
+    '''
+    __registradas : "OrderedDict[str, MediaSource]" = OrderedDict()
+    __registradas_lock = threading.Lock()
+
+    def __init__(self, nome : str, caminho : Optional[str] = None,
+                 limite_memoria : int = LIMITE_MEMORIA_PADRAO) -> None:
+        self.nome = nome
+        self.caminho = caminho
+        self.tamanho = os.path.getsize(caminho) if caminho else 0
+        self.__limite_memoria = limite_memoria
+        self.__spool = None if caminho else tempfile.SpooledTemporaryFile(max_size=limite_memoria)
+        self.__materializado = None
+        self.__sha256 = None
+        self.__lock = threading.Lock()
+        # quantos usuários (ex.: jobs em execução) impedem o registro de fechar a fonte
+        self.__retencoes = 0
+        _contar(fontes=1)
+
+    @staticmethod
+    def from_path(caminho : str) -> "MediaSource":
+        return MediaSource(os.path.basename(caminho), caminho=caminho)
+
+    @staticmethod
+    def from_bytes(nome : str, dados : bytes) -> "MediaSource":
+        fonte = MediaSource(nome)
+        fonte.write(dados)
+        return fonte
+
+    @staticmethod
+    def from_stream(nome : str, leitor : BinaryIO, limite_memoria : int = LIMITE_MEMORIA_PADRAO) -> "MediaSource":
+        fonte = MediaSource(nome, limite_memoria=limite_memoria)
+        while bloco := leitor.read(TAMANHO_BLOCO):
+            fonte.write(bloco)
+        return fonte
+
+    @property
+    def extensao(self) -> str:
+        return self.nome.split(".")[-1].lower()
+
+    @property
+    def fechada(self) -> bool:
+        # ex.: descartada do registro de fontes
+        return self.__spool is not None and self.__spool.closed
+
+    @property
+    def em_memoria(self) -> bool:
+        return self.__spool is not None and not self.__spool._rolled
+
+    def write(self, dados : bytes) -> int:
+        '''
+        Acrescenta bytes à fonte (permite usá-la como destino de downloads)
+        '''
+        if self.__spool is None:
+            raise Exception("Fontes baseadas em arquivo são somente leitura")
+        with self.__lock:
+            estava_em_disco = self.__spool._rolled
+            self.__spool.seek(0, os.SEEK_END)
+            escritos = self.__spool.write(dados)
+            self.tamanho += escritos
+            self.__sha256 = None
+            transbordou = not estava_em_disco and self.__spool._rolled
+        if transbordou:
+            # o que estava em memória também foi copiado para o disco
+            _contar(bytes_copiados=escritos, bytes_em_disco=self.tamanho, transbordos=1)
+            logging.info(f"'{self.nome}' ultrapassou {self.__limite_memoria} bytes e foi para um arquivo temporário")
+        else:
+            _contar(bytes_copiados=escritos, bytes_em_disco=escritos if estava_em_disco else 0)
+        return escritos
+
+    def blocos(self, tamanho_bloco : int = TAMANHO_BLOCO) -> Iterator[bytes]:
+        if self.caminho:
+            with open(self.caminho, "rb") as f:
+                while bloco := f.read(tamanho_bloco):
+                    yield bloco
+            return
+        posicao = 0
+        while True:
+            with self.__lock:
+                if self.__spool.closed:
+                    raise Exception(f"A mídia '{self.nome}' foi fechada durante a leitura")
+                self.__spool.seek(posicao)
+                bloco = self.__spool.read(tamanho_bloco)
+            if not bloco:
+                return
+            posicao += len(bloco)
+            yield bloco
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.blocos())
+
+    def sha256(self) -> str:
+        if self.__sha256 is None:
+            sha = hashlib.sha256()
+            for bloco in self.blocos():
+                sha.update(bloco)
+            self.__sha256 = sha.hexdigest()
+        return self.__sha256
+
+    def alimentar(self, destino : BinaryIO) -> threading.Thread:
+        '''
+        Copia a fonte para destino (ex.: stdin do ffmpeg) numa thread, fechando-o ao final.
+        Um erro lendo a fonte fica em thread.erro: para o leitor, o stream apenas terminou
+        antes, então quem consome a saída deve conferi-lo (ver verificar_alimentacao).
+        '''
+        def copiar() -> None:
+            try:
+                for bloco in self.blocos():
+                    try:
+                        destino.write(bloco)
+                    except (BrokenPipeError, ValueError):
+                        # o leitor terminou antes (ex.: leitura de um intervalo)
+                        return
+            except Exception as e:
+                thread.erro = e
+            finally:
+                try:
+                    destino.close()
+                except (BrokenPipeError, OSError):
+                    pass
+
+        thread = threading.Thread(target=copiar, daemon=True)
+        thread.erro = None
+        thread.start()
+        return thread
+
+    def verificar_alimentacao(self, thread : threading.Thread) -> None:
+        '''
+        Espera a cópia iniciada por alimentar e repassa o erro de leitura, se houve
+        '''
+        thread.join()
+        if thread.erro is not None:
+            raise Exception(f"Falha lendo a mídia '{self.nome}': {thread.erro}") from thread.erro
+
+    def probe(self) -> dict:
+        '''
+        Mesmo resultado de ffmpeg.probe, lendo a fonte pelo stdin se ela não tiver caminho
+        '''
+        comando = ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json",
+                   self.caminho or "pipe:0"]
+        processo = subprocess.Popen(comando, stdin=None if self.caminho else subprocess.PIPE,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        alimentador = None if self.caminho else self.alimentar(processo.stdin)
+        saida, erro = processo.communicate()
+        if alimentador:
+            self.verificar_alimentacao(alimentador)
+        if processo.returncode != 0:
+            raise Exception(f"ffprobe falhou para '{self.nome}': {erro.decode('utf-8', 'ignore')}")
+        return json.loads(saida)
+
+    def materializar(self) -> str:
+        '''
+        Caminho em disco da fonte, para bibliotecas que só aceitam caminhos. Para fontes
+        em memória, o arquivo é criado uma única vez e apagado quando a fonte é fechada.
+        '''
+        if self.caminho:
+            return self.caminho
+        with self.__lock:
+            if self.__materializado is None:
+                os.makedirs(DIRETORIO_TEMPORARIO, exist_ok=True)
+                caminho = os.path.join(DIRETORIO_TEMPORARIO, uuid.uuid4().hex + "_" + os.path.basename(self.nome))
+                self.__spool.seek(0)
+                with open(caminho, "wb") as f:
+                    while bloco := self.__spool.read(TAMANHO_BLOCO):
+                        f.write(bloco)
+                self.__materializado = caminho
+                _contar(bytes_copiados=self.tamanho, bytes_em_disco=self.tamanho)
+        return self.__materializado
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__spool is not None:
+                self.__spool.close()
+            if self.__materializado and os.path.isfile(self.__materializado):
+                os.remove(self.__materializado)
+            self.__materializado = None
+
+    def __enter__(self) -> "MediaSource":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def registrar(self) -> str:
+        '''
+        Mantém a fonte viva no processo (ex.: para jobs em segundo plano) e devolve o seu id,
+        derivado do conteúdo: registrar o mesmo conteúdo de novo devolve a fonte existente.
+        As fontes mais antigas são fechadas quando o limite de fontes registradas é atingido,
+        exceto as retidas (ver reter).
+        '''
+        fonte_id = f"{self.sha256()}.{self.extensao}"
+        with MediaSource.__registradas_lock:
+            if fonte_id not in MediaSource.__registradas:
+                MediaSource.__registradas[fonte_id] = self
+            MediaSource.__registradas.move_to_end(fonte_id)
+            MediaSource.__descartar_excedentes()
+        return fonte_id
+
+    @staticmethod
+    def __descartar_excedentes() -> None:
+        # chamado com __registradas_lock; as retidas continuam registradas, mesmo acima do limite
+        excedentes = len(MediaSource.__registradas) - MAX_FONTES_REGISTRADAS
+        for fonte_id, fonte in list(MediaSource.__registradas.items()):
+            if excedentes <= 0:
+                break
+            if fonte.__retencoes == 0:
+                del MediaSource.__registradas[fonte_id]
+                fonte.close()
+                excedentes -= 1
+
+    def reter(self) -> None:
+        '''
+        Impede que o registro feche a fonte até o liberar correspondente
+        '''
+        with MediaSource.__registradas_lock:
+            self.__retencoes += 1
+
+    def liberar(self) -> None:
+        with MediaSource.__registradas_lock:
+            self.__retencoes -= 1
+            if self.__retencoes == 0:
+                MediaSource.__descartar_excedentes()
+
+    @contextmanager
+    def retida(self) -> Iterator["MediaSource"]:
+        self.reter()
+        try:
+            yield self
+        finally:
+            self.liberar()
+
+    @staticmethod
+    def obter(fonte_id : str, reter : bool = False) -> "MediaSource":
+        '''
+        Fonte registrada com esse id; com reter, ela já é devolvida retida, sem chance de
+        ser fechada entre a consulta e a retenção
+        '''
+        with MediaSource.__registradas_lock:
+            fonte = MediaSource.__registradas.get(fonte_id)
+            if fonte is not None and reter:
+                fonte.__retencoes += 1
+        if fonte is None:
+            raise Exception("A mídia não está mais disponível; envie o arquivo novamente")
+        return fonte
+
+
+def abrir_fonte(origem) -> MediaSource:
+    '''
+    Aceita um caminho, um id de fonte registrada ou uma MediaSource
+    '''
+    if isinstance(origem, MediaSource):
+        return origem
+    if os.path.isfile(origem):
+        return MediaSource.from_path(origem)
+    return MediaSource.obter(origem)
+
+
+@contextmanager
+def ffmpeg_da_fonte(fonte : MediaSource, saida : dict, entrada : dict = None) -> Iterator[subprocess.Popen]:
+    '''
+    Processo ffmpeg lendo a fonte (pelo caminho ou pelo stdin) e escrevendo no stdout
+    com os argumentos de saída informados. Se quem consome lê o stdout até o fim, um
+    código de saída diferente de zero (arquivo corrompido, codec não suportado...) vira
+    uma exceção com o stderr do ffmpeg; se para antes, o processo é encerrado.
+    '''
+    import ffmpeg
+
+    argumentos_globais = ["-loglevel", "error"]
+    if fonte.caminho:
+        argumentos_globais.append("-nostdin")
+
+    processo = (
+        ffmpeg
+        .input(fonte.caminho or "pipe:0", **(entrada or {}))
+        .output("pipe:", **saida)
+        .global_args(*argumentos_globais)
+        .run_async(pipe_stdin=not fonte.caminho, pipe_stdout=True, pipe_stderr=True)
+    )
+    alimentador = None if fonte.caminho else fonte.alimentar(processo.stdin)
+
+    # o stderr é drenado numa thread, para o ffmpeg não travar com o pipe cheio
+    erros = bytearray()
+
+    def drenar() -> None:
+        while bloco := processo.stderr.read(4096):
+            erros.extend(bloco)
+            del erros[:-MAX_BYTES_STDERR]
+
+    dreno = threading.Thread(target=drenar, daemon=True)
+    dreno.start()
+
+    ate_o_fim = False
+    try:
+        yield processo
+        # quem consome pode ter parado antes do fim (ex.: só os primeiros chunks)
+        ate_o_fim = not processo.stdout.read(1)
+    finally:
+        processo.stdout.close()
+        if not ate_o_fim:
+            processo.kill()
+        processo.wait()
+        dreno.join()
+        processo.stderr.close()
+
+    if not ate_o_fim:
+        return
+    # uma falha lendo a fonte chega ao ffmpeg como um stream truncado
+    if alimentador:
+        fonte.verificar_alimentacao(alimentador)
+    if processo.returncode != 0:
+        raise Exception(f"ffmpeg falhou para '{fonte.nome}' (código {processo.returncode}): "
+                        f"{erros.decode('utf-8', 'ignore').strip()}")
+
+
+def transcodificar(fonte : MediaSource, nome : str, **saida) -> MediaSource:
+    '''
+    Converte a fonte com o ffmpeg (ex.: format="mp3") para uma nova fonte, sem passar por disco
+    '''
+    destino = MediaSource(nome)
+    with ffmpeg_da_fonte(fonte, saida) as processo:
+        while bloco := processo.stdout.read(TAMANHO_BLOCO):
+            destino.write(bloco)
+    return destino
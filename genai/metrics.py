@@ -0,0 +1,268 @@
+# Métricas do processo: contadores e histogramas de tempo por etapa (decodificação,
+# codificação, Whisper, embeddings, índice, expansão da consulta, geração...), com
+# rótulos. Exportadas em texto do Prometheus (endpoint HTTP opcional) ou em JSON.
+# Sem dependências: pode ser importado pela interface e pela CLI sem custo.
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+# nomes das métricas exportadas
+ETAPAS = "genai_stage_seconds"
+BYTES = "genai_bytes_total"
+SEGUNDOS_AUDIO = "genai_audio_seconds_total"
+SEGUNDOS_TRANSCRICAO = "genai_transcription_wall_seconds_total"
+TOKENS = "genai_tokens_total"
+CUSTO = "genai_cost_usd_total"
+CACHE = "genai_cache_total"
+
+# o endpoint só atende a própria máquina, salvo outro endereço pedido (ex.: "0.0.0.0" num contêiner)
+ENDERECO_PADRAO = "127.0.0.1"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# US$ por 1000 tokens (prompt, resposta)
+PRECOS_POR_1K_TOKENS = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "text-embedding-ada-002": (0.0001, 0.0),
+}
+
+T = TypeVar("T")
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+def custo_tokens(modelo : str, tokens_prompt : int, tokens_resposta : int = 0) -> float:
+    preco_prompt, preco_resposta = PRECOS_POR_1K_TOKENS.get(modelo, (0.0, 0.0))
+    return (tokens_prompt * preco_prompt + tokens_resposta * preco_resposta) / 1000
+
+
+def _rotulos(rotulos : dict) -> Rotulos:
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items() if v is not None))
+
+
+def _formatar_rotulos(rotulos : Rotulos, extra : Optional[Tuple[str, str]] = None) -> str:
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    escapar = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+class _Histograma:
+    def __init__(self, buckets : Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.contagens = [0] * (len(buckets) + 1)  # o último é o +Inf
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    @property
+    def contagem(self) -> int:
+        return sum(self.contagens)
+
+    def observar(self, valor : float) -> None:
+        self.contagens[bisect.bisect_left(self.buckets, valor)] += 1
+        self.soma += valor
+        self.maximo = max(self.maximo, valor)
+
+    def quantil(self, q : float) -> float:
+        '''
+        Estimativa pelo limite superior do bucket que contém o quantil
+        '''
+        alvo, acumulado = q * self.contagem, 0
+        for limite, contagem in zip(self.buckets, self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+
+class MetricsRegistry:
+    '''
+    Contadores (somas monotônicas) e histogramas, identificados por nome e rótulos.
+    Coletores registrados (ex.: os contadores do media_io) entram nas exportações.
+    '''
+    __padrao = None
+    __padrao_lock = threading.Lock()
+
+    @staticmethod
+    def padrao() -> "MetricsRegistry":
+        '''
+        Instância compartilhada pelo processo
+        '''
+        with MetricsRegistry.__padrao_lock:
+            if MetricsRegistry.__padrao is None:
+                MetricsRegistry.__padrao = MetricsRegistry()
+            return MetricsRegistry.__padrao
+
+    def __init__(self, buckets : Tuple[float, ...] = BUCKETS_SEGUNDOS) -> None:
+        self.buckets = buckets
+        self.__contadores : Dict[str, Dict[Rotulos, float]] = {}
+        self.__histogramas : Dict[str, Dict[Rotulos, _Histograma]] = {}
+        self.__coletores : Dict[str, Callable[[], Dict[str, float]]] = {}
+        self.__lock = threading.Lock()
+        self.__servidor = None
+
+    def contar(self, nome : str, valor : float = 1, **rotulos) -> None:
+        with self.__lock:
+            serie = self.__contadores.setdefault(nome, {})
+            chave = _rotulos(rotulos)
+            serie[chave] = serie.get(chave, 0) + valor
+
+    def observar(self, nome : str, valor : float, **rotulos) -> None:
+        with self.__lock:
+            serie = self.__histogramas.setdefault(nome, {})
+            chave = _rotulos(rotulos)
+            if chave not in serie:
+                serie[chave] = _Histograma(self.buckets)
+            serie[chave].observar(valor)
+
+    @contextmanager
+    def cronometro(self, nome : str = ETAPAS, **rotulos) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def cronometrar_iteracao(self, iteravel : Iterable[T], nome : str = ETAPAS, **rotulos) -> Iterator[T]:
+        '''
+        Repassa os itens de iteravel, observando o tempo gasto para produzir cada um
+        (ex.: a decodificação de cada chunk de um AudioStream)
+        '''
+        iterador = iter(iteravel)
+        while True:
+            inicio = time.perf_counter()
+            try:
+                item = next(iterador)
+            except StopIteration:
+                return
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+            yield item
+
+    def registrar_tokens(self, modelo : str, tokens_prompt : int, tokens_resposta : int = 0, **rotulos) -> float:
+        '''
+        Conta os tokens e o custo estimado de uma chamada ao modelo; devolve o custo
+        '''
+        self.contar(TOKENS, tokens_prompt, modelo=modelo, tipo="prompt", **rotulos)
+        if tokens_resposta:
+            self.contar(TOKENS, tokens_resposta, modelo=modelo, tipo="resposta", **rotulos)
+        custo = custo_tokens(modelo, tokens_prompt, tokens_resposta)
+        self.contar(CUSTO, custo, modelo=modelo, **rotulos)
+        return custo
+
+    def registrar_coletor(self, prefixo : str, coletor : Callable[[], Dict[str, float]]) -> None:
+        '''
+        coletor(): {nome: valor} lido a cada exportação, publicado como prefixo_nome
+        '''
+        with self.__lock:
+            self.__coletores[prefixo] = coletor
+
+    def limpar(self) -> None:
+        with self.__lock:
+            self.__contadores.clear()
+            self.__histogramas.clear()
+
+    def __coletados(self) -> Dict[str, float]:
+        valores = {}
+        for prefixo, coletor in list(self.__coletores.items()):
+            try:
+                valores.update({f"{prefixo}_{nome}": valor for nome, valor in coletor().items()})
+            except Exception as e:
+                logging.warning(f"Coletor de métricas '{prefixo}' falhou: {e}")
+        return valores
+
+    def instantaneo(self) -> dict:
+        '''
+        Cópia de todas as métricas: {"contadores", "histogramas", "coletados", "derivadas"}
+        '''
+        with self.__lock:
+            contadores = [{"nome": nome, "rotulos": dict(chave), "valor": valor}
+                          for nome, serie in self.__contadores.items() for chave, valor in serie.items()]
+            histogramas = [{"nome": nome, "rotulos": dict(chave), "contagem": h.contagem, "soma": h.soma,
+                            "media": h.soma / h.contagem if h.contagem else 0.0, "p50": h.quantil(0.5),
+                            "p95": h.quantil(0.95), "maximo": h.maximo}
+                           for nome, serie in self.__histogramas.items() for chave, h in serie.items()]
+            audio = dict(self.__contadores.get(SEGUNDOS_AUDIO, {}))
+            wall = dict(self.__contadores.get(SEGUNDOS_TRANSCRICAO, {}))
+
+        # segundos de áudio transcritos por segundo de relógio, por modo
+        velocidade = {dict(chave).get("modo", ""): audio[chave] / wall[chave]
+                      for chave in audio if wall.get(chave)}
+        return {"contadores": contadores, "histogramas": histogramas, "coletados": self.__coletados(),
+                "derivadas": {"audio_segundos_por_segundo": velocidade}}
+
+    def json(self) -> str:
+        return json.dumps(self.instantaneo(), ensure_ascii=False, indent=2)
+
+    def salvar_json(self, caminho : str) -> None:
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with open(caminho + ".tmp", "w") as f:
+            f.write(self.json())
+        os.replace(caminho + ".tmp", caminho)
+
+    def prometheus(self) -> str:
+        '''
+        Formato de exposição em texto do Prometheus
+        '''
+        linhas : List[str] = []
+        with self.__lock:
+            for nome, serie in sorted(self.__contadores.items()):
+                linhas.append(f"# TYPE {nome} counter")
+                linhas.extend(f"{nome}{_formatar_rotulos(chave)} {valor}" for chave, valor in serie.items())
+            for nome, serie in sorted(self.__histogramas.items()):
+                linhas.append(f"# TYPE {nome} histogram")
+                for chave, h in serie.items():
+                    acumulado = 0
+                    for limite, contagem in zip(self.buckets + (float("inf"),), h.contagens):
+                        acumulado += contagem
+                        le = "+Inf" if limite == float("inf") else repr(limite)
+                        linhas.append(f"{nome}_bucket{_formatar_rotulos(chave, ('le', le))} {acumulado}")
+                    linhas.append(f"{nome}_sum{_formatar_rotulos(chave)} {h.soma}")
+                    linhas.append(f"{nome}_count{_formatar_rotulos(chave)} {h.contagem}")
+        for nome, valor in sorted(self.__coletados().items()):
+            linhas.append(f"# TYPE {nome} gauge")
+            linhas.append(f"{nome} {valor}")
+        return "\n".join(linhas) + "\n"
+
+    def servir(self, porta : int, endereco : str = ENDERECO_PADRAO) -> "ThreadingHTTPServer":
+        '''
+        Endpoint HTTP numa thread daemon, em endereco (por padrão só localhost): /metrics
+        (Prometheus) e /metrics.json.
+        Chamadas repetidas (ex.: a cada rerun do Streamlit) reutilizam o servidor.
+        '''
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        with self.__lock:
+            if self.__servidor is not None:
+                return self.__servidor
+            registro = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self) -> None:
+                    if self.path.startswith("/metrics.json"):
+                        corpo, tipo = registro.json(), "application/json"
+                    elif self.path.startswith("/metrics"):
+                        corpo, tipo = registro.prometheus(), "text/plain; version=0.0.4"
+                    else:
+                        self.send_error(404)
+                        return
+                    dados = corpo.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", f"{tipo}; charset=utf-8")
+                    self.send_header("Content-Length", str(len(dados)))
+                    self.end_headers()
+                    self.wfile.write(dados)
+
+                def log_message(self, *args) -> None:
+                    pass
+
+            self.__servidor = ThreadingHTTPServer((endereco, porta), Handler)
+            threading.Thread(target=self.__servidor.serve_forever, daemon=True).start()
+            logging.info(f"Métricas disponíveis em http://{endereco}:{porta}/metrics")
+            return self.__servidor
@@ -0,0 +1,160 @@
+# Índice vetorial em processo para documentos pequenos: os embeddings (normalizados)
+# ficam numa matriz float32 contígua, mapeada do disco com memmap quando persistida,
+# e a busca é exata, com um único produto matriz-vetor e argpartition para o top-k.
+import json
+import logging
+import math
+import os
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+from typing import Any, Iterable, List, Optional, Tuple
+
+ARQUIVO_VETORES = "vetores.f32"
+ARQUIVO_DOCUMENTOS = "documentos.jsonl"
+ARQUIVO_METADATA = "metadata.json"
+
+
+def _normalizar(vetores : np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+    return (vetores / np.maximum(normas, 1e-12)).astype(np.float32, copy=False)
+
+
+class NumpyVectorStore(VectorStore):
+    '''
+    VectorStore exato em memória. Com diretorio, salvar() persiste o índice e
+    carregar() o reabre com os vetores mapeados do disco (sem lê-los inteiros).
+    '''
+    def __init__(self, embedding : Embeddings, diretorio : Optional[str] = None) -> None:
+        self.embedding = embedding
+        self.diretorio = diretorio
+        self.metadata : dict = {}
+        self.__ids : List[str] = []
+        self.__textos : List[str] = []
+        self.__metadados : List[dict] = []
+        self.__matriz = np.zeros((0, 0), dtype=np.float32)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def ids(self) -> List[str]:
+        return list(self.__ids)
+
+    def add_texts(self, texts : Iterable[str], metadatas : Optional[List[dict]] = None,
+                  ids : Optional[List[str]] = None, **kwargs : Any) -> List[str]:
+        textos = list(texts)
+        if not textos:
+            return []
+        ids = ids or [str(len(self.__ids) + i) for i in range(len(textos))]
+        vetores = _normalizar(np.asarray(self.embedding.embed_documents(textos), dtype=np.float32))
+
+        self.__matriz = vetores if len(self.__ids) == 0 else np.concatenate([self.__matriz, vetores])
+        self.__ids.extend(ids)
+        self.__textos.extend(textos)
+        self.__metadados.extend(metadatas or [{} for _ in textos])
+        return ids
+
+    def delete(self, ids : Optional[List[str]] = None, **kwargs : Any) -> Optional[bool]:
+        remover = set(ids or [])
+        manter = [i for i, id_ in enumerate(self.__ids) if id_ not in remover]
+        self.__matriz = np.ascontiguousarray(self.__matriz[manter])
+        self.__ids = [self.__ids[i] for i in manter]
+        self.__textos = [self.__textos[i] for i in manter]
+        self.__metadados = [self.__metadados[i] for i in manter]
+        return True
+
+    def __top_k(self, consulta : List[float], k : int) -> List[Tuple[Document, float]]:
+        '''
+        (documento, similaridade de cosseno) dos k vetores mais próximos, em ordem
+        '''
+        if len(self.__ids) == 0:
+            return []
+        vetor = _normalizar(np.asarray(consulta, dtype=np.float32).reshape(1, -1))[0]
+        scores = self.__matriz @ vetor
+        k = min(k, len(scores))
+        # argpartition seleciona os k maiores em O(n); só eles são ordenados
+        melhores = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        melhores = melhores[np.argsort(-scores[melhores])]
+        return [(Document(page_content=self.__textos[i], metadata=self.__metadados[i]), float(scores[i]))
+                for i in melhores]
+
+    def similarity_search_with_score(self, query : str, k : int = 4, **kwargs : Any) -> List[Tuple[Document, float]]:
+        return self.__top_k(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding : List[float], k : int = 4, **kwargs : Any) -> List[Document]:
+        return [doc for doc, _ in self.__top_k(embedding, k)]
+
+    def similarity_search(self, query : str, k : int = 4, **kwargs : Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_with_relevance_scores(self, query : str, k : int = 4,
+                                                **kwargs : Any) -> List[Tuple[Document, float]]:
+        # mesma escala do Chroma (distância euclidiana de vetores unitários -> [0, 1]),
+        # para que o limiar da estratégia "hybrid" valha para os dois índices
+        return [(doc, 1.0 - math.sqrt(max(0.0, 2.0 - 2.0 * score)) / math.sqrt(2))
+                for doc, score in self.similarity_search_with_score(query, k)]
+
+    def salvar(self) -> None:
+        os.makedirs(self.diretorio, exist_ok=True)
+        # escreve em arquivos temporários e troca, sem afetar quem já mapeou os vetores
+        caminho_vetores = os.path.join(self.diretorio, ARQUIVO_VETORES)
+        np.ascontiguousarray(self.__matriz, dtype=np.float32).tofile(caminho_vetores + ".tmp")
+        with open(os.path.join(self.diretorio, ARQUIVO_DOCUMENTOS + ".tmp"), "w") as f:
+            for id_, texto, metadados in zip(self.__ids, self.__textos, self.__metadados):
+                f.write(json.dumps({"id": id_, "texto": texto, "metadados": metadados}, ensure_ascii=False) + "\n")
+        metadata = dict(self.metadata, chunks=len(self.__ids),
+                        dimensao=int(self.__matriz.shape[1]) if len(self.__ids) else 0)
+        with open(os.path.join(self.diretorio, ARQUIVO_METADATA + ".tmp"), "w") as f:
+            json.dump(metadata, f)
+        for arquivo in (ARQUIVO_VETORES, ARQUIVO_DOCUMENTOS, ARQUIVO_METADATA):
+            os.replace(os.path.join(self.diretorio, arquivo + ".tmp"), os.path.join(self.diretorio, arquivo))
+
+    def salvar_metadata(self) -> None:
+        # apenas os metadados da coleção (ex.: último acesso), sem reescrever os vetores
+        caminho = os.path.join(self.diretorio, ARQUIVO_METADATA)
+        with open(caminho + ".tmp", "w") as f:
+            json.dump(self.metadata, f)
+        os.replace(caminho + ".tmp", caminho)
+
+    @staticmethod
+    def ler_metadata(diretorio : str) -> Optional[dict]:
+        caminho = os.path.join(diretorio, ARQUIVO_METADATA)
+        if not os.path.isfile(caminho):
+            return None
+        with open(caminho) as f:
+            return json.load(f)
+
+    @classmethod
+    def carregar(cls, diretorio : str, embedding : Embeddings) -> Optional["NumpyVectorStore"]:
+        metadata = NumpyVectorStore.ler_metadata(diretorio)
+        if metadata is None:
+            return None
+        store = cls(embedding, diretorio)
+        store.metadata = metadata
+        with open(os.path.join(diretorio, ARQUIVO_DOCUMENTOS)) as f:
+            for linha in f:
+                registro = json.loads(linha)
+                store.__ids.append(registro["id"])
+                store.__textos.append(registro["texto"])
+                store.__metadados.append(registro["metadados"])
+        dimensao = metadata.get("dimensao", 0)
+        if store.__ids and dimensao:
+            store.__matriz = np.memmap(os.path.join(diretorio, ARQUIVO_VETORES), dtype=np.float32, mode="r",
+                                       shape=(len(store.__ids), dimensao))
+        logging.info(f"Índice NumPy carregado de '{diretorio}' ({len(store.__ids)} vetores)")
+        return store
+
+    @classmethod
+    def from_texts(cls, texts : List[str], embedding : Embeddings, metadatas : Optional[List[dict]] = None,
+                   ids : Optional[List[str]] = None, diretorio : Optional[str] = None,
+                   **kwargs : Any) -> "NumpyVectorStore":
+        store = cls(embedding, diretorio)
+        store.add_texts(texts, metadatas, ids)
+        if diretorio:
+            store.salvar()
+        return store
@@ -0,0 +1,133 @@
+# Estratégias de recuperação de documentos para o ChatWithEmbeddings:
+#   single      -> uma busca por similaridade com a pergunta original
+#   multi_query -> o LLM gera variações da pergunta e as buscas rodam em paralelo
+#   hybrid      -> busca simples; só gera variações se o melhor score ficar abaixo do limiar
+# Com um índice de palavras (BM25), cada consulta também é buscada nele, e as listas de
+# resultados são combinadas por reciprocal rank fusion. Filtros de coluna restringem os
+# resultados às linhas de tabela com os valores exatos pedidos.
+# O resultado sai sem chunks quase duplicados e limitado ao orçamento de tokens do contexto.
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from genai.context_budget import deduplicar, ajustar_ao_orcamento, LIMIAR_DUPLICADO
+from genai.keyword_index import KeywordIndex, atende_filtros
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.schema import BaseRetriever, Document
+from langchain.schema.language_model import BaseLanguageModel
+from langchain.vectorstores.base import VectorStore
+from typing import Any, Dict, List, Optional, Tuple
+
+ESTRATEGIAS = ["single", "multi_query", "hybrid"]
+# constante usual da reciprocal rank fusion: atenua a diferença entre as primeiras posições
+K_RRF = 60
+
+QUERY_EXPANSION_TEMPLATE = """You are an AI language model assistant. Your task is
+to generate {quantidade} different versions of the given user question to retrieve
+relevant documents from a vector database. By generating multiple perspectives on
+the user question, your goal is to help the user overcome some of the limitations
+of distance-based similarity search. Provide these alternative questions separated
+by newlines.
+Original question: {question}"""
+
+
+def fundir_rrf(listas : List[List[Document]], k : int = K_RRF) -> List[Document]:
+    '''
+    Documentos únicos (pelo conteúdo) das listas ordenadas, pela soma de 1 / (k + posição)
+    em cada lista; empates ficam na ordem em que apareceram
+    '''
+    pontos : Dict[str, float] = {}
+    documentos : Dict[str, Document] = {}
+    for lista in listas:
+        for posicao, doc in enumerate(lista):
+            pontos[doc.page_content] = pontos.get(doc.page_content, 0.0) + 1.0 / (k + posicao + 1)
+            documentos.setdefault(doc.page_content, doc)
+    return [documentos[conteudo] for conteudo in sorted(pontos, key=pontos.get, reverse=True)]
+
+
+class StrategyRetriever(BaseRetriever):
+    '''
+    Retriever que aplica a estratégia escolhida e registra a latência de cada etapa
+    em `latencies` (query_expansion, search, keyword_search), em segundos
+    '''
+    vectorstore : VectorStore
+    # índice BM25 dos mesmos chunks (None = só a busca vetorial)
+    keyword_index : Optional[KeywordIndex] = None
+    # {coluna: valor} exigidos nas linhas de tabela dos chunks
+    filtros : Dict[str, Any] = {}
+    k_rrf : int = K_RRF
+    llm : BaseLanguageModel
+    strategy : str = "multi_query"
+    k : int = 4
+    quantidade_variacoes : int = 3
+    limiar_score : float = 0.75
+    limiar_duplicados : float = LIMIAR_DUPLICADO
+    # tokens disponíveis para os documentos no prompt (None = sem limite)
+    max_tokens_documentos : Optional[int] = None
+    latencies : Dict[str, float] = {}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __expandir(self, query : str) -> List[str]:
+        inicio = time.perf_counter()
+        resposta = self.llm.predict(QUERY_EXPANSION_TEMPLATE.format(quantidade=self.quantidade_variacoes, question=query))
+        variacoes = [linha.strip() for linha in resposta.split("\n") if linha.strip()]
+        self.latencies["query_expansion"] = time.perf_counter() - inicio
+        logging.info(f"Variações geradas: {variacoes}")
+        return variacoes
+
+    def __buscar(self, queries : List[str]) -> List[List[Tuple[Document, float]]]:
+        inicio = time.perf_counter()
+        if len(queries) == 1:
+            resultados = [self.vectorstore.similarity_search_with_relevance_scores(queries[0], k=self.k)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+                resultados = list(executor.map(
+                    lambda q: self.vectorstore.similarity_search_with_relevance_scores(q, k=self.k), queries))
+        self.latencies["search"] = self.latencies.get("search", 0.0) + time.perf_counter() - inicio
+        return resultados
+
+    def __buscar_palavras(self, queries : List[str]) -> List[List[Document]]:
+        inicio = time.perf_counter()
+        # os filtros viram o conjunto exato de candidatos da busca por palavras
+        candidatos = self.keyword_index.filtrar(self.filtros) if self.filtros else None
+        resultados = [[doc for doc, _ in self.keyword_index.buscar(q, k=self.k, candidatos=candidatos)]
+                      for q in queries]
+        self.latencies["keyword_search"] = time.perf_counter() - inicio
+        return resultados
+
+    def __fundir(self, queries : List[str], resultados : List[List[Tuple[Document, float]]]) -> List[Document]:
+        listas = [[doc for doc, _ in resultado] for resultado in resultados]
+        if self.filtros:
+            listas = [[doc for doc in lista if atende_filtros(doc, self.filtros)] for lista in listas]
+        if self.keyword_index is not None:
+            listas += self.__buscar_palavras(queries)
+        return fundir_rrf(listas, self.k_rrf)
+
+    def __ajustar(self, documentos : List[Document]) -> List[Document]:
+        documentos = deduplicar(documentos, self.limiar_duplicados)
+        if self.max_tokens_documentos is not None:
+            documentos = ajustar_ao_orcamento(documentos, self.max_tokens_documentos)
+        return documentos
+
+    def _get_relevant_documents(self, query : str, *, run_manager : CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.strategy not in ESTRATEGIAS:
+            raise Exception(f"A estratégia '{self.strategy}' não é válida.")
+
+        self.latencies = {"query_expansion": 0.0, "search": 0.0, "keyword_search": 0.0}
+
+        if self.strategy == "multi_query":
+            queries = [query] + self.__expandir(query)
+            return self.__ajustar(self.__fundir(queries, self.__buscar(queries)))
+
+        queries = [query]
+        resultados = self.__buscar(queries)
+        if self.strategy == "hybrid":
+            melhor = max((score for _, score in resultados[0]), default=0.0)
+            if melhor < self.limiar_score:
+                logging.info(f"Melhor score {melhor:0.3f} abaixo de {self.limiar_score}: expandindo a pergunta")
+                variacoes = self.__expandir(query)
+                queries += variacoes
+                resultados += self.__buscar(variacoes)
+
+        return self.__ajustar(self.__fundir(queries, resultados))
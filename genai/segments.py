@@ -0,0 +1,70 @@
+# Segmentos com tempo (início, fim, texto, chunk de origem) produzidos pela
+# transcrição, e a sua exportação em SRT, WebVTT e JSON.
+import json
+from dataclasses import dataclass, asdict
+from typing import List
+
+
+@dataclass
+class Segmento:
+    inicio : float  # segundos, relativos ao início do arquivo
+    fim : float
+    texto : str
+    chunk : int = 0
+
+
+def juntar_texto(segmentos : List[Segmento]) -> str:
+    return " ".join(s.texto.strip() for s in segmentos if s.texto.strip())
+
+
+def deslocar(segmentos : List[Segmento], deslocamento : float, chunk : int) -> List[Segmento]:
+    '''
+    Converte segmentos relativos ao chunk em segmentos com tempo global
+    '''
+    return [Segmento(s.inicio + deslocamento, s.fim + deslocamento, s.texto, chunk) for s in segmentos]
+
+
+def serializar(segmentos : List[Segmento]) -> str:
+    return json.dumps([asdict(s) for s in segmentos], ensure_ascii=False)
+
+
+def desserializar(conteudo : str) -> List[Segmento]:
+    try:
+        return [Segmento(**s) for s in json.loads(conteudo)]
+    except (json.JSONDecodeError, TypeError):
+        # entrada antiga do cache, apenas com o texto
+        return [Segmento(0.0, 0.0, conteudo)]
+
+
+def _tempo(segundos : float, separador_ms : str) -> str:
+    milissegundos = int(round(segundos * 1000))
+    horas, milissegundos = divmod(milissegundos, 3600 * 1000)
+    minutos, milissegundos = divmod(milissegundos, 60 * 1000)
+    segundos, milissegundos = divmod(milissegundos, 1000)
+    return f"{horas:02d}:{minutos:02d}:{segundos:02d}{separador_ms}{milissegundos:03d}"
+
+
+def _legendas(segmentos : List[Segmento]) -> List[Segmento]:
+    # uma legenda sem texto é inválida (a linha em branco encerra o bloco)
+    return [s for s in segmentos if s.texto.strip()]
+
+
+def para_srt(segmentos : List[Segmento]) -> str:
+    blocos = []
+    for numero, s in enumerate(_legendas(segmentos), start=1):
+        blocos.append(f"{numero}\n{_tempo(s.inicio, ',')} --> {_tempo(s.fim, ',')}\n{s.texto.strip()}\n")
+    return "\n".join(blocos)
+
+
+def para_vtt(segmentos : List[Segmento]) -> str:
+    blocos = ["WEBVTT\n"]
+    for s in _legendas(segmentos):
+        blocos.append(f"{_tempo(s.inicio, '.')} --> {_tempo(s.fim, '.')}\n{s.texto.strip()}\n")
+    return "\n".join(blocos)
+
+
+def para_json(segmentos : List[Segmento]) -> str:
+    return json.dumps([asdict(s) for s in segmentos], ensure_ascii=False, indent=2)
+
+
+FORMATOS = {"srt": para_srt, "vtt": para_vtt, "json": para_json}
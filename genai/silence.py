@@ -0,0 +1,81 @@
+# Segmentação de áudio em silêncios (detecção de atividade de voz por energia).
+# Recebe os chunks de duração fixa do AudioStream e devolve segmentos de até
+# duracao_alvo_segundos cortados no trecho mais silencioso, para que nenhuma
+# palavra seja cortada ao meio e os segmentos possam ser processados de forma independente.
+import numpy as np
+from genai.audio_stream import AudioChunk, SAMPLE_WIDTH
+from typing import Iterable, Iterator
+
+QUADRO_MS = 30
+# duração mínima do silêncio procurado (janela da média móvel de energia)
+SILENCIO_MINIMO_MS = 300
+# o corte é procurado entre esta fração da duração alvo e a duração alvo
+FRACAO_MINIMA_SEGMENTO = 0.5
+
+
+def energia_por_quadro(pcm : bytes, sample_rate : int, canais : int) -> np.ndarray:
+    '''
+    RMS de cada quadro de QUADRO_MS (média dos canais)
+    '''
+    amostras = np.frombuffer(pcm, dtype=np.int16)
+    if canais > 1:
+        amostras = amostras[:len(amostras) - len(amostras) % canais].reshape(-1, canais).mean(axis=1)
+    tamanho_quadro = max(1, sample_rate * QUADRO_MS // 1000)
+    quadros = len(amostras) // tamanho_quadro
+    if quadros == 0:
+        return np.zeros(0, dtype=np.float32)
+    blocos = amostras[:quadros * tamanho_quadro].astype(np.float32).reshape(quadros, tamanho_quadro)
+    return np.sqrt(np.mean(blocos * blocos, axis=1))
+
+
+def ponto_de_corte(pcm : bytes, sample_rate : int, canais : int, inicio_busca : int) -> int:
+    '''
+    Posição (em bytes, alinhada à amostra) do centro do trecho mais silencioso
+    de pcm a partir de inicio_busca
+    '''
+    bytes_por_quadro = (sample_rate * QUADRO_MS // 1000) * canais * SAMPLE_WIDTH
+    energia = energia_por_quadro(pcm, sample_rate, canais)
+    primeiro_quadro = inicio_busca // bytes_por_quadro
+
+    janela = max(1, SILENCIO_MINIMO_MS // QUADRO_MS)
+    if len(energia) - primeiro_quadro < janela:
+        return len(pcm)
+
+    # média móvel: o mínimo é o trecho de SILENCIO_MINIMO_MS com menos energia
+    acumulada = np.cumsum(np.concatenate(([0.0], energia[primeiro_quadro:])))
+    media = (acumulada[janela:] - acumulada[:-janela]) / janela
+    melhor = primeiro_quadro + int(np.argmin(media)) + janela // 2
+
+    return melhor * bytes_por_quadro
+
+
+def segmentar_em_silencios(chunks : Iterable[AudioChunk], duracao_alvo_segundos : float) -> Iterator[AudioChunk]:
+    '''
+    Reagrupa chunks consecutivos em segmentos de no máximo duracao_alvo_segundos,
+    cortados em silêncios. inicio_segundos de cada segmento é o deslocamento global.
+    '''
+    buffer = bytearray()
+    inicio_buffer = 0.0
+    indice = 0
+    sample_rate = canais = None
+
+    for chunk in chunks:
+        sample_rate, canais = chunk.sample_rate, chunk.canais
+        bytes_por_segundo = sample_rate * canais * SAMPLE_WIDTH
+        alvo = int(duracao_alvo_segundos * sample_rate) * canais * SAMPLE_WIDTH
+        if not buffer:
+            inicio_buffer = chunk.inicio_segundos
+        buffer += chunk.pcm
+
+        while len(buffer) >= alvo:
+            corte = ponto_de_corte(bytes(buffer[:alvo]), sample_rate, canais, int(alvo * FRACAO_MINIMA_SEGMENTO))
+            corte = max(SAMPLE_WIDTH * canais, corte)
+            yield AudioChunk(indice=indice, inicio_segundos=inicio_buffer, pcm=bytes(buffer[:corte]),
+                             sample_rate=sample_rate, canais=canais)
+            indice += 1
+            inicio_buffer += corte / bytes_por_segundo
+            del buffer[:corte]
+
+    if buffer:
+        yield AudioChunk(indice=indice, inicio_segundos=inicio_buffer, pcm=bytes(buffer),
+                         sample_rate=sample_rate, canais=canais)
@@ -0,0 +1,175 @@
+# Splitter que conta tokens de verdade (tiktoken) e empacota unidades inteiras
+# (frases, parágrafos ou linhas de tabela) até o orçamento de tokens do perfil do
+# documento. Cada documento é tokenizado uma única vez, em lote, e o empacotamento
+# é linear: nenhum trecho é re-dividido recursivamente.
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from langchain.schema import Document
+from langchain.text_splitter import BaseDocumentTransformer
+from typing import Any, List, Optional, Sequence, Tuple
+
+# mesmo encoding do gpt-3.5-turbo, do gpt-4 e do text-embedding-ada-002
+ENCODING_PADRAO = "cl100k_base"
+
+# fim de frase seguido de espaço, ou quebra de linha
+_FIM_DE_FRASE = re.compile(r"(?<=[.!?…])\s+|\n+")
+_PARAGRAFO = re.compile(r"\n\s*\n")
+
+
+@lru_cache(maxsize=None)
+def obter_tokenizer(encoding : str = ENCODING_PADRAO):
+    '''
+    Encoding do tiktoken, carregado uma única vez por processo
+    '''
+    import tiktoken
+    return tiktoken.get_encoding(encoding)
+
+
+@dataclass(frozen=True)
+class PerfilChunking:
+    tokens_por_chunk : int
+    sobreposicao_tokens : int
+    unidade : str  # "frase", "paragrafo" ou "linha"
+
+
+PERFIS = {
+    # transcrições: fala contínua, sem parágrafos; a sobreposição preserva o contexto entre chunks
+    "transcricao": PerfilChunking(tokens_por_chunk=400, sobreposicao_tokens=40, unidade="frase"),
+    "texto": PerfilChunking(tokens_por_chunk=400, sobreposicao_tokens=30, unidade="paragrafo"),
+    # linhas de CSV/XLSX são independentes: sem sobreposição, e uma linha nunca é cortada
+    "tabela": PerfilChunking(tokens_por_chunk=512, sobreposicao_tokens=0, unidade="linha"),
+}
+
+
+def perfil_do_documento(documento : Document) -> str:
+    '''
+    Perfil pelo tipo da origem: linhas de DataFrame, transcrições geradas pela
+    aplicação (*_transcricao.txt) ou texto comum
+    '''
+    if "row_start" in documento.metadata:
+        return "tabela"
+    source = str(documento.metadata.get("source", "")).lower()
+    if source.endswith(("_transcricao.txt", ".srt", ".vtt")):
+        return "transcricao"
+    if source.endswith((".csv", ".xlsx")):
+        return "tabela"
+    return "texto"
+
+
+def dividir_em_unidades(texto : str, unidade : str) -> Tuple[List[str], str]:
+    '''
+    Unidades de texto que não devem ser cortadas e o separador usado para juntá-las
+    '''
+    if unidade == "linha":
+        # o DataFrameRowsLoader separa as linhas com uma linha em branco
+        padrao, separador = (_PARAGRAFO, "\n\n") if "\n\n" in texto else (re.compile(r"\n"), "\n")
+    elif unidade == "paragrafo":
+        # parágrafos longos ainda são divididos em frases, no empacotamento
+        padrao, separador = _PARAGRAFO, "\n\n"
+    else:
+        padrao, separador = _FIM_DE_FRASE, " "
+    return [u.strip() for u in padrao.split(texto) if u.strip()], separador
+
+
+class TokenBudgetSplitter(BaseDocumentTransformer):
+    '''
+    Divide documentos em chunks de até tokens_por_chunk tokens, respeitando os
+    limites de frase/parágrafo/linha. perfil=None escolhe o perfil de cada documento
+    por perfil_do_documento; um nome de PERFIS força o mesmo perfil para todos.
+    '''
+    def __init__(self, perfil : Optional[str] = None, encoding : str = ENCODING_PADRAO) -> None:
+        if perfil is not None and perfil not in PERFIS:
+            raise Exception(f"O perfil '{perfil}' não é válido.")
+        self.perfil = perfil
+        self.encoding = encoding
+        # entra no nome da coleção do índice: mudar os perfis gera um índice novo
+        self.perfis = repr(sorted(PERFIS.items()))
+
+    def __empacotar(self, unidades : List[str], tamanhos : List[int], separadores : List[str],
+                    perfil : PerfilChunking) -> List[str]:
+        '''
+        separadores[i] é o que vai antes da unidade i quando ela não começa o chunk
+        '''
+        tokenizer = obter_tokenizer(self.encoding)
+        orcamento = perfil.tokens_por_chunk
+        chunks = []
+        atual : List[Tuple[str, int, str]] = []
+        tokens_atual = 0
+        # unidades em atual que ainda não saíram em nenhum chunk (as demais são sobreposição)
+        novas = 0
+
+        def juntar() -> str:
+            return atual[0][0] + "".join(separador + u for u, _, separador in atual[1:])
+
+        def emitir() -> None:
+            nonlocal atual, tokens_atual, novas
+            chunks.append(juntar())
+            # as últimas unidades que cabem na sobreposição começam o próximo chunk
+            mantidas, tokens_mantidos = [], 0
+            for unidade, tamanho, separador in reversed(atual):
+                if tokens_mantidos + tamanho + 1 > perfil.sobreposicao_tokens:
+                    break
+                mantidas.insert(0, (unidade, tamanho, separador))
+                tokens_mantidos += tamanho + 1
+            atual, tokens_atual, novas = mantidas, tokens_mantidos, 0
+
+        for unidade, tamanho, separador in zip(unidades, tamanhos, separadores):
+            if tamanho > orcamento:
+                # unidade maior que o orçamento (ex.: parágrafo sem pontuação): cortada por tokens
+                if novas:
+                    emitir()
+                atual, tokens_atual = [], 0
+                ids = tokenizer.encode_ordinary(unidade)
+                for inicio in range(0, len(ids), orcamento):
+                    chunks.append(tokenizer.decode(ids[inicio:inicio + orcamento]).strip())
+                continue
+            # +1: o separador entre unidades
+            if novas and tokens_atual + tamanho + 1 > orcamento:
+                emitir()
+            atual.append((unidade, tamanho, separador))
+            tokens_atual += tamanho + 1
+            novas += 1
+
+        if novas:
+            chunks.append(juntar())
+        return chunks
+
+    def split_text(self, texto : str, perfil : str = "texto") -> List[str]:
+        return [d.page_content for d in self.split_documents([Document(page_content=texto)], perfil)]
+
+    def split_documents(self, documentos : Sequence[Document], perfil : Optional[str] = None) -> List[Document]:
+        perfis = [PERFIS[perfil or self.perfil or perfil_do_documento(d)] for d in documentos]
+
+        # todas as unidades de todos os documentos são tokenizadas num único lote
+        por_documento = []
+        todas : List[str] = []
+        for documento, p in zip(documentos, perfis):
+            unidades, separador = dividir_em_unidades(documento.page_content, p.unidade)
+            separadores = [separador] * len(unidades)
+            if p.unidade == "paragrafo":
+                # parágrafos que podem não caber no orçamento (um token tem ao menos ~2 caracteres)
+                # são quebrados em frases, para não chegarem ao corte por tokens; as frases de
+                # um mesmo parágrafo voltam a ser juntadas com espaço
+                frases, separadores = [], []
+                for u in unidades:
+                    partes = [u] if len(u) < p.tokens_por_chunk * 2 else dividir_em_unidades(u, "frase")[0]
+                    frases.extend(partes)
+                    separadores.extend([separador] + [" "] * (len(partes) - 1))
+                unidades = frases
+            por_documento.append((len(todas), separadores))
+            todas.extend(unidades)
+        tamanhos = [len(ids) for ids in obter_tokenizer(self.encoding).encode_ordinary_batch(todas)] if todas else []
+
+        resultado = []
+        for documento, p, (inicio, separadores) in zip(documentos, perfis, por_documento):
+            fim = inicio + len(separadores)
+            chunks = self.__empacotar(todas[inicio:fim], tamanhos[inicio:fim], separadores, p)
+            resultado.extend(Document(page_content=c, metadata=dict(documento.metadata)) for c in chunks if c)
+        return resultado
+
+    def transform_documents(self, documents : Sequence[Document], **kwargs : Any) -> Sequence[Document]:
+        return self.split_documents(list(documents))
+
+    async def atransform_documents(self, documents : Sequence[Document], **kwargs : Any) -> Sequence[Document]:
+        return self.transform_documents(documents, **kwargs)
@@ -1,115 +1,360 @@
-# Classe que recebe um nome de arquivo no construtor e transcreve o seu conteúdo
-import openai
+# Classe que recebe um nome de arquivo no construtor e transcreve o seu conteúdo.
+# As dependências de cada modo (openai, speech_recognition, vosk) são importadas
+# pelo registro de backends apenas quando o modo é usado.
 import os
-import speech_recognition as sr
-from pydub import AudioSegment
-from pydub.playback import play
-from vosk import Model, KaldiRecognizer
 import json
 import logging
-import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from genai.audio_stream import AudioStream, AudioChunk, SAMPLE_WIDTH
+from genai.backends import TRANSCRICAO
+from genai.chunk_encoder import ChunkEncoder, SAMPLE_RATE_UPLOAD, CANAIS_UPLOAD
+from genai.media_io import MediaSource, abrir_fonte
+from genai.metrics import MetricsRegistry, ETAPAS, BYTES, CUSTO, CACHE, SEGUNDOS_AUDIO, SEGUNDOS_TRANSCRICAO
+from genai.transcription_cache import TranscriptionCache
+from genai.silence import segmentar_em_silencios
+from genai.segments import Segmento, juntar_texto, deslocar, serializar, desserializar, FORMATOS
+from typing import Callable, Iterable, Iterator, List, Optional, Union
 
 lista_modos = ["openai", "google", "vosk"]
+# qualquer formato decodificado pelo ffmpeg serve; inclui os streams nativos do YouTube
+extensoes_audio = ["mp3", "wav", "m4a", "mp4", "webm", "ogg", "opus"]
 
 
 class Transcription:
     PRICE_PER_MINUTE_USD = 0.006
+    MAX_WORKERS = 4
+    MAX_TENTATIVAS = 3
+    BACKOFF_SEGUNDOS = 1.0
+    # duração dos chunks lidos do decoder, por modo; no openai a duração vem do
+    # orçamento de bytes por upload, limitada a CHUNK_SEGUNDOS_MAX_OPENAI
+    CHUNK_SEGUNDOS_MAX_OPENAI = 10 * 60
+    ORCAMENTO_BYTES_CHUNK = 8 * 1024 * 1024
+    FORMATO_UPLOAD = "flac"
+    CHUNK_SEGUNDOS_GOOGLE = 50
+    CHUNK_SEGUNDOS_VOSK = 10
+    # bloco lido do decoder antes de reagrupar os chunks em silêncios
+    BLOCO_SEGUNDOS = 30
+    VOSK_BYTES_POR_LEITURA = 8000
+    MODELO_OPENAI = "whisper-1"
+    IDIOMA_GOOGLE = "pt-BR"
+    VOSK_MODEL_PATH = "./vosk-model-pt-fb-v0.1.1-20220516_2113"
 
-    def __init__(self, nome_arquivo : str, modo : str = "openai"):
-        self.nome_arquivo = nome_arquivo
+    def __init__(self, nome_arquivo : Union[str, MediaSource], modo : str = "openai",
+                 max_workers : int = MAX_WORKERS,
+                 max_tentativas : int = MAX_TENTATIVAS,
+                 on_progress : Optional[Callable[[int, int, int, str], None]] = None,
+                 cache : Optional[TranscriptionCache] = None,
+                 usar_cache : bool = True,
+                 processos : int = 1,
+                 inicio_segundos : Optional[float] = None,
+                 fim_segundos : Optional[float] = None,
+                 formato_upload : str = FORMATO_UPLOAD,
+                 orcamento_bytes_chunk : int = ORCAMENTO_BYTES_CHUNK,
+                 metricas : Optional[MetricsRegistry] = None):
+        '''
+        nome_arquivo: caminho, id de uma MediaSource registrada ou a própria MediaSource
+        max_workers: quantidade de chunks enviados em paralelo no modo openai
+        max_tentativas: tentativas por chunk antes de desistir (com backoff exponencial)
+        on_progress: callback(concluidos, total, indice_chunk, texto_chunk) chamado
+                     a cada chunk finalizado, na thread de quem chamou a transcrição
+        cache: cache de transcrições; se omitido usa o cache padrão do processo
+        usar_cache: False desliga o cache (sempre transcreve)
+        processos: no modo vosk, > 1 divide o áudio em silêncios e reconhece os
+                   segmentos em paralelo nesse número de processos
+        inicio_segundos/fim_segundos: transcreve apenas esse intervalo do arquivo
+                   (os tempos dos segmentos continuam relativos ao início do arquivo)
+        formato_upload: codificação dos chunks enviados no modo openai ("flac", "opus", "mp3" ou "wav")
+        orcamento_bytes_chunk: tamanho alvo de cada upload no modo openai
+        metricas: registro dos tempos por etapa, bytes, segundos de áudio e custo;
+                  se omitido usa o registro padrão do processo
+        '''
+        self.fonte = abrir_fonte(nome_arquivo)
+        self.nome_arquivo = self.fonte.nome
         self.last_transcription_cost = 0
         self.total_cost = 0
+        self.max_workers = max(1, max_workers)
+        self.max_tentativas = max(1, max_tentativas)
+        self.on_progress = on_progress
+        self.cache = (cache or TranscriptionCache.padrao()) if usar_cache else None
+        self.last_transcription_cached = False
+        self.processos = max(1, processos)
+        self.last_real_time_factor = None
+        self.inicio_segundos = inicio_segundos
+        self.fim_segundos = fim_segundos
+        self.last_segments : List[Segmento] = []
+        self.encoder = ChunkEncoder(formato_upload)
+        self.orcamento_bytes_chunk = orcamento_bytes_chunk
+        self.last_bytes_uploaded = 0
+        self.last_encode_seconds = 0.0
+        self.__metricas_upload_lock = threading.Lock()
+        self.metricas = metricas or MetricsRegistry.padrao()
+        self.__segundos_audio = 0.0
         if modo in lista_modos:
             self.modo = modo
         else:
             raise Exception("Modo inválido")
     
-    def __converter_mp3_para_wav(self, caminho_arquivo : str):
-        audio = AudioSegment.from_mp3(caminho_arquivo)
-        caminho_wav = caminho_arquivo.replace(".mp3", ".wav")
+    def __modelo_idioma(self) -> tuple:
+        if self.modo == "openai":
+            return Transcription.MODELO_OPENAI, None
+        elif self.modo == "google":
+            return "google", Transcription.IDIOMA_GOOGLE
+        else:
+            return os.path.basename(Transcription.VOSK_MODEL_PATH), "pt"
 
-        logging.info(f"Convertendo o arquivo '{caminho_arquivo}' para o formato wav em {caminho_wav}...")
+    def __chave_chunk(self, chunk : AudioChunk) -> Optional[str]:
+        if not self.cache:
+            return None
+        modelo, idioma = self.__modelo_idioma()
+        return TranscriptionCache.chave(TranscriptionCache.hash_bytes(chunk.pcm), self.modo, modelo, idioma, escopo="chunk")
 
-        audio.export(caminho_wav, format="wav")
+    def __etapa(self, etapa : str):
+        return self.metricas.cronometro(ETAPAS, componente="transcription", etapa=etapa, modo=self.modo)
 
-        logging.info("Arquivo convertido com sucesso.")
+    def __decodificar(self, chunks : Iterable[AudioChunk]) -> Iterator[AudioChunk]:
+        '''
+        Repassa os chunks, contabilizando o tempo de decodificação de cada um e a duração do áudio lido
+        '''
+        for chunk in self.metricas.cronometrar_iteracao(chunks, ETAPAS, componente="transcription",
+                                                        etapa="decode", modo=self.modo):
+            self.__segundos_audio += chunk.duracao_segundos
+            yield chunk
 
-        return caminho_wav
+    def __stream(self, duracao_chunk_segundos : float, **kwargs) -> AudioStream:
+        return AudioStream(self.fonte, duracao_chunk_segundos,
+                           inicio_segundos=self.inicio_segundos, fim_segundos=self.fim_segundos, **kwargs)
 
-    def __obter_transcricao_audio_openai(self, nome_arquivo : str) -> str:
-        audio = AudioSegment.from_wav(nome_arquivo)
+    def __transcrever_chunk_openai(self, chunk : AudioChunk) -> List[Segmento]:
+        '''
+        Segmentos do chunk, com tempos relativos ao início do chunk
+        '''
+        openai = TRANSCRICAO.obter("openai")
+        codificado = self.encoder.codificar(chunk)
+        with self.__metricas_upload_lock:
+            self.last_encode_seconds += codificado.segundos_codificacao
+        self.metricas.observar(ETAPAS, codificado.segundos_codificacao, componente="transcription",
+                               etapa="encode", modo=self.modo)
+        buffer = codificado.buffer
 
-        response = ""
+        for tentativa in range(1, self.max_tentativas + 1):
+            buffer.seek(0)
+            try:
+                # upload e inferência: o tempo do Whisper inclui o envio do chunk
+                with self.__etapa("whisper"):
+                    chunk_result = openai.Audio.transcribe(Transcription.MODELO_OPENAI, buffer, response_format="verbose_json")
+                with self.__metricas_upload_lock:
+                    self.last_bytes_uploaded += codificado.tamanho_bytes
+                self.metricas.contar(BYTES, codificado.tamanho_bytes, tipo="upload", formato=self.encoder.formato)
+                logging.info(chunk_result["text"])
+                segmentos = [Segmento(s["start"], s["end"], s["text"]) for s in chunk_result.get("segments", [])]
+                return segmentos or [Segmento(0.0, chunk.duracao_segundos, chunk_result["text"])]
+            except openai.error.OpenAIError as e:
+                if tentativa == self.max_tentativas:
+                    raise
+                espera = Transcription.BACKOFF_SEGUNDOS * (2 ** (tentativa - 1))
+                logging.warning(f"Falha no chunk {chunk.indice} (tentativa {tentativa}/{self.max_tentativas}): {e}. "
+                                f"Tentando novamente em {espera:0.1f}s...")
+                time.sleep(espera)
 
-        # PyDub handles time in milliseconds
-        chunk_size_in_minutes = 1 * 60 * 3000 #3 minutes chunk
+    def __obter_transcricao_audio_openai(self) -> List[Segmento]:
+        # decodificado direto em mono 16 kHz, o formato que o Whisper usa internamente
+        stream = self.__stream(Transcription.BLOCO_SEGUNDOS, sample_rate=SAMPLE_RATE_UPLOAD, canais=CANAIS_UPLOAD)
+        duracao_chunk = self.encoder.duracao_para_orcamento(self.orcamento_bytes_chunk,
+                                                            Transcription.CHUNK_SEGUNDOS_MAX_OPENAI)
+        # os chunks são cortados em silêncios, então podem ser menores que duracao_chunk
+        total = int(stream.quantidade_chunks() * Transcription.BLOCO_SEGUNDOS // duracao_chunk) + 1
+        self.last_bytes_uploaded = 0
+        self.last_encode_seconds = 0.0
 
-        # chunkenize thw audio and transcribe until the end of the audio
-        for i in range(0, len(audio), chunk_size_in_minutes):
-            chunk = audio[i:i+chunk_size_in_minutes]
-            # save the chunk in a buffer
-            buffer = io.BytesIO()
-            # you need to set the name with the extension
-            buffer.name = f"chunk{i}.wav"
-            chunk.export(buffer, format="wav")
+        resultados = {}
+        duracao_segundos = 0.0
+        concluidos = 0
 
-            chunk_result = openai.Audio.transcribe("whisper-1", buffer)
-            logging.info(chunk_result["text"])
-            response += chunk_result["text"]
+        def concluir(chunk : AudioChunk, segmentos : List[Segmento]) -> None:
+            nonlocal concluidos
+            resultados[chunk.indice] = deslocar(segmentos, chunk.inicio_segundos, chunk.indice)
+            concluidos += 1
+            if self.on_progress:
+                self.on_progress(concluidos, max(total, concluidos), chunk.indice, juntar_texto(segmentos))
 
-        self.last_transcription_cost = (len(audio) / (60*1000))*Transcription.PRICE_PER_MINUTE_USD
+        def coletar(futures) -> None:
+            for future in futures:
+                chunk, chave = pendentes.pop(future)
+                segmentos = future.result()
+                # um chunk sem texto é enviado de novo na próxima vez, em vez de fixar um resultado vazio
+                if chave and juntar_texto(segmentos).strip():
+                    self.cache.put(chave, serializar(segmentos))
+                concluir(chunk, segmentos)
+
+        # envia os chunks em paralelo, limitando quantos ficam decodificados em memória,
+        # e remonta na ordem original
+        pendentes = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk in self.__decodificar(segmentar_em_silencios(stream, duracao_chunk)):
+                chave = self.__chave_chunk(chunk)
+                em_cache = self.cache.get(chave) if chave else None
+                if em_cache is not None:
+                    # chunk já transcrito antes: não é enviado nem cobrado
+                    concluir(chunk, desserializar(em_cache))
+                    continue
+                duracao_segundos += chunk.duracao_segundos
+                pendentes[executor.submit(self.__transcrever_chunk_openai, chunk)] = (chunk, chave)
+                if len(pendentes) >= self.max_workers * 2:
+                    finalizados, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                    coletar(finalizados)
+            coletar(list(pendentes))
+
+        self.last_transcription_cost = (duracao_segundos / 60)*Transcription.PRICE_PER_MINUTE_USD
         self.total_cost += self.last_transcription_cost
+        self.metricas.contar(CUSTO, self.last_transcription_cost, modelo=Transcription.MODELO_OPENAI,
+                             componente="transcription")
+        logging.info(f"Upload: {self.last_bytes_uploaded} bytes ({self.encoder.formato}), "
+                     f"codificação {self.last_encode_seconds:0.2f}s")
 
-        return response
+        return [segmento for indice in sorted(resultados) for segmento in resultados[indice]]
 
-    def __obter_transcricao_audio_google(self, nome_arquivo : str) -> str:
+    def __obter_transcricao_audio_google(self) -> List[Segmento]:
+        sr = TRANSCRICAO.obter("google")
         recognizer = sr.Recognizer()
-        with sr.AudioFile(nome_arquivo) as source:
-            audio = recognizer.record(source)
-            texto = recognizer.recognize_google(audio, language='pt-BR')
-            return texto
-
-    def __obter_transcricao_audio_vosk(self, nome_arquivo : str) -> str:
-        model = Model("./vosk-model-pt-fb-v0.1.1-20220516_2113")
-
-        recognizer = KaldiRecognizer(model, 16000)
-
-        wf = open(nome_arquivo, "rb")
-        
-        texto = ""
-
-        while True:
-            data = wf.read(4000)
-            if len(data) == 0:
-                break
-            if recognizer.AcceptWaveform(data):
-                resultado = recognizer.Result()
-                if resultado:
-                    # le como json
-                    resultado = json.loads(resultado)
-                    if resultado["text"] and resultado["text"] != "<UNK>":
-                        print(resultado["text"], end="")
-                        texto += resultado["text"]
-
-        resultado_final = recognizer.FinalResult()
-        texto += resultado_final["text"]
-
-        return texto
+        stream = self.__stream(Transcription.BLOCO_SEGUNDOS, sample_rate=16000, canais=1)
+        total = stream.quantidade_chunks() * Transcription.BLOCO_SEGUNDOS // Transcription.CHUNK_SEGUNDOS_GOOGLE + 1
 
-    def obter_transcricao_audio(self) -> str:
-        # verifica se o arquivo é mp3 e, se for, primeiro converte para wav
-        if self.nome_arquivo.endswith(".mp3"):
-            nome_arquivo_wav = self.__converter_mp3_para_wav(self.nome_arquivo)
-        elif self.nome_arquivo.endswith(".wav"):
-            nome_arquivo_wav = self.nome_arquivo
-        else:
+        segmentos = []
+        for chunk in self.__decodificar(segmentar_em_silencios(stream, Transcription.CHUNK_SEGUNDOS_GOOGLE)):
+            chave = self.__chave_chunk(chunk)
+            texto = self.cache.get(chave) if chave else None
+            if texto is None:
+                audio = sr.AudioData(chunk.pcm, chunk.sample_rate, SAMPLE_WIDTH)
+                try:
+                    with self.__etapa("recognize"):
+                        texto = recognizer.recognize_google(audio, language=Transcription.IDIOMA_GOOGLE)
+                except sr.UnknownValueError:
+                    # trecho sem fala reconhecível
+                    texto = ""
+                if chave and texto:
+                    self.cache.put(chave, texto)
+            if texto:
+                segmentos.append(Segmento(chunk.inicio_segundos, chunk.inicio_segundos + chunk.duracao_segundos,
+                                          texto, chunk.indice))
+            if self.on_progress:
+                self.on_progress(chunk.indice + 1, max(total, chunk.indice + 1), chunk.indice, texto)
+
+        return segmentos
+
+    def __obter_transcricao_audio_vosk(self) -> List[Segmento]:
+        # o modelo é carregado uma única vez por processo; o recognizer é novo a cada transcrição
+        vosk_models = TRANSCRICAO.obter("vosk")
+        taxa = vosk_models.VoskModelRegistry.taxa_amostragem(Transcription.VOSK_MODEL_PATH)
+
+        stream = self.__stream(Transcription.CHUNK_SEGUNDOS_VOSK, sample_rate=taxa, canais=1)
+        total = stream.quantidade_chunks()
+        # o recognizer conta o tempo a partir do início do trecho lido
+        deslocamento = self.inicio_segundos or 0.0
+
+        segmentos = []
+
+        def coletar(resultado : dict, chunk : int) -> Optional[Segmento]:
+            palavras = resultado.get("result", [])
+            if resultado.get("text") and resultado["text"] != "<UNK>" and palavras:
+                segmento = Segmento(deslocamento + palavras[0]["start"], deslocamento + palavras[-1]["end"],
+                                    resultado["text"], chunk)
+                segmentos.append(segmento)
+                return segmento
+            return None
+
+        recognizer = vosk_models.VoskModelRegistry.novo_recognizer(Transcription.VOSK_MODEL_PATH)
+        recognizer.SetWords(True)
+        chunk = None
+        for chunk in self.__decodificar(stream):
+            textos_chunk = []
+            with self.__etapa("recognize"):
+                # pedaços pequenos, para não perder resultados intermediários dentro do chunk
+                for inicio in range(0, len(chunk.pcm), Transcription.VOSK_BYTES_POR_LEITURA):
+                    if recognizer.AcceptWaveform(chunk.pcm[inicio:inicio + Transcription.VOSK_BYTES_POR_LEITURA]):
+                        # le como json
+                        segmento = coletar(json.loads(recognizer.Result()), chunk.indice)
+                        if segmento:
+                            logging.debug(f"Vosk, chunk {chunk.indice}: {segmento.texto}")
+                            textos_chunk.append(segmento.texto)
+            if self.on_progress:
+                self.on_progress(chunk.indice + 1, total, chunk.indice, " ".join(textos_chunk))
+
+        coletar(json.loads(recognizer.FinalResult()), chunk.indice if chunk else 0)
+
+        return segmentos
+
+    def obter_segmentos(self) -> List[Segmento]:
+        '''
+        Transcreve o arquivo (ou o intervalo pedido) e devolve os segmentos com tempo global
+        '''
+        # o áudio é decodificado em streaming pelo ffmpeg, então os formatos
+        # são lidos diretamente, sem conversão intermediária
+        if self.fonte.extensao not in extensoes_audio:
             raise Exception("Arquivo inválido")
 
+        self.last_transcription_cached = False
+
+        chave = None
+        if self.cache:
+            modelo, idioma = self.__modelo_idioma()
+            escopo = "arquivo"
+            if self.inicio_segundos is not None or self.fim_segundos is not None:
+                escopo = f"arquivo@{self.inicio_segundos or 0}-{self.fim_segundos}"
+            chave = TranscriptionCache.chave(self.fonte.sha256(), self.modo,
+                                             modelo, idioma, escopo=escopo)
+            em_cache = self.cache.get(chave)
+            self.metricas.contar(CACHE, cache="transcricao", resultado="hit" if em_cache is not None else "miss")
+            if em_cache is not None:
+                logging.info(f"Transcrição de '{self.nome_arquivo}' obtida do cache.")
+                self.last_transcription_cost = 0
+                self.last_transcription_cached = True
+                self.last_segments = desserializar(em_cache)
+                return self.last_segments
+
+        self.__segundos_audio = 0.0
+        inicio = time.perf_counter()
         if self.modo == "openai":
-            return self.__obter_transcricao_audio_openai(nome_arquivo_wav)
+            segmentos = self.__obter_transcricao_audio_openai()
         elif self.modo == "google":
-            return self.__obter_transcricao_audio_google(nome_arquivo_wav)
+            segmentos = self.__obter_transcricao_audio_google()
+        elif self.modo == "vosk" and self.processos > 1:
+            transcrever_em_paralelo = TRANSCRICAO.obter("vosk_paralelo")
+            resultado = transcrever_em_paralelo(self.fonte, Transcription.VOSK_MODEL_PATH,
+                                                processos=self.processos, on_progress=self.on_progress,
+                                                inicio_segundos=self.inicio_segundos, fim_segundos=self.fim_segundos)
+            self.last_real_time_factor = resultado.real_time_factor
+            self.__segundos_audio = resultado.duracao_audio_segundos
+            segmentos = resultado.segmentos
         elif self.modo == "vosk":
-            return self.__obter_transcricao_audio_vosk(nome_arquivo_wav)
+            segmentos = self.__obter_transcricao_audio_vosk()
         else:
             raise Exception(f"O modo '{self.modo}' não é válido.")
+
+        wall = time.perf_counter() - inicio
+        self.metricas.observar(ETAPAS, wall, componente="transcription", etapa="total", modo=self.modo)
+        self.metricas.contar(SEGUNDOS_AUDIO, self.__segundos_audio, modo=self.modo)
+        self.metricas.contar(SEGUNDOS_TRANSCRICAO, wall, modo=self.modo)
+
+        # só o resultado de um áudio decodificado até o fim e com texto vai para o cache:
+        # um resultado vazio (ex.: decodificação que falhou) ficaria preso a este conteúdo.
+        # Falhas do ffmpeg ou da leitura da fonte chegam aqui como exceção.
+        if chave and self.__segundos_audio > 0 and juntar_texto(segmentos).strip():
+            self.cache.put(chave, serializar(segmentos))
+        elif chave:
+            logging.warning(f"Transcrição vazia de '{self.nome_arquivo}' não foi guardada no cache")
+
+        self.last_segments = segmentos
+        return segmentos
+
+    def obter_transcricao_audio(self) -> str:
+        return juntar_texto(self.obter_segmentos())
+
+    def exportar(self, formato : str) -> str:
+        '''
+        Segmentos da última transcrição em "srt", "vtt" ou "json"
+        '''
+        if formato not in FORMATOS:
+            raise Exception(f"O formato '{formato}' não é válido.")
+        return FORMATOS[formato](self.last_segments)
@@ -0,0 +1,127 @@
+# Cache persistente de transcrições, endereçado pelo conteúdo do áudio.
+# Guarda tanto o resultado do arquivo inteiro quanto de cada chunk, em SQLite,
+# com limite de tamanho e descarte LRU.
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+CAMINHO_PADRAO = "./cache/transcricoes.sqlite"
+TAMANHO_MAXIMO_PADRAO = 256 * 1024 * 1024  # 256 MB
+
+
+class TranscriptionCache:
+    '''
+    Cache chave/valor (texto) em SQLite com descarte do item menos usado
+    recentemente quando o total ultrapassa max_bytes.
+    '''
+    __padrao = None
+    __padrao_lock = threading.Lock()
+
+    @staticmethod
+    def padrao() -> "TranscriptionCache":
+        '''
+        Instância compartilhada pelo processo, usada quando nenhuma é informada
+        '''
+        with TranscriptionCache.__padrao_lock:
+            if TranscriptionCache.__padrao is None:
+                TranscriptionCache.__padrao = TranscriptionCache(CAMINHO_PADRAO)
+            return TranscriptionCache.__padrao
+
+    @staticmethod
+    def hash_arquivo(caminho : str, tamanho_bloco : int = 1024 * 1024) -> str:
+        sha = hashlib.sha256()
+        with open(caminho, "rb") as f:
+            while bloco := f.read(tamanho_bloco):
+                sha.update(bloco)
+        return sha.hexdigest()
+
+    @staticmethod
+    def hash_bytes(dados : bytes) -> str:
+        return hashlib.sha256(dados).hexdigest()
+
+    @staticmethod
+    def chave(hash_audio : str, modo : str, modelo : str, idioma : Optional[str], escopo : str = "arquivo") -> str:
+        return f"{escopo}:{modo}:{modelo}:{idioma or '-'}:{hash_audio}"
+
+    def __init__(self, caminho : str = CAMINHO_PADRAO, max_bytes : int = TAMANHO_MAXIMO_PADRAO) -> None:
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with self.__conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcricoes (
+                    chave TEXT PRIMARY KEY,
+                    texto TEXT NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    ultimo_acesso REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acesso ON transcricoes (ultimo_acesso)")
+
+    @contextmanager
+    def __conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, chave : str) -> Optional[str]:
+        with self.__conectar() as conn:
+            linha = conn.execute("SELECT texto FROM transcricoes WHERE chave = ?", (chave,)).fetchone()
+            if linha:
+                conn.execute("UPDATE transcricoes SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave))
+
+        with self.__lock:
+            if linha:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return linha[0] if linha else None
+
+    def put(self, chave : str, texto : str) -> None:
+        tamanho = len(texto.encode("utf-8"))
+        with self.__conectar() as conn:
+            conn.execute("INSERT OR REPLACE INTO transcricoes (chave, texto, tamanho, ultimo_acesso) VALUES (?, ?, ?, ?)",
+                         (chave, texto, tamanho, time.time()))
+            self.__descartar(conn)
+
+    def __descartar(self, conn : sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM transcricoes").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        removidos = 0
+        for chave, tamanho in conn.execute("SELECT chave, tamanho FROM transcricoes ORDER BY ultimo_acesso").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM transcricoes WHERE chave = ?", (chave,))
+            total -= tamanho
+            removidos += 1
+
+        logging.info(f"Cache de transcrições: {removidos} entradas descartadas (LRU)")
+
+    def limpar(self) -> None:
+        with self.__conectar() as conn:
+            conn.execute("DELETE FROM transcricoes")
+
+    def estatisticas(self) -> dict:
+        with self.__conectar() as conn:
+            entradas, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM transcricoes").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entradas": entradas,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,438 @@
+# Armazenamento persistente de índices vetoriais reutilizáveis entre sessões.
+# Cada índice é uma coleção identificada pelo hash do conteúdo do documento, pelos
+# parâmetros do splitter e pelo modelo de embeddings: uma segunda sessão sobre o
+# mesmo documento se conecta à coleção existente sem nenhuma chamada de embedding.
+# Documentos pequenos ficam num índice NumPy em processo; os grandes, no Chroma
+# (carregado apenas quando usado). Ao lado de cada índice fica um índice de palavras
+# (BM25) dos mesmos chunks, reconstruído sempre que o conteúdo muda.
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from genai.metrics import MetricsRegistry, ETAPAS
+from genai.keyword_index import KeywordIndex
+from genai.numpy_vector_store import NumpyVectorStore
+from langchain.schema import Document
+from langchain.embeddings.base import Embeddings
+from langchain.text_splitter import BaseDocumentTransformer
+from langchain.vectorstores.base import VectorStore
+from typing import List, Optional, Tuple
+
+DIRETORIO_PADRAO = "./cache/indices"
+TTL_PADRAO_SEGUNDOS = 7 * 24 * 60 * 60  # 7 dias
+MAX_INDICES_PADRAO = 50
+# o Chroma limita a quantidade de itens por inserção
+TAMANHO_LOTE_INSERCAO = 1000
+
+BACKENDS = ["numpy", "chroma"]
+# até este tamanho de texto (~6 mil chunks de 400 tokens) o índice NumPy é usado:
+# a busca exata ainda leva poucos milissegundos e não há o custo de subir o Chroma
+LIMITE_CARACTERES_NUMPY = 10_000_000
+SUBDIRETORIO_NUMPY = "numpy"
+SUBDIRETORIO_PALAVRAS = "palavras"
+
+
+@dataclass
+class ResumoIndexacao:
+    adicionados : int = 0
+    removidos : int = 0
+    inalterados : int = 0
+    reutilizado : bool = False
+    # identidade do índice, para reabri-lo sem os documentos (ver VectorIndexStore.abrir)
+    nome : str = ""
+    backend : str = ""
+
+    def __str__(self) -> str:
+        return f"+{self.adicionados} -{self.removidos} ={self.inalterados}"
+
+
+class VectorIndexStore:
+    '''
+    Gerencia coleções (NumPy ou Chroma) persistidas em disco, com descarte por TTL
+    (tempo desde o último acesso) e por quantidade máxima de índices (LRU).
+    '''
+    __padrao = None
+    __padrao_lock = threading.Lock()
+
+    @staticmethod
+    def padrao() -> "VectorIndexStore":
+        with VectorIndexStore.__padrao_lock:
+            if VectorIndexStore.__padrao is None:
+                VectorIndexStore.__padrao = VectorIndexStore(DIRETORIO_PADRAO)
+            return VectorIndexStore.__padrao
+
+    @staticmethod
+    def hash_documentos(documentos : List[Document]) -> str:
+        # apenas o conteúdo: metadados como 'source' mudam a cada upload (nome temporário)
+        sha = hashlib.sha256()
+        for doc in documentos:
+            sha.update(doc.page_content.encode("utf-8"))
+            sha.update(b"\0")
+        return sha.hexdigest()
+
+    @staticmethod
+    def ids_chunks(splits : List[Document]) -> List[str]:
+        '''
+        Id estável de cada chunk: hash do conteúdo mais o número da ocorrência,
+        para que chunks idênticos não colidam
+        '''
+        ocorrencias = {}
+        ids = []
+        for split in splits:
+            h = hashlib.sha1(split.page_content.encode("utf-8")).hexdigest()
+            n = ocorrencias.get(h, 0)
+            ocorrencias[h] = n + 1
+            ids.append(f"{h}-{n}")
+        return ids
+
+    @staticmethod
+    def descrever_transformer(transformer : BaseDocumentTransformer) -> str:
+        # parâmetros simples do splitter (ex.: _chunk_size, _chunk_overlap)
+        parametros = {k: v for k, v in sorted(vars(transformer).items())
+                      if isinstance(v, (str, int, float, bool, type(None)))}
+        return f"{type(transformer).__name__}:{json.dumps(parametros, sort_keys=True)}"
+
+    @staticmethod
+    def descrever_embedding(embedding : Embeddings) -> str:
+        return f"{type(embedding).__name__}:{getattr(embedding, 'model', '')}"
+
+    @staticmethod
+    def nome_colecao(documentos : List[Document], transformer : BaseDocumentTransformer, embedding : Embeddings,
+                     documento_id : Optional[str] = None) -> str:
+        # com documento_id a coleção é do documento (e atualizada incrementalmente);
+        # sem ele, é do conteúdo
+        chave = "|".join([documento_id or VectorIndexStore.hash_documentos(documentos),
+                          VectorIndexStore.descrever_transformer(transformer),
+                          VectorIndexStore.descrever_embedding(embedding)])
+        # nomes de coleção do Chroma: 3-63 caracteres alfanuméricos
+        return "idx" + hashlib.sha256(chave.encode("utf-8")).hexdigest()[:48]
+
+    def __init__(self, diretorio : str = DIRETORIO_PADRAO, ttl_segundos : float = TTL_PADRAO_SEGUNDOS,
+                 max_indices : int = MAX_INDICES_PADRAO) -> None:
+        self.diretorio = diretorio
+        self.ttl_segundos = ttl_segundos
+        self.max_indices = max_indices
+        self.__diretorio_numpy = os.path.join(diretorio, SUBDIRETORIO_NUMPY)
+        self.__diretorio_palavras = os.path.join(diretorio, SUBDIRETORIO_PALAVRAS)
+        self.__client = None
+        self.__lock = threading.RLock()
+
+    @staticmethod
+    def escolher_backend(documentos : List[Document]) -> str:
+        tamanho = sum(len(d.page_content) for d in documentos)
+        return "numpy" if tamanho <= LIMITE_CARACTERES_NUMPY else "chroma"
+
+    def __chroma_existe(self) -> bool:
+        return self.__client is not None or os.path.isfile(os.path.join(self.diretorio, "chroma.sqlite3"))
+
+    def __cliente(self):
+        '''
+        Cliente do Chroma, criado (e o chromadb importado) no primeiro uso
+        '''
+        if self.__client is None:
+            try:
+                # o chromadb exige um sqlite3 mais novo que o de alguns ambientes (ex.: streamlit.io)
+                __import__('pysqlite3')
+                import sys
+                sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+            except ImportError:
+                pass
+            import chromadb
+            self.__client = chromadb.PersistentClient(path=self.diretorio)
+        return self.__client
+
+    def __colecao(self, nome : str):
+        try:
+            return self.__cliente().get_collection(nome)
+        except Exception:
+            # coleção inexistente (o tipo da exceção varia entre versões do chromadb)
+            return None
+
+    def __tocar(self, colecao) -> None:
+        metadata = dict(colecao.metadata or {})
+        metadata["ultimo_acesso"] = time.time()
+        colecao.modify(metadata=metadata)
+
+    def obter_ou_criar(self, documentos : List[Document], transformer : BaseDocumentTransformer,
+                       embedding : Embeddings, documento_id : Optional[str] = None,
+                       backend : Optional[str] = None,
+                       palavras : bool = True) -> Tuple[VectorStore, ResumoIndexacao, Optional[KeywordIndex]]:
+        '''
+        Devolve o índice dos documentos, um resumo do que foi feito e, se palavras,
+        o índice de palavras dos mesmos chunks (senão None).
+
+        Se já existe uma coleção com o mesmo conteúdo e parâmetros ela é reutilizada
+        sem split nem embeddings. Se documento_id for informado e o conteúdo mudou,
+        apenas os chunks novos são embedados e os removidos são apagados.
+        backend: "numpy" ou "chroma"; se omitido, o do índice existente do documento ou,
+        para um índice novo, escolhido pelo tamanho dos documentos (uma nova versão que
+        passa do limite continua no mesmo backend, para a atualização ser incremental).
+        Um backend informado diferente do existente migra o índice, sem aproveitar chunks.
+        '''
+        if backend is not None and backend not in BACKENDS:
+            raise Exception(f"O backend '{backend}' não é válido.")
+
+        nome = VectorIndexStore.nome_colecao(documentos, transformer, embedding, documento_id)
+        hash_conteudo = VectorIndexStore.hash_documentos(documentos)
+
+        with self.__lock:
+            self.descartar_expirados()
+
+            existente = self.__backend_existente(nome)
+            if backend is None:
+                backend = existente or VectorIndexStore.escolher_backend(documentos)
+            elif existente and existente != backend:
+                logging.info(f"Índice '{nome}' migrado de {existente} para {backend}")
+                self.remover(nome, existente)
+
+            with MetricsRegistry.padrao().cronometro(ETAPAS, componente="index", etapa="build", backend=backend):
+                if backend == "numpy":
+                    vectordb, resumo, splits = self.__obter_ou_criar_numpy(nome, hash_conteudo, documentos,
+                                                                           transformer, embedding)
+                else:
+                    vectordb, resumo, splits = self.__obter_ou_criar_chroma(nome, hash_conteudo, documentos,
+                                                                            transformer, embedding)
+
+            indice_palavras = None
+            if palavras:
+                indice_palavras = self.__obter_ou_criar_palavras(nome, hash_conteudo, documentos, transformer,
+                                                                 splits, backend)
+
+            if not resumo.reutilizado:
+                logging.info(f"Índice '{nome}' ({backend}) atualizado: {resumo}")
+                self.__descartar_excedentes()
+            resumo.nome, resumo.backend = nome, backend
+            return vectordb, resumo, indice_palavras
+
+    def abrir(self, nome : str, hash_conteudo : str, embedding : Embeddings, backend : str,
+              palavras : bool = True) -> Optional[Tuple[VectorStore, ResumoIndexacao, Optional[KeywordIndex]]]:
+        '''
+        Reabre um índice já criado por obter_ou_criar (ex.: num job em segundo plano) sem
+        carregar nem dividir os documentos. Devolve None se ele não existe mais ou se
+        foi atualizado para outro conteúdo.
+        '''
+        if backend not in BACKENDS:
+            raise Exception(f"O backend '{backend}' não é válido.")
+
+        with self.__lock:
+            with MetricsRegistry.padrao().cronometro(ETAPAS, componente="index", etapa="open", backend=backend):
+                if backend == "numpy":
+                    vectordb = NumpyVectorStore.carregar(os.path.join(self.__diretorio_numpy, nome), embedding)
+                    reutilizado = VectorIndexStore.__reutilizar_numpy(nome, hash_conteudo, vectordb)
+                else:
+                    reutilizado = self.__reutilizar_chroma(nome, hash_conteudo, embedding)
+                if reutilizado is None:
+                    return None
+                vectordb, resumo = reutilizado
+
+                indice_palavras = None
+                if palavras:
+                    diretorio = os.path.join(self.__diretorio_palavras, nome)
+                    if (KeywordIndex.ler_metadata(diretorio) or {}).get("hash_conteudo") != hash_conteudo:
+                        return None
+                    indice_palavras = KeywordIndex.carregar(diretorio)
+
+            resumo.nome, resumo.backend = nome, backend
+            return vectordb, resumo, indice_palavras
+
+    def __backend_existente(self, nome : str) -> Optional[str]:
+        if NumpyVectorStore.ler_metadata(os.path.join(self.__diretorio_numpy, nome)) is not None:
+            return "numpy"
+        # sem índices no Chroma, ele nem é aberto
+        if self.__chroma_existe() and self.__colecao(nome) is not None:
+            return "chroma"
+        return None
+
+    def __obter_ou_criar_palavras(self, nome : str, hash_conteudo : str, documentos : List[Document],
+                                  transformer : BaseDocumentTransformer, splits : Optional[List[Document]],
+                                  backend : str) -> KeywordIndex:
+        '''
+        Índice de palavras do conteúdo atual; só divide os documentos de novo se o índice
+        vetorial foi reutilizado e o de palavras não existe (ex.: criado por uma versão anterior)
+        '''
+        diretorio = os.path.join(self.__diretorio_palavras, nome)
+        if (KeywordIndex.ler_metadata(diretorio) or {}).get("hash_conteudo") == hash_conteudo:
+            return KeywordIndex.carregar(diretorio)
+
+        splits = splits if splits is not None else VectorIndexStore.__dividir(transformer, documentos, backend)
+        with MetricsRegistry.padrao().cronometro(ETAPAS, componente="index", etapa="build_keywords"):
+            indice = KeywordIndex.from_documents(splits, {"hash_conteudo": hash_conteudo})
+            indice.salvar(diretorio)
+        logging.info(f"Índice de palavras '{nome}' criado ({len(indice)} chunks)")
+        return indice
+
+    @staticmethod
+    def __dividir(transformer : BaseDocumentTransformer, documentos : List[Document], backend : str) -> List[Document]:
+        with MetricsRegistry.padrao().cronometro(ETAPAS, componente="index", etapa="split", backend=backend):
+            return transformer.transform_documents(documentos)
+
+    @staticmethod
+    def __diferenca(existentes : set, ids : List[str], splits : List[Document]) -> Tuple[List[str], list]:
+        removidos = list(existentes - set(ids))
+        adicionar = [(i, split) for i, split in zip(ids, splits) if i not in existentes]
+        return removidos, adicionar
+
+    @staticmethod
+    def __reutilizar_numpy(nome : str, hash_conteudo : str,
+                           vectordb : Optional[NumpyVectorStore]) -> Optional[Tuple[NumpyVectorStore, ResumoIndexacao]]:
+        if vectordb is None or len(vectordb) == 0 or vectordb.metadata.get("hash_conteudo") != hash_conteudo:
+            return None
+        logging.info(f"Reutilizando índice '{nome}' ({len(vectordb)} chunks)")
+        vectordb.metadata["ultimo_acesso"] = time.time()
+        vectordb.salvar_metadata()
+        return vectordb, ResumoIndexacao(inalterados=len(vectordb), reutilizado=True)
+
+    def __reutilizar_chroma(self, nome : str, hash_conteudo : str,
+                            embedding : Embeddings) -> Optional[Tuple[VectorStore, ResumoIndexacao]]:
+        # sem índices no Chroma, ele nem é aberto
+        colecao = self.__colecao(nome) if self.__chroma_existe() else None
+        if colecao is None or colecao.count() == 0 or (colecao.metadata or {}).get("hash_conteudo") != hash_conteudo:
+            return None
+        from langchain.vectorstores.chroma import Chroma
+
+        logging.info(f"Reutilizando índice '{nome}' ({colecao.count()} chunks)")
+        self.__tocar(colecao)
+        vectordb = Chroma(client=self.__cliente(), collection_name=nome, embedding_function=embedding)
+        return vectordb, ResumoIndexacao(inalterados=colecao.count(), reutilizado=True)
+
+    def __obter_ou_criar_numpy(self, nome : str, hash_conteudo : str, documentos : List[Document],
+                               transformer : BaseDocumentTransformer,
+                               embedding : Embeddings) -> Tuple[NumpyVectorStore, ResumoIndexacao,
+                                                                Optional[List[Document]]]:
+        diretorio = os.path.join(self.__diretorio_numpy, nome)
+        vectordb = NumpyVectorStore.carregar(diretorio, embedding)
+        reutilizado = VectorIndexStore.__reutilizar_numpy(nome, hash_conteudo, vectordb)
+        if reutilizado is not None:
+            return reutilizado + (None,)
+
+        agora = time.time()
+        if vectordb is None:
+            vectordb = NumpyVectorStore(embedding, diretorio)
+            vectordb.metadata["criado_em"] = agora
+
+        splits = VectorIndexStore.__dividir(transformer, documentos, "numpy")
+        ids = VectorIndexStore.ids_chunks(splits)
+        existentes = set(vectordb.ids())
+        removidos, adicionar = VectorIndexStore.__diferenca(existentes, ids, splits)
+        if removidos:
+            vectordb.delete(removidos)
+        if adicionar:
+            vectordb.add_texts([split.page_content for _, split in adicionar],
+                               [split.metadata for _, split in adicionar], [i for i, _ in adicionar])
+
+        vectordb.metadata.update({"ultimo_acesso": agora, "documentos": len(documentos), "hash_conteudo": hash_conteudo})
+        vectordb.salvar()
+        return vectordb, ResumoIndexacao(adicionados=len(adicionar), removidos=len(removidos),
+                                         inalterados=len(set(ids) & existentes)), splits
+
+    def __obter_ou_criar_chroma(self, nome : str, hash_conteudo : str, documentos : List[Document],
+                                transformer : BaseDocumentTransformer,
+                                embedding : Embeddings) -> Tuple[VectorStore, ResumoIndexacao,
+                                                                 Optional[List[Document]]]:
+        from langchain.vectorstores.chroma import Chroma
+
+        reutilizado = self.__reutilizar_chroma(nome, hash_conteudo, embedding)
+        if reutilizado is not None:
+            return reutilizado + (None,)
+
+        splits = VectorIndexStore.__dividir(transformer, documentos, "chroma")
+        ids = VectorIndexStore.ids_chunks(splits)
+        agora = time.time()
+
+        vectordb = Chroma(client=self.__cliente(), collection_name=nome, embedding_function=embedding,
+                          collection_metadata={"criado_em": agora, "documentos": len(documentos)})
+        colecao = self.__cliente().get_collection(nome)
+
+        existentes = set(colecao.get(include=[])["ids"])
+        novos = set(ids)
+
+        removidos, adicionar = VectorIndexStore.__diferenca(existentes, ids, splits)
+        if removidos:
+            colecao.delete(ids=removidos)
+
+        for inicio in range(0, len(adicionar), TAMANHO_LOTE_INSERCAO):
+            lote = adicionar[inicio:inicio + TAMANHO_LOTE_INSERCAO]
+            vectordb.add_documents([split for _, split in lote], ids=[i for i, _ in lote])
+
+        metadata = dict(colecao.metadata or {})
+        metadata.update({"ultimo_acesso": agora, "documentos": len(documentos), "hash_conteudo": hash_conteudo})
+        colecao.modify(metadata=metadata)
+
+        resumo = ResumoIndexacao(adicionados=len(adicionar), removidos=len(removidos),
+                                 inalterados=len(novos & existentes))
+        return vectordb, resumo, splits
+
+    def listar(self) -> List[dict]:
+        indices = []
+        if os.path.isdir(self.__diretorio_numpy):
+            for nome in os.listdir(self.__diretorio_numpy):
+                metadata = NumpyVectorStore.ler_metadata(os.path.join(self.__diretorio_numpy, nome)) or {}
+                indices.append({
+                    "nome": nome,
+                    "backend": "numpy",
+                    "chunks": metadata.get("chunks", 0),
+                    "documentos": metadata.get("documentos"),
+                    "criado_em": metadata.get("criado_em"),
+                    "ultimo_acesso": metadata.get("ultimo_acesso", 0),
+                })
+        # o Chroma só é aberto se já houver índices nele
+        if self.__chroma_existe():
+            for colecao in self.__cliente().list_collections():
+                metadata = colecao.metadata or {}
+                indices.append({
+                    "nome": colecao.name,
+                    "backend": "chroma",
+                    "chunks": colecao.count(),
+                    "documentos": metadata.get("documentos"),
+                    "criado_em": metadata.get("criado_em"),
+                    "ultimo_acesso": metadata.get("ultimo_acesso", 0),
+                })
+        return sorted(indices, key=lambda i: i["ultimo_acesso"], reverse=True)
+
+    def remover(self, nome : str, backend : str = "chroma") -> None:
+        if backend == "numpy":
+            shutil.rmtree(os.path.join(self.__diretorio_numpy, nome), ignore_errors=True)
+        else:
+            self.__cliente().delete_collection(nome)
+        shutil.rmtree(os.path.join(self.__diretorio_palavras, nome), ignore_errors=True)
+        logging.info(f"Índice '{nome}' ({backend}) removido")
+
+    def purgar(self) -> int:
+        indices = self.listar()
+        for indice in indices:
+            self.remover(indice["nome"], indice["backend"])
+        return len(indices)
+
+    def descartar_expirados(self) -> int:
+        limite = time.time() - self.ttl_segundos
+        expirados = [i for i in self.listar() if i["ultimo_acesso"] < limite]
+        for indice in expirados:
+            self.remover(indice["nome"], indice["backend"])
+        return len(expirados)
+
+    def __descartar_excedentes(self) -> None:
+        indices = self.listar()
+        for indice in indices[self.max_indices:]:
+            self.remover(indice["nome"], indice["backend"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lista ou remove índices vetoriais persistidos")
+    parser.add_argument("comando", choices=["listar", "purgar", "expirar"])
+    parser.add_argument("--diretorio", default=DIRETORIO_PADRAO)
+    args = parser.parse_args()
+
+    store = VectorIndexStore(args.diretorio)
+    if args.comando == "listar":
+        for indice in store.listar():
+            print(f"{indice['nome']}  backend={indice['backend']}  chunks={indice['chunks']}  documentos={indice['documentos']}  "
+                  f"ultimo_acesso={time.strftime('%Y-%m-%d %H:%M', time.localtime(indice['ultimo_acesso']))}")
+    elif args.comando == "purgar":
+        print(f"{store.purgar()} índices removidos")
+    else:
+        print(f"{store.descartar_expirados()} índices expirados removidos")
@@ -0,0 +1,65 @@
+# Registro de modelos Vosk carregados uma única vez por processo. Os KaldiRecognizer
+# não são reaproveitados: o Reset() não zera a contagem de amostras já vistas, e os
+# tempos das palavras de uma segunda transcrição viriam deslocados. Criar um recognizer
+# custa pouco perto de carregar o modelo.
+import logging
+import os
+import re
+import threading
+from typing import Dict
+from vosk import Model, KaldiRecognizer
+
+TAXA_AMOSTRAGEM_PADRAO = 16000
+
+
+class VoskModelRegistry:
+    '''
+    Carrega cada modelo na primeira vez que é pedido (com lock por caminho, de modo
+    que transcrições concorrentes esperam a mesma carga em vez de repeti-la)
+    '''
+    __modelos : Dict[str, Model] = {}
+    __taxas : Dict[str, int] = {}
+    __locks : Dict[str, threading.Lock] = {}
+    __lock = threading.Lock()
+
+    @staticmethod
+    def __lock_do_modelo(caminho : str) -> threading.Lock:
+        with VoskModelRegistry.__lock:
+            return VoskModelRegistry.__locks.setdefault(caminho, threading.Lock())
+
+    @staticmethod
+    def obter(caminho : str) -> Model:
+        caminho = os.path.abspath(caminho)
+        modelo = VoskModelRegistry.__modelos.get(caminho)
+        if modelo is not None:
+            return modelo
+
+        with VoskModelRegistry.__lock_do_modelo(caminho):
+            if caminho not in VoskModelRegistry.__modelos:
+                logging.info(f"Carregando o modelo Vosk '{caminho}'...")
+                VoskModelRegistry.__modelos[caminho] = Model(caminho)
+            return VoskModelRegistry.__modelos[caminho]
+
+    @staticmethod
+    def taxa_amostragem(caminho : str) -> int:
+        '''
+        Taxa de amostragem esperada pelo modelo, lida de conf/mfcc.conf
+        '''
+        caminho = os.path.abspath(caminho)
+        if caminho not in VoskModelRegistry.__taxas:
+            taxa = TAXA_AMOSTRAGEM_PADRAO
+            mfcc = os.path.join(caminho, "conf", "mfcc.conf")
+            if os.path.isfile(mfcc):
+                with open(mfcc, "r") as f:
+                    encontrado = re.search(r"--sample-frequency=(\d+)", f.read())
+                    if encontrado:
+                        taxa = int(encontrado.group(1))
+            VoskModelRegistry.__taxas[caminho] = taxa
+        return VoskModelRegistry.__taxas[caminho]
+
+    @staticmethod
+    def novo_recognizer(caminho : str) -> KaldiRecognizer:
+        '''
+        Recognizer novo (tempos a partir de zero) sobre o modelo compartilhado
+        '''
+        return KaldiRecognizer(VoskModelRegistry.obter(caminho), VoskModelRegistry.taxa_amostragem(caminho))
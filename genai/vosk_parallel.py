@@ -0,0 +1,113 @@
+# Transcrição offline (Vosk) em paralelo entre núcleos: o áudio é dividido em
+# silêncios em segmentos independentes, reconhecidos por um pool de processos em
+# que cada worker carrega o modelo uma única vez.
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from genai.audio_stream import AudioStream
+from genai.media_io import MediaSource
+from genai.segments import Segmento, juntar_texto
+from genai.silence import segmentar_em_silencios
+from genai.vosk_models import VoskModelRegistry
+from typing import Callable, List, Optional, Tuple, Union
+
+SEGMENTO_ALVO_SEGUNDOS = 30
+BYTES_POR_LEITURA = 8000
+
+# caminho do modelo no processo worker (definido pelo initializer)
+_caminho_modelo_worker = None
+
+
+@dataclass
+class ResultadoParalelo:
+    texto : str
+    segmentos : List[Segmento]  # em ordem de tempo, com tempos globais
+    duracao_audio_segundos : float
+    wall_segundos : float
+
+    @property
+    def real_time_factor(self) -> float:
+        '''
+        Segundos de processamento por segundo de áudio (menor é melhor)
+        '''
+        return self.wall_segundos / self.duracao_audio_segundos if self.duracao_audio_segundos else 0.0
+
+
+def _inicializar_worker(caminho_modelo : str) -> None:
+    global _caminho_modelo_worker
+    _caminho_modelo_worker = caminho_modelo
+    VoskModelRegistry.obter(caminho_modelo)
+
+
+def _reconhecer_segmento(indice : int, inicio_segundos : float, pcm : bytes) -> Tuple[int, List[Segmento]]:
+    frases = []
+    # recognizer novo por segmento: os tempos das palavras contam a partir do início dele
+    recognizer = VoskModelRegistry.novo_recognizer(_caminho_modelo_worker)
+    recognizer.SetWords(True)
+
+    def coletar(resultado : dict) -> None:
+        texto = resultado.get("text", "")
+        palavras = resultado.get("result", [])
+        if texto and texto != "<UNK>" and palavras:
+            frases.append(Segmento(inicio_segundos + palavras[0]["start"], inicio_segundos + palavras[-1]["end"],
+                                   texto, indice))
+
+    for inicio in range(0, len(pcm), BYTES_POR_LEITURA):
+        if recognizer.AcceptWaveform(pcm[inicio:inicio + BYTES_POR_LEITURA]):
+            coletar(json.loads(recognizer.Result()))
+    coletar(json.loads(recognizer.FinalResult()))
+
+    return indice, frases
+
+
+def transcrever_em_paralelo(nome_arquivo : Union[str, MediaSource], caminho_modelo : str, processos : Optional[int] = None,
+                            segmento_alvo_segundos : float = SEGMENTO_ALVO_SEGUNDOS,
+                            on_progress : Optional[Callable[[int, int, int, str], None]] = None,
+                            inicio_segundos : Optional[float] = None,
+                            fim_segundos : Optional[float] = None) -> ResultadoParalelo:
+    processos = processos or os.cpu_count() or 1
+    taxa = VoskModelRegistry.taxa_amostragem(caminho_modelo)
+    stream = AudioStream(nome_arquivo, segmento_alvo_segundos, sample_rate=taxa, canais=1,
+                         inicio_segundos=inicio_segundos, fim_segundos=fim_segundos)
+    total = stream.quantidade_chunks()
+
+    inicio = time.perf_counter()
+    resultados = {}
+    duracao = 0.0
+    concluidos = 0
+
+    with ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_worker,
+                             initargs=(caminho_modelo,)) as executor:
+        pendentes = set()
+
+        def coletar(futures) -> None:
+            nonlocal concluidos
+            for future in futures:
+                pendentes.discard(future)
+                indice, frases = future.result()
+                resultados[indice] = frases
+                concluidos += 1
+                if on_progress:
+                    on_progress(concluidos, max(total, concluidos), indice, juntar_texto(frases))
+
+        # no máximo 2 segmentos por processo em memória
+        for segmento in segmentar_em_silencios(stream, segmento_alvo_segundos):
+            duracao += segmento.duracao_segundos
+            pendentes.add(executor.submit(_reconhecer_segmento, segmento.indice, segmento.inicio_segundos, segmento.pcm))
+            if len(pendentes) >= processos * 2:
+                finalizados, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                coletar(finalizados)
+        coletar(list(pendentes))
+
+    wall = time.perf_counter() - inicio
+
+    # segmentos em ordem de tempo: os segmentos de áudio em ordem, e as frases de cada um na ordem reconhecida
+    frases = [f for indice in sorted(resultados) for f in resultados[indice]]
+    resultado = ResultadoParalelo(texto=juntar_texto(frases), segmentos=frases,
+                                  duracao_audio_segundos=duracao, wall_segundos=wall)
+    logging.info(f"Vosk paralelo: {duracao:0.0f}s de áudio em {wall:0.1f}s com {processos} processos "
+                 f"(RTF {resultado.real_time_factor:0.3f})")
+    return resultado
@@ -0,0 +1,131 @@
+'''
+Persistent embedding cache with the offline HashingFakeEmbeddings: hits and misses,
+deduplication, recovery from an interrupted write, the size cap and two processes
+appending to the same cache.
+'''
+import multiprocessing
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain")
+
+from genai.embedding_cache import CachedEmbeddings, EmbeddingCache, HashingFakeEmbeddings
+from genai.token_splitter import obter_tokenizer
+
+DIMENSAO = 8
+LOTES = 300
+
+
+@pytest.fixture
+def tokenizer():
+    # CachedEmbeddings conta os tokens enviados; o tiktoken baixa o encoding na primeira vez
+    try:
+        return obter_tokenizer()
+    except Exception as e:
+        pytest.skip(f"encoding do tiktoken indisponível: {e}")
+
+
+def vetores(textos):
+    return np.array(HashingFakeEmbeddings(DIMENSAO).embed_documents(textos), dtype=np.float32)
+
+
+def conferir(cache, textos):
+    encontrados = cache.obter([EmbeddingCache.hash_texto(t) for t in textos])
+    assert len(encontrados) == len(textos)
+    for texto, esperado in zip(textos, vetores(textos)):
+        np.testing.assert_array_equal(encontrados[EmbeddingCache.hash_texto(texto)], esperado)
+
+
+def adicionar(cache, textos):
+    cache.adicionar([EmbeddingCache.hash_texto(t) for t in textos], vetores(textos))
+
+
+def test_hits_misses_e_deduplicacao(tmp_path, tokenizer):
+    upstream = HashingFakeEmbeddings(DIMENSAO)
+    embeddings = CachedEmbeddings(upstream, diretorio=str(tmp_path))
+
+    primeira = embeddings.embed_documents(["a", "b", "a", "c"])
+    assert upstream.textos_embedados == 3
+    assert (embeddings.hits, embeddings.misses) == (1, 3)
+    assert primeira[0] == primeira[2]
+
+    segunda = embeddings.embed_documents(["c", "b", "d"])
+    assert upstream.textos_embedados == 4
+    assert (embeddings.hits, embeddings.misses) == (3, 4)
+    assert segunda[:2] == [primeira[3], primeira[1]]
+
+    # outra instância (nova sessão) lê do disco
+    upstream_novo = HashingFakeEmbeddings(DIMENSAO)
+    assert CachedEmbeddings(upstream_novo, diretorio=str(tmp_path)).embed_documents(["a", "d"]) == [primeira[0], segunda[2]]
+    assert upstream_novo.textos_embedados == 0
+
+
+def test_perguntas_nao_sao_persistidas(tmp_path, tokenizer):
+    upstream = HashingFakeEmbeddings(DIMENSAO)
+    embeddings = CachedEmbeddings(upstream, diretorio=str(tmp_path))
+    embeddings.embed_documents(["documento"])
+
+    pergunta = embeddings.embed_query("qual o total do pedido 42?")
+    assert embeddings.embed_query("qual o total do pedido 42?") == pergunta
+    assert upstream.textos_embedados == 2
+    assert len(embeddings.cache) == 1
+
+
+def test_escrita_interrompida_e_descartada(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    adicionar(cache, ["a", "b", "c"])
+
+    # vetor sem chave e chave sem "\n", como numa escrita interrompida
+    with open(tmp_path / "vetores.f32", "ab") as f:
+        f.write(vetores(["d"]).tobytes()[:-3])
+    with open(tmp_path / "chaves.txt", "a") as f:
+        f.write(EmbeddingCache.hash_texto("d")[:10])
+
+    reaberto = EmbeddingCache(str(tmp_path))
+    assert len(reaberto) == 3
+    assert os.path.getsize(tmp_path / "vetores.f32") == 3 * DIMENSAO * 4
+    conferir(reaberto, ["a", "b", "c"])
+
+    adicionar(reaberto, ["d", "e"])
+    conferir(EmbeddingCache(str(tmp_path)), ["a", "b", "c", "d", "e"])
+
+
+def test_limite_de_tamanho_descarta_os_mais_antigos(tmp_path):
+    bytes_por_vetor = DIMENSAO * 4
+    cache = EmbeddingCache(str(tmp_path), max_bytes=100 * bytes_por_vetor)
+    textos = [f"texto {i}" for i in range(250)]
+    for inicio in range(0, len(textos), 10):
+        adicionar(cache, textos[inicio:inicio + 10])
+
+    assert os.path.getsize(tmp_path / "vetores.f32") <= 100 * bytes_por_vetor
+    restantes = [t for t in textos if cache.obter([EmbeddingCache.hash_texto(t)])]
+    assert restantes == textos[-len(restantes):]
+    conferir(cache, restantes)
+    conferir(EmbeddingCache(str(tmp_path)), restantes)
+
+
+def _escrever(diretorio, processo, inicio):
+    cache = EmbeddingCache(diretorio)
+    inicio.wait()
+    for lote in range(LOTES):
+        # metade dos textos é comum aos dois processos
+        adicionar(cache, [f"comum {lote} {i}" for i in range(5)] + [f"p{processo} {lote} {i}" for i in range(5)])
+
+
+def test_dois_processos_no_mesmo_cache(tmp_path):
+    contexto = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    inicio = contexto.Event()
+    processos = [contexto.Process(target=_escrever, args=(str(tmp_path), p, inicio)) for p in range(2)]
+    for processo in processos:
+        processo.start()
+    inicio.set()
+    for processo in processos:
+        processo.join(60)
+        assert processo.exitcode == 0
+
+    cache = EmbeddingCache(str(tmp_path))
+    textos = ([f"comum {lote} {i}" for lote in range(LOTES) for i in range(5)]
+              + [f"p{p} {lote} {i}" for p in range(2) for lote in range(LOTES) for i in range(5)])
+    assert len(cache) == len(textos)
+    conferir(cache, textos)
@@ -0,0 +1,98 @@
+'''
+Job queue shared by several processes through one SQLite file: a queue only reclaims
+jobs whose owner stopped renewing its lease, and jobs that depend on the memory of
+the process that submitted them run (or fail) with it. Each JobQueue instance has
+its own owner id, so two instances play the part of two processes.
+'''
+import sqlite3
+import threading
+import time
+import pytest
+
+from genai.jobs import JobQueue, CONCLUIDO, EXECUTANDO, FALHOU, PENDENTE
+
+
+@pytest.fixture
+def caminho(tmp_path):
+    return str(tmp_path / "jobs.sqlite")
+
+
+def esperar_status(fila, job_id, status, timeout=5.0):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        job = fila.obter(job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} ficou em {fila.obter(job_id)['status']}, esperado {status}")
+
+
+def expirar(caminho, fila):
+    # simula a morte do processo da fila: o prazo dela não é mais renovado
+    with sqlite3.connect(caminho) as conn:
+        conn.execute("UPDATE donos SET expira_em = 0 WHERE dono = ?", (fila.dono,))
+
+
+def fila_com_handler_bloqueante(caminho, workers=1):
+    liberar = threading.Event()
+    fila = JobQueue(caminho, workers=workers)
+    fila.registrar("lento", lambda parametros, progresso: liberar.wait(5) and {"ok": True})
+    fila.registrar("memoria", lambda parametros, progresso: {"ok": True},
+                   retomavel=lambda parametros: False)
+    return fila, liberar
+
+
+def test_outro_processo_nao_retoma_job_em_execucao(caminho):
+    a, liberar = fila_com_handler_bloqueante(caminho)
+    a.iniciar()
+    job_id = a.submeter("lento", {"n": 1})
+    assert esperar_status(a, job_id, EXECUTANDO)["dono"] == a.dono
+
+    b, _ = fila_com_handler_bloqueante(caminho, workers=0)
+    b.iniciar()
+    assert b.recuperar() == 0
+    assert b.obter(job_id)["status"] == EXECUTANDO
+
+    liberar.set()
+    esperar_status(a, job_id, CONCLUIDO)
+    a.parar()
+    b.parar()
+
+
+def test_job_de_processo_morto_volta_para_a_fila(caminho):
+    a, liberar = fila_com_handler_bloqueante(caminho)
+    a.iniciar()
+    job_id = a.submeter("lento", {"n": 2})
+    esperar_status(a, job_id, EXECUTANDO)
+    expirar(caminho, a)
+
+    b, _ = fila_com_handler_bloqueante(caminho, workers=0)
+    b.iniciar()
+    job = b.obter(job_id)
+    assert (job["status"], job["dono"], job["progresso"]) == (PENDENTE, None, 0)
+
+    liberar.set()
+    a.parar()
+    b.parar()
+
+
+def test_job_nao_retomavel_fica_com_quem_o_submeteu(caminho):
+    a, _ = fila_com_handler_bloqueante(caminho, workers=0)
+    a.iniciar()
+    job_id = a.submeter("memoria", {"fonte": "abc.wav"})
+    assert a.obter(job_id)["origem"] == a.dono
+
+    # outro processo não o executa
+    b, _ = fila_com_handler_bloqueante(caminho)
+    b.iniciar()
+    time.sleep(0.3)
+    assert b.obter(job_id)["status"] == PENDENTE
+
+    # e o marca como falho quando quem o submeteu morre
+    expirar(caminho, a)
+    assert b.recuperar() == 1
+    job = b.obter(job_id)
+    assert job["status"] == FALHOU
+    assert "envie o arquivo novamente" in job["erro"]
+    a.parar()
+    b.parar()
@@ -0,0 +1,119 @@
+'''
+Keyword retrieval on small, hand-checked corpora: the BM25 ranking, exact column
+filters on table rows, parsing of the filter text and the tie order of the
+reciprocal rank fusion used by the hybrid strategy.
+'''
+import math
+import pytest
+
+pytest.importorskip("langchain")
+
+from genai.keyword_index import B, K1, KeywordIndex, atende_filtros, interpretar_filtros
+from genai.retrieval import fundir_rrf
+from langchain.schema import Document
+
+TEXTOS = [
+    "o pedido 42 foi entregue ontem",
+    "pedido atrasado: o pedido 17 está atrasado atrasado",
+    "o pedido 99 está atrasado",
+    "nota fiscal do pedido 42",
+]
+
+LINHAS = [
+    ("cliente: Ana\nstatus: atrasado\ntotal: 120.0", {"row_start": 0}),
+    ("cliente: Bruno\nstatus: entregue\ntotal: 80", {"row_start": 1}),
+    ("cliente: Carla\nstatus: atrasado\ntotal: 45", {"row_start": 2}),
+    ("cliente: Ana\nstatus: entregue\ntotal: 300", {"row_start": 3}),
+]
+
+
+def conteudos(resultados):
+    return [documento.page_content for documento, _ in resultados]
+
+
+def bm25(tf, comprimento, media, n, df):
+    # fórmula de referência, termo a termo
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * comprimento / media))
+
+
+@pytest.fixture
+def tabela():
+    return KeywordIndex.construir([texto for texto, _ in LINHAS], [meta for _, meta in LINHAS])
+
+
+def test_ranking_bm25():
+    indice = KeywordIndex.construir(TEXTOS, [{} for _ in TEXTOS])
+    resultados = indice.buscar("atrasado", k=4)
+
+    # o chunk com o termo três vezes vem antes; os sem o termo ficam de fora
+    assert conteudos(resultados) == [TEXTOS[1], TEXTOS[2]]
+    comprimentos = [6, 8, 5, 5]
+    media = sum(comprimentos) / len(comprimentos)
+    esperados = [bm25(3, 8, media, 4, 2), bm25(1, 5, media, 4, 2)]
+    assert [score for _, score in resultados] == pytest.approx(esperados, rel=1e-5)
+
+
+def test_ranking_com_varios_termos():
+    indice = KeywordIndex.construir(TEXTOS, [{} for _ in TEXTOS])
+    # "42" em dois chunks, "nota" e "fiscal" só no último
+    assert conteudos(indice.buscar("nota fiscal 42", k=2)) == [TEXTOS[3], TEXTOS[0]]
+    assert indice.buscar("inexistente") == []
+
+
+def test_indice_salvo_e_carregado_ordena_igual(tmp_path):
+    indice = KeywordIndex.construir(TEXTOS, [{} for _ in TEXTOS])
+    indice.salvar(str(tmp_path))
+    carregado = KeywordIndex.carregar(str(tmp_path)).buscar("pedido atrasado 42")
+    original = indice.buscar("pedido atrasado 42")
+    assert conteudos(carregado) == conteudos(original)
+    assert [score for _, score in carregado] == [score for _, score in original]
+
+
+def test_filtro_exclui_linhas(tabela):
+    candidatos = tabela.filtrar({"status": "atrasado"})
+    assert candidatos.tolist() == [0, 2]
+
+    # a busca só considera os candidatos, mesmo que outra linha tenha o termo
+    assert conteudos(tabela.buscar("Ana", k=4, candidatos=candidatos)) == [LINHAS[0][0], LINHAS[2][0]]
+    assert tabela.filtrar({"Status": " Atrasado ", "cliente": "ana"}).tolist() == [0]
+    # "120.0" é comparado como "120"
+    assert tabela.filtrar({"total": "120"}).tolist() == [0]
+    assert tabela.filtrar({"status": "cancelado"}).tolist() == []
+
+
+def test_atende_filtros_usa_o_mesmo_criterio(tabela):
+    documentos = [Document(page_content=texto, metadata=meta) for texto, meta in LINHAS]
+    filtros = {"status": "atrasado", "cliente": "Carla"}
+    assert [atende_filtros(d, filtros) for d in documentos] == [False, False, True, False]
+    assert tabela.filtrar(filtros).tolist() == [2]
+
+
+def test_interpretar_filtros():
+    assert interpretar_filtros("status = atrasado; ; nome do cliente=Ana Maria") == \
+        {"status": "atrasado", "nome do cliente": "Ana Maria"}
+    assert interpretar_filtros("  ") == {}
+
+
+@pytest.mark.parametrize("texto", ["status", "status=atrasado; cliente", "=atrasado"])
+def test_filtro_malformado(texto):
+    with pytest.raises(Exception, match="Filtro inválido"):
+        interpretar_filtros(texto)
+
+
+def test_rrf_empates_ficam_na_ordem_em_que_apareceram():
+    a, b, c, d = (Document(page_content=t) for t in "abcd")
+
+    # a e b trocam de posição nas duas listas: mesma soma, a apareceu primeiro
+    assert [doc.page_content for doc in fundir_rrf([[a, b], [b, a]])] == ["a", "b"]
+    assert [doc.page_content for doc in fundir_rrf([[b, a], [a, b]])] == ["b", "a"]
+    # c e d só em uma lista cada, na mesma posição; a nas duas passa à frente
+    assert [doc.page_content for doc in fundir_rrf([[c, a], [d, a]])] == ["a", "c", "d"]
+
+
+def test_rrf_deduplica_pelo_conteudo():
+    primeiro = Document(page_content="a", metadata={"lista": 1})
+    fundidos = fundir_rrf([[primeiro], [Document(page_content="a", metadata={"lista": 2})]])
+    assert len(fundidos) == 1
+    assert fundidos[0].metadata == {"lista": 1}
+    assert fundir_rrf([]) == []
@@ -0,0 +1,63 @@
+'''
+SRT and WebVTT export of timed segments: timestamps past one hour, rounding to the
+millisecond (including a carry into the next second and minute), empty input and
+segments without text.
+'''
+import pytest
+
+from genai.segments import Segmento, desserializar, para_json, para_srt, para_vtt, serializar
+
+
+def test_srt():
+    segmentos = [Segmento(0.0, 2.5, " bom dia "), Segmento(2.5, 61.25, "tudo bem?", chunk=1)]
+    assert para_srt(segmentos) == (
+        "1\n00:00:00,000 --> 00:00:02,500\nbom dia\n"
+        "\n"
+        "2\n00:00:02,500 --> 00:01:01,250\ntudo bem?\n"
+    )
+
+
+def test_vtt():
+    segmentos = [Segmento(0.0, 2.5, "bom dia"), Segmento(2.5, 61.25, "tudo bem?")]
+    assert para_vtt(segmentos) == (
+        "WEBVTT\n"
+        "\n"
+        "00:00:00.000 --> 00:00:02.500\nbom dia\n"
+        "\n"
+        "00:00:02.500 --> 00:01:01.250\ntudo bem?\n"
+    )
+
+
+@pytest.mark.parametrize("segundos, srt, vtt", [
+    (3600.0, "01:00:00,000", "01:00:00.000"),
+    (3599.9996, "01:00:00,000", "01:00:00.000"),
+    (59.9996, "00:01:00,000", "00:01:00.000"),
+    (59.9994, "00:00:59,999", "00:00:59.999"),
+    (1.0004, "00:00:01,000", "00:00:01.000"),
+    (36000 + 23 * 60 + 45.678, "10:23:45,678", "10:23:45.678"),
+    (100 * 3600 + 0.5, "100:00:00,500", "100:00:00.500"),
+])
+def test_tempos(segundos, srt, vtt):
+    segmentos = [Segmento(segundos, segundos, "x")]
+    assert para_srt(segmentos).splitlines()[1] == f"{srt} --> {srt}"
+    assert para_vtt(segmentos).splitlines()[2] == f"{vtt} --> {vtt}"
+
+
+def test_sem_segmentos():
+    assert para_srt([]) == ""
+    assert para_vtt([]) == "WEBVTT\n"
+    assert para_json([]) == "[]"
+
+
+def test_segmentos_sem_texto_nao_viram_legendas():
+    segmentos = [Segmento(0.0, 1.0, "  "), Segmento(1.0, 2.0, "olá"), Segmento(2.0, 3.0, "")]
+    assert para_srt(segmentos) == "1\n00:00:01,000 --> 00:00:02,000\nolá\n"
+    assert para_vtt(segmentos) == "WEBVTT\n\n00:00:01.000 --> 00:00:02.000\nolá\n"
+    assert para_srt(segmentos[:1]) == ""
+
+
+def test_serializacao():
+    segmentos = [Segmento(0.0, 1.5, "olá", chunk=2)]
+    assert desserializar(serializar(segmentos)) == segmentos
+    # entrada antiga do cache, apenas com o texto
+    assert desserializar("texto antigo") == [Segmento(0.0, 0.0, "texto antigo")]
@@ -0,0 +1,40 @@
+'''
+Token budget splitter: sentences taken out of an oversized paragraph are joined back
+with a space, and whole paragraphs with a blank line.
+'''
+import pytest
+
+pytest.importorskip("langchain")
+
+from genai.token_splitter import TokenBudgetSplitter, obter_tokenizer
+
+
+@pytest.fixture
+def splitter():
+    # o tiktoken baixa o encoding na primeira vez
+    try:
+        obter_tokenizer()
+    except Exception as e:
+        pytest.skip(f"encoding do tiktoken indisponível: {e}")
+    return TokenBudgetSplitter()
+
+
+def paragrafo_longo(inicio, frases=120):
+    return " ".join(f"{inicio} {i} do paragrafo." for i in range(frases))
+
+
+def test_frases_de_um_paragrafo_longo_sao_juntadas_com_espaco(splitter):
+    texto = "Introdução curta.\n\n" + paragrafo_longo("Primeira") + "\n\n" + paragrafo_longo("Segunda")
+    chunks = splitter.split_text(texto)
+
+    assert len(chunks) > 2
+    assert chunks[0].startswith("Introdução curta.\n\nPrimeira 0 do paragrafo. Primeira 1 do paragrafo.")
+    # a linha em branco só aparece nas duas divisas de parágrafo do texto
+    divisas = ("curta.\n\nPrimeira 0 ", "Primeira 119 do paragrafo.\n\nSegunda 0 ")
+    for chunk in chunks:
+        assert chunk.count("\n\n") == sum(chunk.count(divisa) for divisa in divisas)
+    assert any(divisas[1] in chunk for chunk in chunks)
+
+
+def test_paragrafos_inteiros_continuam_separados_por_linha_em_branco(splitter):
+    assert splitter.split_text("Um parágrafo.\n\nOutro parágrafo.") == ["Um parágrafo.\n\nOutro parágrafo."]
@@ -0,0 +1,113 @@
+'''
+Concurrent OpenAI transcription against the local fake API: the chunks come back
+in order, failed requests are retried with backoff and progress is reported.
+Needs the openai package and the ffmpeg binary.
+'''
+import random
+import shutil
+import threading
+import time
+import pytest
+
+openai = pytest.importorskip("openai")
+pytest.importorskip("ffmpeg")
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+from benchmarks.fake_openai_server import start_in_background
+from benchmarks.fixtures import gerar_wav
+from genai.transcription import Transcription
+
+DURACAO_SEGUNDOS = 60
+# uploads em wav de ~10 s (32000 bytes por segundo em mono 16 kHz): 6 chunks
+ORCAMENTO_BYTES = 400_000
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    servidores = []
+
+    def iniciar(**kwargs):
+        server = start_in_background(**kwargs)
+        servidores.append(server)
+        monkeypatch.setattr(openai, "api_base", f"http://127.0.0.1:{server.server_port}/v1")
+        monkeypatch.setattr(openai, "api_key", "sk-fake")
+        return server
+
+    yield iniciar
+    for server in servidores:
+        server.shutdown()
+
+
+@pytest.fixture
+def wav(tmp_path):
+    return gerar_wav(str(tmp_path / "audio.wav"), DURACAO_SEGUNDOS)
+
+
+def transcrever(wav, **kwargs) -> Transcription:
+    t = Transcription(wav, usar_cache=False, formato_upload="wav", orcamento_bytes_chunk=ORCAMENTO_BYTES, **kwargs)
+    t.obter_segmentos()
+    return t
+
+
+def test_chunks_concorrentes_voltam_em_ordem(fake_api, wav, monkeypatch):
+    server = fake_api()
+    # atrasos aleatórios para que os chunks terminem fora de ordem
+    original = openai.Audio.transcribe
+    sorteio = random.Random(7)
+
+    def fora_de_ordem(*args, **kwargs):
+        time.sleep(sorteio.uniform(0.0, 0.3))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(openai.Audio, "transcribe", fora_de_ordem)
+
+    t = transcrever(wav, max_workers=4)
+
+    chunks = [s.chunk for s in t.last_segments]
+    assert chunks == sorted(chunks)
+    assert sorted(set(chunks)) == list(range(len(set(chunks))))
+    assert len(set(chunks)) > 1
+    inicios = [s.inicio for s in t.last_segments]
+    assert inicios == sorted(inicios)
+    assert t.last_segments[-1].fim == pytest.approx(DURACAO_SEGUNDOS, abs=0.5)
+    assert server.stats["audio/transcriptions"]["requests"] == len(set(chunks))
+
+
+def test_falhas_sao_repetidas_com_backoff(fake_api, wav, monkeypatch):
+    server = fake_api(fail_first=3)
+    monkeypatch.setattr(Transcription, "BACKOFF_SEGUNDOS", 0.01)
+    esperas = []
+    dormir = time.sleep
+    monkeypatch.setattr(time, "sleep", lambda segundos: (esperas.append(segundos), dormir(segundos)))
+
+    t = transcrever(wav, max_workers=1, max_tentativas=4)
+
+    assert server.stats["rate_limited"]["requests"] == 3
+    # backoff exponencial: 1x, 2x, 4x o intervalo base
+    assert [e for e in esperas if e >= 0.01][:3] == pytest.approx([0.01, 0.02, 0.04])
+    assert t.last_segments[-1].fim == pytest.approx(DURACAO_SEGUNDOS, abs=0.5)
+
+
+def test_desiste_depois_das_tentativas(fake_api, wav, monkeypatch):
+    fake_api(fail_first=100)
+    monkeypatch.setattr(Transcription, "BACKOFF_SEGUNDOS", 0.01)
+
+    with pytest.raises(openai.error.OpenAIError):
+        transcrever(wav, max_workers=2, max_tentativas=2)
+
+
+def test_progresso_na_thread_de_quem_chamou(fake_api, wav):
+    fake_api()
+    chamadas = []
+
+    def on_progress(concluidos, total, indice, texto):
+        chamadas.append((concluidos, total, indice, texto, threading.get_ident()))
+
+    t = transcrever(wav, max_workers=4, on_progress=on_progress)
+
+    quantidade = len({s.chunk for s in t.last_segments})
+    assert [c[0] for c in chamadas] == list(range(1, quantidade + 1))
+    assert all(total >= concluidos for concluidos, total, *_ in chamadas)
+    assert sorted(c[2] for c in chamadas) == list(range(quantidade))
+    assert all(texto for *_, texto, _ in chamadas)
+    assert {c[4] for c in chamadas} == {threading.get_ident()}
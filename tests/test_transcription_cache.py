@@ -0,0 +1,70 @@
+'''
+Only complete, non-empty transcriptions are written to the persistent cache: an
+empty result or a decode that failed midway must not be served for that content
+again. The backend is replaced, so no ffmpeg, model or network is needed.
+'''
+import pytest
+
+from genai.segments import Segmento
+from genai.transcription import Transcription
+from genai.transcription_cache import TranscriptionCache
+
+
+@pytest.fixture
+def audio(tmp_path):
+    caminho = tmp_path / "audio.wav"
+    caminho.write_bytes(b"RIFF" + bytes(1000))
+    return str(caminho)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TranscriptionCache(str(tmp_path / "transcricoes.sqlite"))
+
+
+def backend(monkeypatch, resultado):
+    '''
+    Substitui o reconhecimento do modo vosk; resultado é uma lista de segmentos ou uma exceção
+    '''
+    chamadas = []
+
+    def transcrever(self):
+        chamadas.append(1)
+        self._Transcription__segundos_audio = 10.0
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+    monkeypatch.setattr(Transcription, "_Transcription__obter_transcricao_audio_vosk", transcrever)
+    return chamadas
+
+
+def test_transcricao_valida_vai_para_o_cache(monkeypatch, audio, cache):
+    chamadas = backend(monkeypatch, [Segmento(0.0, 2.5, "bom dia")])
+
+    assert Transcription(audio, modo="vosk", cache=cache).obter_transcricao_audio() == "bom dia"
+    segunda = Transcription(audio, modo="vosk", cache=cache)
+    assert segunda.obter_transcricao_audio() == "bom dia"
+    assert segunda.last_transcription_cached
+    assert len(chamadas) == 1
+
+
+@pytest.mark.parametrize("resultado", [[], [Segmento(0.0, 10.0, "  ")]])
+def test_transcricao_vazia_nao_vai_para_o_cache(monkeypatch, audio, cache, resultado):
+    chamadas = backend(monkeypatch, resultado)
+
+    Transcription(audio, modo="vosk", cache=cache).obter_segmentos()
+    segunda = Transcription(audio, modo="vosk", cache=cache)
+    segunda.obter_segmentos()
+    assert not segunda.last_transcription_cached
+    assert len(chamadas) == 2
+
+
+def test_falha_na_decodificacao_nao_vai_para_o_cache(monkeypatch, audio, cache):
+    backend(monkeypatch, Exception("ffmpeg falhou para 'audio.wav' (código 1): Invalid data"))
+    with pytest.raises(Exception, match="ffmpeg falhou"):
+        Transcription(audio, modo="vosk", cache=cache).obter_segmentos()
+
+    chamadas = backend(monkeypatch, [Segmento(0.0, 2.5, "bom dia")])
+    assert Transcription(audio, modo="vosk", cache=cache).obter_transcricao_audio() == "bom dia"
+    assert len(chamadas) == 1
@@ -0,0 +1,91 @@
+'''
+Incremental indexing of a document with the offline HashingFakeEmbeddings: the
+added/removed/unchanged counts of each new version, reuse of an unchanged index and
+a re-upload that crosses the numpy/Chroma size threshold staying on its backend.
+'''
+import pytest
+
+pytest.importorskip("langchain")
+
+import genai.vector_index_store as vector_index_store
+from genai.embedding_cache import HashingFakeEmbeddings
+from genai.vector_index_store import VectorIndexStore
+from langchain.schema import Document
+from langchain.text_splitter import BaseDocumentTransformer
+
+
+class LinhasSplitter(BaseDocumentTransformer):
+    '''
+    Um chunk por linha, para os chunks de cada versão serem previsíveis
+    '''
+    def transform_documents(self, documents, **kwargs):
+        return [Document(page_content=linha, metadata=dict(doc.metadata))
+                for doc in documents for linha in doc.page_content.splitlines()]
+
+    async def atransform_documents(self, documents, **kwargs):
+        return self.transform_documents(documents)
+
+
+class ContadorEmbeddings(HashingFakeEmbeddings):
+    def __init__(self):
+        super().__init__(dimensao=8)
+        self.textos = []
+
+    def embed_documents(self, texts):
+        self.textos.extend(texts)
+        return super().embed_documents(texts)
+
+
+def documento(*linhas):
+    return [Document(page_content="\n".join(linhas), metadata={"source": "pedidos.txt"})]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return VectorIndexStore(str(tmp_path))
+
+
+def indexar(store, embedding, *linhas):
+    _, resumo, _ = store.obter_ou_criar(documento(*linhas), LinhasSplitter(), embedding,
+                                        documento_id="pedidos.txt", palavras=False)
+    return resumo
+
+
+def contagens(resumo):
+    return resumo.adicionados, resumo.removidos, resumo.inalterados
+
+
+def test_contagens_incrementais(store):
+    embedding = ContadorEmbeddings()
+
+    assert contagens(indexar(store, embedding, "a", "b", "c")) == (3, 0, 0)
+
+    resumo = indexar(store, embedding, "a", "b", "c")
+    assert resumo.reutilizado
+    assert contagens(resumo) == (0, 0, 3)
+
+    # "b" removido, "d" e "e" novos: só eles são embedados
+    embedding.textos.clear()
+    assert contagens(indexar(store, embedding, "a", "c", "d", "e")) == (2, 1, 2)
+    assert sorted(embedding.textos) == ["d", "e"]
+
+
+def test_chunks_repetidos_sao_contados_por_ocorrencia(store):
+    embedding = ContadorEmbeddings()
+    assert contagens(indexar(store, embedding, "a", "a", "b")) == (3, 0, 0)
+    assert contagens(indexar(store, embedding, "a", "b")) == (0, 1, 2)
+
+
+def test_nova_versao_acima_do_limite_continua_no_mesmo_backend(store, monkeypatch):
+    embedding = ContadorEmbeddings()
+    resumo = indexar(store, embedding, "a", "b", "c")
+    assert resumo.backend == "numpy"
+
+    # a nova versão passaria do limite do NumPy: o índice existente é atualizado
+    monkeypatch.setattr(vector_index_store, "LIMITE_CARACTERES_NUMPY", 5)
+    embedding.textos.clear()
+    resumo = indexar(store, embedding, "a", "b", "c", "d")
+    assert resumo.backend == "numpy"
+    assert contagens(resumo) == (1, 0, 3)
+    assert embedding.textos == ["d"]
+    assert [indice["backend"] for indice in store.listar()] == ["numpy"]